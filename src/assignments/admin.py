@@ -1,7 +1,9 @@
 from django.contrib import admin
+from django.core.cache import cache
 from django.utils.safestring import mark_safe
 
-from .models import Assignment, Chapter
+from .locks import SYNC_LOCK_KEY, SYNC_PENDING_KEY, lock_holder
+from .models import Assignment, Chapter, SyncState
 
 
 @admin.register(Assignment)
@@ -15,7 +17,7 @@ class AssignmentAdmin(admin.ModelAdmin):
 
     # Make all fields read-only
     readonly_fields = ("chapter", "slug", "title", "description_pretty", "test_runner_pretty", "solution_pretty", 
-    "points", "difficulty", "publish_at", "publish_until","is_exam","publish_result_at","order", "status","last_synced")
+    "points", "difficulty", "publish_at", "publish_until","is_exam","defer_grading","publish_result_at","order", "status","last_synced")
     list_filter = ("title", "chapter")
 
     def description_pretty(self, obj):
@@ -64,4 +66,28 @@ class ChapterAdmin(admin.ModelAdmin):
         return False
 
     def has_delete_permission(self, request, obj=None):
-        return False
\ No newline at end of file
+        return False
+
+
+@admin.register(SyncState)
+class SyncStateAdmin(admin.ModelAdmin):
+    list_display = ("branch", "commit_sha", "synced_at", "last_run_at", "last_duration", "last_result", "lock_state")
+
+    readonly_fields = ("branch", "commit_sha", "toc_file", "synced_at", "book_hash", "last_run_at", "last_duration",
+    "last_result", "last_error", "lock_state")
+
+    def lock_state(self, obj):
+        holder = lock_holder(SYNC_LOCK_KEY.format(branch=obj.branch))
+        if not holder:
+            return "idle"
+        state = f"running on {holder['owner']} since {holder['since']:%Y-%m-%d %H:%M:%S}"
+        if cache.get(SYNC_PENDING_KEY.format(branch=obj.branch)):
+            state += ", follow-up queued"
+        return state
+    lock_state.short_description = "Lock"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class AssignmentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'assignments'
+
+    def ready(self):
+        from django.core import checks
+
+        import assignments.signals
+        from assignments.locks import check_shared_cache
+
+        checks.register(check_shared_cache)
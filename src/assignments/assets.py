@@ -0,0 +1,112 @@
+"""
+Content-addressed store for the files an assignment is graded with.
+
+At sync time `publish_assets` stores the test runner and the data files of an
+assignment folder as blobs named by their sha256 in the "course_assets"
+storage (see STORAGES), plus a manifest {file name: sha256}. The sha256 of the
+manifest is the assignment's `asset_version`: it changes with any of the
+files, and a version never changes its content.
+
+Graders call `fetch_assets(version, workdir)`, which reads blobs through a
+local LRU cache (ASSET_CACHE_DIR, at most ASSET_CACHE_MAX_BYTES). Workers
+therefore need no checkout of the course repository, and a grade or regrade
+uses exactly the files of the version it was given, even while a sync runs.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+
+# Data files of an assignment folder that are copied next to the submission
+DATA_SUFFIXES = (".csv", ".txt")
+TEST_RUNNER = "test_runner.py"
+
+ASSET_CACHE_DIR = Path(os.environ.get("ASSET_CACHE_DIR", Path(tempfile.gettempdir()) / "course-asset-cache"))
+ASSET_CACHE_MAX_BYTES = int(os.environ.get("ASSET_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+
+def _store():
+    return storages["course_assets"]
+
+
+def _blob_name(digest):
+    return f"{digest[:2]}/{digest}"
+
+
+def put_blob(data: bytes) -> str:
+    digest = hashlib.sha256(data).hexdigest()
+    store = _store()
+    if not store.exists(_blob_name(digest)):
+        store.save(_blob_name(digest), ContentFile(data))
+    return digest
+
+
+def data_files(folder):
+    """The data files of an assignment folder, by name."""
+    folder = Path(folder)
+    if not folder.is_dir():
+        return {}
+    return {
+        file.name: file
+        for file in sorted(folder.iterdir())
+        if file.is_file() and file.suffix in DATA_SUFFIXES
+    }
+
+
+def publish_assets(folder, test_runner: str) -> str:
+    """Store the test runner and data files of `folder`; returns the asset version."""
+    manifest = {TEST_RUNNER: put_blob(test_runner.encode("utf-8"))}
+    for name, file in data_files(folder).items():
+        manifest[name] = put_blob(file.read_bytes())
+    return put_blob(json.dumps(manifest, sort_keys=True).encode("utf-8"))
+
+
+def _evict():
+    """Drop the least recently used blobs until the cache fits ASSET_CACHE_MAX_BYTES."""
+    entries = [(entry.stat(), entry) for entry in ASSET_CACHE_DIR.iterdir() if entry.is_file()]
+    total = sum(stat.st_size for stat, _ in entries)
+    for stat, entry in sorted(entries, key=lambda item: item[0].st_mtime):
+        if total <= ASSET_CACHE_MAX_BYTES:
+            break
+        entry.unlink(missing_ok=True)
+        total -= stat.st_size
+
+
+def get_blob(digest: str) -> bytes:
+    """A blob by its sha256, from the local cache or the store."""
+    cached = ASSET_CACHE_DIR / digest
+    try:
+        data = cached.read_bytes()
+        os.utime(cached)                                    # recently used
+        return data
+    except FileNotFoundError:
+        pass
+
+    with _store().open(_blob_name(digest), "rb") as f:
+        data = f.read()
+    if hashlib.sha256(data).hexdigest() != digest:
+        raise ValueError(f"Corrupt asset {digest}")
+
+    ASSET_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=ASSET_CACHE_DIR, prefix=".")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, cached)
+    _evict()
+    return data
+
+
+def fetch_assets(version: str, dest, exclude=()):
+    """Write the files of asset `version` into `dest`. Returns their names."""
+    manifest = json.loads(get_blob(version))
+    names = []
+    for name, digest in manifest.items():
+        if name in exclude:
+            continue
+        (Path(dest) / name).write_bytes(get_blob(digest))
+        names.append(name)
+    return names
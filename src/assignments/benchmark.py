@@ -0,0 +1,272 @@
+"""
+Synthetic course repositories and a benchmark of the sync pipeline.
+
+`generate_course` writes a git repository shaped like the real course (TOC,
+description/test runner/solution per assignment, data files, optionally a
+book/ whose Makefile just copies its pages), of any size.
+
+`run_benchmark` points the sync (tasks.py) at such a repository, a scratch
+clone, asset store and book build root, and times the phases we care about:
+
+- clone:              first clone of the repository,
+- initial sync:       first sync into an empty database,
+- no-op sync:         HEAD did not move,
+- small-change sync:  one assignment description changed,
+- full rebuild:       sync_assignments_repo(full=True).
+
+The sync archives every chapter that is not in the generated TOC and
+recomputes chapter progress, all in one long transaction, so the benchmark
+refuses to run on a database that has chapters: point it at an empty one
+(e.g. a scratch DATABASE settings). Its transaction is rolled back at the
+end. Book builds run inline (task_always_eager).
+Each run is appended as one JSON line to the results file, so runs of
+different releases on the same course size can be compared.
+"""
+import contextlib
+import io
+import json
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import yaml
+from celery import current_app
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from git import Repo
+
+from . import assets, tasks
+from .models import Assignment, Chapter
+
+BRANCH = "benchmark"
+TOC_FILE_NAME = "toc.yml"
+
+WORDS = (
+    "list loop value function return string index slice dictionary key "
+    "variable print range tuple set file line number sum average"
+).split()
+
+TEST_RUNNER = '''import unittest
+
+from solution import {name}
+
+
+class Test{cls}(unittest.TestCase):
+{tests}
+
+if __name__ == "__main__":
+    unittest.main()
+'''
+
+TEST = '''    def test_case_{i}(self):
+        self.assertEqual({name}({i}), {expected})
+'''
+
+DIFFICULTIES = [value for value, _ in Assignment._meta.get_field("difficulty").choices]
+
+BOOK_MAKEFILE = """{target}:
+\tmkdir -p _build/html
+\tfor page in */*.html; do mkdir -p _build/html/$$(dirname $$page) && cp $$page _build/html/$$page; done
+"""
+
+
+def _text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def _write(root, name, content):
+    path = Path(root) / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content, encoding="utf-8")
+
+
+def _commit(repo, message):
+    repo.git.add("--all")
+    repo.git.commit("--quiet", "--allow-empty", "-m", message)
+    return repo.head.commit.hexsha
+
+
+def generate_course(dest, chapters=20, assignments=10, data_files=1, data_rows=200,
+                    tests=5, book=False, seed=0) -> Repo:
+    """Write and commit a course of `chapters` x `assignments` into a new repository at `dest`."""
+    rng = random.Random(seed)
+    Path(dest).mkdir(parents=True)
+    repo = Repo.init(dest, initial_branch=BRANCH)
+    with repo.config_writer() as config:
+        config.set_value("user", "name", "Course Generator")
+        config.set_value("user", "email", "generator@example.com")
+
+    toc = {"chapters": []}
+    for c in range(chapters):
+        chapter = f"chapter-{c:03d}"
+        entry = {"slug": chapter, "title": f"Chapter {c}", "order": c, "assignments": []}
+        if book:
+            entry["book"] = f"{chapter}/index"
+            _write(dest, f"book/{chapter}/index.html",
+                   f"<html><body><h1>Chapter {c}</h1><p>{_text(rng, 400)}</p></body></html>")
+        for a in range(assignments):
+            slug = f"assignment-{a:03d}"
+            name = f"solve_{c}_{a}"
+            entry["assignments"].append({
+                "slug": slug,
+                "title": f"Assignment {c}.{a}",
+                "order": a,
+                "points": rng.choice((5, 10, 20)),
+                "difficulty": rng.choice(DIFFICULTIES),
+                "publish_at": "2024-01-01T00:00:00",
+            })
+            folder = f"{chapter}/{slug}"
+            _write(dest, f"{folder}/description.html", f"<p>{_text(rng, 150)}</p>")
+            _write(dest, f"{folder}/solution.py", f"def {name}(n):\n    return n * {a + 1}\n")
+            _write(dest, f"{folder}/test_runner.py", TEST_RUNNER.format(
+                name=name,
+                cls=name.title().replace("_", ""),
+                tests="\n".join(TEST.format(i=i, name=name, expected=i * (a + 1)) for i in range(tests)),
+            ))
+            for d in range(data_files):
+                rows = "\n".join(f"{i},{rng.randint(0, 1000)},{rng.choice(WORDS)}" for i in range(data_rows))
+                _write(dest, f"{folder}/data_{d}.csv", f"id,value,label\n{rows}\n")
+        toc["chapters"].append(entry)
+
+    _write(dest, TOC_FILE_NAME, yaml.safe_dump(toc, sort_keys=False))
+    if book:
+        _write(dest, "book/Makefile", BOOK_MAKEFILE.format(target=tasks.toc_target))
+    _commit(repo, "Generated course")
+    return repo
+
+
+def change_one_assignment(repo, n):
+    """Commit a new description for the first assignment."""
+    root = Path(repo.working_tree_dir)
+    folder = sorted(p for p in root.glob("*/*") if (p / "description.html").is_file())[0]
+    (folder / "description.html").write_text(f"<p>Revision {n}</p>", encoding="utf-8")
+    return _commit(repo, f"Revise {folder.parent.name}/{folder.name}")
+
+
+@contextlib.contextmanager
+def _attributes(obj, **values):
+    saved = {name: getattr(obj, name) for name in values}
+    for name, value in values.items():
+        setattr(obj, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(obj, name, value)
+
+
+@contextlib.contextmanager
+def _isolated_sync(origin, scratch):
+    """Sync from `origin` into scratch paths, with book builds inline."""
+    local_path = scratch / "clone"
+    storages = {**settings.STORAGES, "course_assets": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+        "OPTIONS": {"location": scratch / "assets"},
+    }}
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(override_settings(STORAGES=storages, BOOK_BUILD_ROOT=scratch / "book_build"))
+        stack.enter_context(_attributes(
+            tasks,
+            REPO_URL=str(origin),
+            BRANCH=BRANCH,
+            TOC_FILE_NAME=TOC_FILE_NAME,
+            LOCAL_PATH=local_path,
+        ))
+        stack.enter_context(_attributes(assets, ASSET_CACHE_DIR=scratch / "asset-cache"))
+        stack.enter_context(_attributes(current_app.conf, task_always_eager=True))
+        yield
+
+
+def _measure(fn, repeat=1, before=None, verbose=False):
+    """{"seconds": min, "median": ..., "queries": of the last run} of `repeat` runs of `fn`."""
+    seconds = []
+    for n in range(repeat):
+        if before:
+            before(n)
+        output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+        with output, CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            fn()
+            seconds.append(time.perf_counter() - started)
+    return {
+        "seconds": round(min(seconds), 4),
+        "median": round(statistics.median(seconds), 4),
+        "queries": len(queries),
+    }
+
+
+def _release():
+    try:
+        repo = Repo(settings.BASE_DIR, search_parent_directories=True)
+        return repo.git.describe("--always", "--dirty", "--tags")
+    except Exception:
+        return "unknown"
+
+
+def run_benchmark(size, repeat=3, origin=None, verbose=False):
+    """
+    Time the sync phases on a generated course of `size` (generate_course
+    arguments), or on an existing repository `origin` (branch BRANCH).
+    Returns the result record. The database must not have any chapters.
+    """
+    if Chapter.objects.exists():
+        raise ImproperlyConfigured(
+            "The sync benchmark would archive the chapters of this database; run it on an empty one."
+        )
+
+    with tempfile.TemporaryDirectory(prefix="sync-benchmark-") as tmp:
+        scratch = Path(tmp)
+        started = time.perf_counter()
+        repo = Repo(origin) if origin else generate_course(scratch / "origin", **size)
+        generated = round(time.perf_counter() - started, 4)
+
+        with _isolated_sync(repo.working_tree_dir, scratch), transaction.atomic():
+            phases = {
+                "clone": _measure(tasks.clone_or_pull_repo, verbose=verbose),
+                "initial sync": _measure(tasks.sync_assignments_repo, verbose=verbose),
+                "no-op sync": _measure(tasks.sync_assignments_repo, repeat, verbose=verbose),
+                "small-change sync": _measure(
+                    tasks.sync_assignments_repo, repeat,
+                    before=lambda n: change_one_assignment(repo, n), verbose=verbose,
+                ),
+                "full rebuild": _measure(lambda: tasks.sync_assignments_repo(full=True), repeat, verbose=verbose),
+            }
+            # Leave the database as it was
+            transaction.set_rollback(True)
+
+    return {
+        "release": _release(),
+        "date": timezone.now().isoformat(timespec="seconds"),
+        "database": connection.vendor,
+        "size": {**size, "origin": str(origin)} if origin else size,
+        "repeat": repeat,
+        "generated": generated,
+        "phases": phases,
+    }
+
+
+def save_result(result, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a", encoding="utf-8") as f:
+        f.write(json.dumps(result) + "\n")
+
+
+def previous_result(result, path):
+    """The last stored run on the same course size and database, or None."""
+    path = Path(path)
+    if not path.is_file():
+        return None
+    previous = None
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if not line.strip():
+            continue
+        stored = json.loads(line)
+        if stored["size"] == result["size"] and stored["database"] == result["database"]:
+            previous = stored
+    return previous
@@ -0,0 +1,166 @@
+"""
+Text extraction from the built JupyterBook (the served release, see book_build.py).
+
+`sync_book_pages` is called by `tasks.build_book` after publishing a build. Pages are
+compared by the sha1 of their HTML, so only new or changed pages are parsed
+again; pages that disappeared from the build are removed. Each page is split
+into its <section> elements (what the book's table of contents links to),
+which become the BookSection rows searched by assignments.site_index.
+"""
+import hashlib
+import re
+from html.parser import HTMLParser
+from pathlib import Path
+
+from django.db import transaction
+
+from .models import BookPage, BookSection
+
+# Build output that is not theory content
+SKIP_DIRS = {"_static", "_sources", "_images", "_sphinx_design_static", "_panels_static"}
+SKIP_PAGES = {"genindex.html", "search.html", "py-modindex.html"}
+
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+SKIP_TAGS = {"script", "style", "nav", "footer", "button", "noscript", "template", "title"}
+HEADINGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+
+
+class _SectionParser(HTMLParser):
+    """Collects [anchor, title, text parts] per <section>, inside `root` only."""
+
+    def __init__(self, root):
+        super().__init__(convert_charrefs=True)
+        self.root = root
+        self.depth_in_root = 0
+        self.stack = []          # (tag, opened section or None, skipped)
+        self.sections = [["", "", []]]
+        self.current = [0]       # indexes into self.sections
+        self.skip = 0
+        self.heading = None      # text parts of the heading being read
+        self.page_title = []
+        self.in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title":
+            self.in_title = True
+        if tag in VOID_TAGS:
+            return
+        attrs = dict(attrs)
+        classes = (attrs.get("class") or "").split()
+
+        if tag == self.root:
+            self.depth_in_root += 1
+
+        skipped = tag in SKIP_TAGS or "headerlink" in classes or "toctree-wrapper" in classes
+        section = None
+        if self.depth_in_root and not self.skip and attrs.get("id") and (
+            tag == "section" or (tag == "div" and "section" in classes)
+        ):
+            self.sections.append([attrs["id"], "", []])
+            section = len(self.sections) - 1
+            self.current.append(section)
+
+        if skipped:
+            self.skip += 1
+        if tag in HEADINGS and self.depth_in_root and not self.skip:
+            self.heading = []
+        self.stack.append((tag, section, skipped))
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self.in_title = False
+        if not any(open_tag == tag for open_tag, _, _ in self.stack):
+            return
+        while self.stack:
+            open_tag, section, skipped = self.stack.pop()
+            if skipped:
+                self.skip -= 1
+            if section is not None:
+                self.current.pop()
+            if open_tag in HEADINGS and self.heading is not None:
+                current = self.sections[self.current[-1]]
+                if not current[1]:
+                    current[1] = " ".join(self.heading)
+                self.heading = None
+            if open_tag == self.root:
+                self.depth_in_root -= 1
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.page_title.append(data)
+        if not self.depth_in_root or self.skip:
+            return
+        data = data.strip()
+        if not data:
+            return
+        if self.heading is not None:
+            self.heading.append(data)
+        else:
+            self.sections[self.current[-1]][2].append(data)
+
+
+def _clean(parts):
+    return re.sub(r"\s+", " ", " ".join(parts)).strip()
+
+
+def extract_sections(html: str):
+    """
+    (page title, [(anchor, title, text)]) for one built book page, in document
+    order. Text before the first section is returned with the anchor "".
+    """
+    root = "article" if "<article" in html else "main" if "<main" in html else "body"
+    parser = _SectionParser(root)
+    parser.feed(html)
+    parser.close()
+
+    sections = [
+        (anchor, _clean([title]), _clean(parts))
+        for anchor, title, parts in parser.sections
+        if title or parts
+    ]
+    page_title = next((title for _, title, _ in sections if title), "")
+    if not page_title:
+        page_title = _clean(parser.page_title).split(" — ")[0]
+    return page_title, sections
+
+
+def _book_files(html_root):
+    for file in sorted(html_root.rglob("*.html")):
+        rel = file.relative_to(html_root)
+        if rel.parts[0] in SKIP_DIRS or rel.name in SKIP_PAGES:
+            continue
+        yield rel.as_posix(), file
+
+
+def sync_book_pages(html_root):
+    """Bring BookPage/BookSection up to date with the build. Returns (changed, removed)."""
+    html_root = Path(html_root)
+    known = dict(BookPage.objects.values_list("path", "content_hash"))
+    seen = set()
+    changed = 0
+
+    for path, file in _book_files(html_root):
+        seen.add(path)
+        data = file.read_bytes()
+        content_hash = hashlib.sha1(data).hexdigest()
+        if known.get(path) == content_hash:
+            continue
+
+        title, sections = extract_sections(data.decode("utf-8", errors="replace"))
+        with transaction.atomic():
+            page, _ = BookPage.objects.update_or_create(
+                path=path, defaults={"title": title[:300], "content_hash": content_hash}
+            )
+            page.sections.all().delete()
+            BookSection.objects.bulk_create(
+                BookSection(page=page, anchor=anchor[:300], title=section_title[:300], text=text, order=i)
+                for i, (anchor, section_title, text) in enumerate(sections)
+            )
+        changed += 1
+
+    removed = known.keys() - seen
+    if removed:
+        BookPage.objects.filter(path__in=removed).delete()
+    return changed, len(removed)
@@ -0,0 +1,176 @@
+"""
+Isolated, incremental builds of the JupyterBook.
+
+The sync compares the git tree hash of book/ at HEAD with the one of the
+served build (SyncState.book_hash) and only queues `tasks.build_book` when
+they differ. The build task, on the "book" queue:
+
+1. exports book/ of the commit into BOOK_BUILD_ROOT/workspace, replacing the
+   sources but keeping book/_build, so jupyter-book's execution cache and
+   doctrees survive between builds,
+2. runs `make <TOC_BOOK_BUILD>` there at the lowest CPU priority,
+3. copies the html output to BOOK_BUILD_ROOT/releases/<tree hash>, adds
+   ?v=<content hash> to the local asset URLs of its pages (so book_serve.py
+   can mark them immutable) and writes .gz/.br variants of text files,
+4. points the BOOK_BUILD_ROOT/current symlink at the release with a rename,
+   so requests never see a half-written build. Only the previous release is
+   kept besides it.
+
+The sync may reset the checkout meanwhile: the build only reads the commit
+it was queued for, from the git object store.
+
+The web process imports this module for `html_root`, so git and the
+compressor are imported where they are used.
+"""
+import hashlib
+import io
+import os
+import re
+import shutil
+import subprocess
+import tarfile
+from pathlib import Path
+
+from django.conf import settings
+
+BOOK_DIR = "book"
+BUILD_NICENESS = int(os.environ.get("BOOK_BUILD_NICENESS", "19"))
+KEEP_RELEASES = 2
+
+# Relative links of pages to assets that get a ?v=<hash> (URLs with a query,
+# e.g. Sphinx's own ?v=, are left alone)
+ASSET_LINK_RE = re.compile(
+    r'(\b(?:src|href)=")([^"?#:]+\.(?:css|js|png|jpe?g|gif|svg|webp|woff2?|ttf|eot|ico))"'
+)
+
+
+def html_root() -> Path:
+    """The served build: a symlink to the current release."""
+    return Path(settings.BOOK_BUILD_ROOT) / "current"
+
+
+def _workspace() -> Path:
+    return Path(settings.BOOK_BUILD_ROOT) / "workspace" / BOOK_DIR
+
+
+def _releases() -> Path:
+    return Path(settings.BOOK_BUILD_ROOT) / "releases"
+
+
+def book_tree_hash(repo, sha):
+    """Git tree hash of book/ at `sha` (changes with any file under it), or None."""
+    from git import GitCommandError
+
+    try:
+        return repo.git.rev_parse(f"{sha}:{BOOK_DIR}")
+    except GitCommandError:
+        return None
+
+
+def export_sources(repo, sha) -> Path:
+    """Replace the workspace sources with book/ of `sha`, keeping book/_build."""
+    workspace = _workspace()
+    workspace.mkdir(parents=True, exist_ok=True)
+    for entry in workspace.iterdir():
+        if entry.name == "_build":
+            continue
+        if entry.is_dir() and not entry.is_symlink():
+            shutil.rmtree(entry)
+        else:
+            entry.unlink()
+
+    archive = repo.git.archive("--format=tar", sha, BOOK_DIR, stdout_as_string=False)
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(workspace.parent, filter="data")
+    return workspace
+
+
+def _lower_priority():
+    os.nice(BUILD_NICENESS)
+
+
+def run_build(workspace, target):
+    return subprocess.run(
+        ["make", target],
+        cwd=workspace,
+        capture_output=True,
+        text=True,
+        preexec_fn=_lower_priority,
+    )
+
+
+def publish(workspace, book_hash) -> Path:
+    """Make the html output of `workspace` the served build. Returns html_root()."""
+    releases = _releases()
+    releases.mkdir(parents=True, exist_ok=True)
+    release = releases / book_hash
+    current = html_root()
+
+    if not release.is_dir():
+        staging = releases / f".{book_hash}.tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        shutil.copytree(workspace / "_build" / "html", staging)
+        fingerprint_assets(staging)
+        precompress(staging)
+        staging.rename(release)
+    os.utime(release)                    # newest release, for _prune
+
+    # A relative link, so the volume can be mounted anywhere
+    link = current.with_name(f".current.{os.getpid()}")
+    if link.is_symlink() or link.exists():
+        link.unlink()
+    link.symlink_to(os.path.relpath(release, current.parent), target_is_directory=True)
+    os.replace(link, current)
+
+    _prune(releases, keep={release.name})
+    return current
+
+
+def _prune(releases, keep):
+    """Drop old releases, keeping `keep` and the most recent others up to KEEP_RELEASES."""
+    others = sorted(
+        (entry for entry in releases.iterdir() if entry.is_dir() and entry.name not in keep),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True,
+    )
+    for entry in others[KEEP_RELEASES - len(keep):]:
+        shutil.rmtree(entry, ignore_errors=True)
+
+
+def content_hash(file):
+    """The ?v= version of an asset: a sha256 prefix of its bytes."""
+    return hashlib.sha256(Path(file).read_bytes()).hexdigest()[:12]
+
+
+def fingerprint_assets(root):
+    """Append ?v=<sha256 prefix> to the relative asset links of every page under `root`."""
+    root = Path(root).resolve()
+    digests = {}
+
+    def digest(file):
+        if file not in digests:
+            digests[file] = content_hash(file)
+        return digests[file]
+
+    for page in root.rglob("*.html"):
+        def versioned(match, page=page):
+            url = match.group(2)
+            target = (page.parent / url).resolve()
+            if url.startswith("/") or not target.is_file() or not target.is_relative_to(root):
+                return match.group(0)
+            return f'{match.group(1)}{url}?v={digest(target)}"'
+
+        html = page.read_text(encoding="utf-8", errors="surrogateescape")
+        versioned_html = ASSET_LINK_RE.sub(versioned, html)
+        if versioned_html != html:
+            page.write_text(versioned_html, encoding="utf-8", errors="surrogateescape")
+
+
+def precompress(root):
+    """Write .gz (and, with brotli installed, .br) variants next to compressible files."""
+    from whitenoise.compress import Compressor
+
+    compressor = Compressor(quiet=True)
+    for file in Path(root).rglob("*"):
+        if file.is_file() and compressor.should_compress(file.name):
+            compressor.compress(str(file))
@@ -0,0 +1,159 @@
+"""
+Serving the built JupyterBook (see book_build.py).
+
+`serve_book` replaces django.views.static.serve for /book/:
+
+- the .br/.gz variant written at build time is sent when the client accepts
+  it (Vary: Accept-Encoding),
+- asset URLs carrying ?v=<content hash> are cached for a year as immutable
+  if the hash is the file's own (a stale or made-up ?v= gets the default);
+  pages are revalidated on every visit (Cache-Control: no-cache) so a new
+  build shows up at once, other files are cached for an hour,
+- every response has an ETag and Last-Modified, so revalidation is a 304,
+- a single byte range (videos, large notebooks) is answered with 206,
+- with BOOK_SENDFILE set, the body is left to nginx (X-Accel-Redirect) or
+  Apache (X-Sendfile); Django only decides headers.
+"""
+import mimetypes
+import re
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+
+from .book_build import content_hash, html_root
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+DEFAULT_MAX_AGE = "public, max-age=3600"
+
+# Preferred first
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _resolve(path) -> Path:
+    root = html_root().resolve()
+    try:
+        file = Path(safe_join(root, path))
+    except SuspiciousFileOperation:
+        raise Http404("Outside of the book")
+    if file.is_dir():
+        file = file / "index.html"
+    if not file.is_file():
+        raise Http404(f'"{path}" does not exist')
+    return file
+
+
+def _accepted(request):
+    accept = request.headers.get("Accept-Encoding", "")
+    codings = {part.split(";")[0].strip() for part in accept.split(",")}
+    return [(coding, suffix) for coding, suffix in ENCODINGS if coding in codings]
+
+
+def _variant(request, file):
+    """(file, stat, content encoding) to send for `file`."""
+    if not request.headers.get("Range"):
+        for coding, suffix in _accepted(request):
+            variant = file.with_name(file.name + suffix)
+            try:
+                return variant, variant.stat(), coding
+            except FileNotFoundError:
+                continue
+    return file, file.stat(), None
+
+
+@lru_cache(maxsize=1024)
+def _content_hash(file, mtime_ns, size):
+    # Keyed on the stat as well: a new build may reuse the path
+    return content_hash(file)
+
+
+def _cache_control(request, content_type, file):
+    """Cache-Control for the identity (uncompressed) `file`."""
+    if content_type == "text/html":
+        return REVALIDATE
+    version = request.GET.get("v")
+    if version:
+        stat = file.stat()
+        if version == _content_hash(file, stat.st_mtime_ns, stat.st_size):
+            return IMMUTABLE
+    return DEFAULT_MAX_AGE
+
+
+def _byte_range(header, size):
+    """(start, end) inclusive of a single-range header, None to send it all, or False if unsatisfiable."""
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None                                   # multiple or malformed ranges: ignore
+    first, last = match.groups()
+    if first:
+        start, end = int(first), int(last) if last else size - 1
+    else:
+        start, end = max(size - int(last), 0), size - 1
+    if start >= size or start > end:
+        return False
+    return start, min(end, size - 1)
+
+
+def _sendfile(response, file):
+    if settings.BOOK_SENDFILE == "nginx":
+        relative = file.relative_to(Path(settings.BOOK_BUILD_ROOT).resolve())
+        response["X-Accel-Redirect"] = settings.BOOK_ACCEL_PREFIX.rstrip("/") + "/" + relative.as_posix()
+    elif settings.BOOK_SENDFILE == "apache":
+        response["X-Sendfile"] = str(file)
+
+
+def serve_book(request, path):
+    file = _resolve(path)
+    content_type = mimetypes.guess_type(file.name)[0] or "application/octet-stream"
+    sent, stat, coding = _variant(request, file)
+
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}' + (f'-{coding}"' if coding else '"')
+    last_modified = int(stat.st_mtime)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        not_modified["Cache-Control"] = _cache_control(request, content_type, file)
+        patch_vary_headers(not_modified, ("Accept-Encoding",))
+        return not_modified
+
+    byte_range = None
+    if request.headers.get("Range"):
+        if_range = request.headers.get("If-Range")
+        if not if_range or if_range == etag or parse_http_date_safe(if_range) == last_modified:
+            byte_range = _byte_range(request.headers["Range"], stat.st_size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{stat.st_size}"
+        return response
+
+    if settings.BOOK_SENDFILE:
+        # The front server sends the body (and handles Range itself)
+        response = HttpResponse(content_type=content_type)
+        _sendfile(response, sent.resolve())
+    elif byte_range:
+        start, end = byte_range
+        with open(sent, "rb") as f:
+            f.seek(start)
+            response = HttpResponse(f.read(end - start + 1), content_type=content_type, status=206)
+        response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+    else:
+        response = FileResponse(open(sent, "rb"), content_type=content_type)
+        response["Content-Length"] = stat.st_size
+        if "Content-Disposition" in response:
+            del response["Content-Disposition"]
+
+    if coding:
+        response["Content-Encoding"] = coding
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Accept-Ranges"] = "bytes"
+    response["Cache-Control"] = _cache_control(request, content_type, file)
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
@@ -0,0 +1,119 @@
+"""
+Cached catalog of published chapters and assignments.
+
+What is published only changes at known instants: the next `publish_at`,
+`publish_until` or `publish_result_at` of an active assignment, or when the
+sync writes new content. The catalog is therefore built once, kept in the
+shared cache until the next such boundary and dropped explicitly by
+`sync_assignments_repo` (and by model saves, see signals.py).
+
+Cached assignments are narrow rows (Assignment.objects.listing()) with their
+chapter joined; the detail page still loads its own description from the DB.
+
+Each process also keeps the catalog it last read in memory, keyed by the
+version stamp: a request then only reads that small stamp from the shared
+cache instead of unpickling every chapter and assignment.
+"""
+import math
+import time
+
+from django.core.cache import cache
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from .models import Assignment, Chapter
+
+CATALOG_KEY = "assignments:catalog"
+CATALOG_VERSION_KEY = "assignments:catalog:version"
+
+# Upper bound for the cache entry, in case a date is changed outside the sync
+CATALOG_MAX_TTL = 60 * 60
+# How long a process trusts its in-memory copy before reading the shared entry again
+CATALOG_LOCAL_TTL = 60
+
+# (key, catalog, monotonic deadline) of the last catalog this process read
+_local = (None, None, 0.0)
+
+
+def _next_boundary(now):
+    """The earliest future publish_at / publish_until / publish_result_at, or None."""
+    dates = Assignment.objects.filter(status="active").aggregate(
+        publish_at=Min("publish_at", filter=Q(publish_at__gt=now)),
+        publish_until=Min("publish_until", filter=Q(publish_until__gt=now)),
+        publish_result_at=Min("publish_result_at", filter=Q(publish_result_at__gt=now)),
+    )
+    upcoming = [d for d in dates.values() if d is not None]
+    return min(upcoming) if upcoming else None
+
+
+def build_catalog(now=None):
+    now = now or timezone.now()
+
+    assignments = {}
+    for a in (
+        Assignment.objects.published(now)
+        .select_related("chapter")
+        .listing()
+        .order_by("order", "id")
+    ):
+        assignments.setdefault(a.chapter_id, []).append(a)
+
+    chapters = list(
+        Chapter.objects.filter(status="active", pk__in=assignments.keys()).order_by("order")
+    )
+
+    return {
+        "chapters": chapters,
+        "assignments": assignments,
+        "valid_until": _next_boundary(now),
+    }
+
+
+def catalog_key():
+    """Cache key of the current catalog: one small read, changes on every invalidation."""
+    version = cache.get_or_set(CATALOG_VERSION_KEY, time.time_ns, timeout=None)
+    return f"{CATALOG_KEY}:{version}"
+
+
+def _valid(catalog, now):
+    return catalog["valid_until"] is None or now < catalog["valid_until"]
+
+
+def get_catalog():
+    """
+    {"chapters": [Chapter], "assignments": {chapter pk: [Assignment]},
+     "valid_until": datetime | None, "version": hashable}
+
+    Chapters are the active ones with at least one published assignment, in
+    display order; assignments are ordered within their chapter.
+    """
+    global _local
+    now = timezone.now()
+    key = catalog_key()
+
+    local_key, catalog, deadline = _local
+    if local_key == key and time.monotonic() < deadline and _valid(catalog, now):
+        return catalog
+
+    catalog = cache.get(key)
+    if catalog is not None and _valid(catalog, now):
+        _local = (key, catalog, time.monotonic() + CATALOG_LOCAL_TTL)
+        return catalog
+
+    catalog = build_catalog(now)
+    # Identifies this build, for caches derived from it (see site_index)
+    catalog["version"] = (key, catalog["valid_until"])
+    timeout = CATALOG_MAX_TTL
+    if catalog["valid_until"] is not None:
+        seconds = (catalog["valid_until"] - now).total_seconds()
+        timeout = max(1, min(timeout, math.ceil(seconds)))
+    cache.set(key, catalog, timeout)
+    _local = (key, catalog, time.monotonic() + CATALOG_LOCAL_TTL)
+    return catalog
+
+
+def invalidate_catalog():
+    """Make every process rebuild the catalog on its next read."""
+    # A fresh version instead of deleting the entry: a rebuild that started
+    # before the sync finished can only ever write under the old key.
+    cache.set(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
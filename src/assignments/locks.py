@@ -0,0 +1,108 @@
+"""
+Single-flight lock in the shared cache, held with a renewed lease.
+
+`single_flight(key)` adds the key (atomic in Redis and locmem) with a short
+timeout and, while the block runs, a background thread extends the timeout
+every third of the lease. A worker that dies simply stops renewing, so its
+lock expires after at most one lease instead of blocking the next run.
+
+The cached value says who holds the lock and since when (see `lock_holder`),
+which the admin shows next to the sync state.
+
+The lock is only shared between processes that share the cache: with a
+process-local backend (CACHE_URL unset) the web server and each worker have
+their own, so `check_shared_cache` warns at startup and every process logs
+an error the first time it takes a lock.
+"""
+import os
+import socket
+import threading
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.utils import timezone
+
+LOCK_LEASE = int(os.environ.get("SYNC_LOCK_LEASE", "120"))     # seconds
+
+# Locks and follow-up flags of the course repository sync and the book build, per branch
+SYNC_LOCK_KEY = "assignments:sync:{branch}:lock"
+SYNC_PENDING_KEY = "assignments:sync:{branch}:pending"
+BOOK_LOCK_KEY = "assignments:book:{branch}:lock"
+BOOK_PENDING_KEY = "assignments:book:{branch}:pending"
+
+# Cache backends that live inside one process
+PROCESS_LOCAL_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+_warned = False
+
+
+def cache_is_process_local():
+    # The test settings replace a configured CACHE_URL with locmem on purpose
+    return settings.CACHES["default"]["BACKEND"] in PROCESS_LOCAL_CACHES and not settings.CACHE_URL
+
+
+def check_shared_cache(app_configs, **kwargs):
+    if not cache_is_process_local():
+        return []
+    return [checks.Warning(
+        "The default cache is process-local, so the sync and book build locks "
+        "do not exclude other processes.",
+        hint="Set CACHE_URL (e.g. redis://redis:6379/2) for the web server and all workers.",
+        id="assignments.W001",
+    )]
+
+
+def lock_holder(key):
+    """{"owner", "since", "token"} of the current holder, or None."""
+    return cache.get(key)
+
+
+def _owns(key, token):
+    holder = cache.get(key)
+    return bool(holder) and holder["token"] == token
+
+
+@contextmanager
+def single_flight(key, lease=LOCK_LEASE):
+    """Yield True while holding `key`, or False (immediately) if someone else does."""
+    global _warned
+    if not _warned and cache_is_process_local():
+        print(f"[ERROR] {key} is locked in a process-local cache only; set CACHE_URL")
+        _warned = True
+
+    token = uuid.uuid4().hex
+    holder = {
+        "owner": f"{socket.gethostname()}:{os.getpid()}",
+        "since": timezone.now(),
+        "token": token,
+    }
+    if not cache.add(key, holder, timeout=lease):
+        yield False
+        return
+
+    stop = threading.Event()
+
+    def renew():
+        while not stop.wait(lease / 3):
+            # get + touch is not atomic; the lease only has to outlive a stalled
+            # check, not a competing holder (which cannot exist while we renew)
+            if not _owns(key, token):
+                print(f"[DEBUG] Lost lock {key}")
+                return
+            cache.touch(key, lease)
+
+    renewer = threading.Thread(target=renew, name=f"lease:{key}", daemon=True)
+    renewer.start()
+    try:
+        yield True
+    finally:
+        stop.set()
+        renewer.join()
+        if _owns(key, token):
+            cache.delete(key)
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from assignments.benchmark import previous_result, run_benchmark, save_result
+
+
+class Command(BaseCommand):
+    help = (
+        "Time clone, no-op sync, small-change sync and full rebuild on a generated "
+        "course. Needs a database without chapters, which is left unchanged."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chapters", type=int, default=50)
+        parser.add_argument("--assignments", type=int, default=20, help="Assignments per chapter.")
+        parser.add_argument("--data-files", type=int, default=1, help="CSV files per assignment.")
+        parser.add_argument("--book", action="store_true", help="Include a (trivial) book build.")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs of the repeated phases.")
+        parser.add_argument("--origin", help="Benchmark this repository (branch 'benchmark') instead.")
+        parser.add_argument(
+            "--results",
+            default=settings.PROJECT_DIR / "benchmarks" / "sync.jsonl",
+            help="JSON lines file the run is appended to.",
+        )
+
+    def handle(self, *args, **options):
+        size = {
+            "chapters": options["chapters"],
+            "assignments": options["assignments"],
+            "data_files": options["data_files"],
+            "book": options["book"],
+        }
+        try:
+            result = run_benchmark(size, options["repeat"], options["origin"], verbose=options["verbosity"] > 1)
+        except ImproperlyConfigured as e:
+            raise CommandError(e)
+        previous = previous_result(result, options["results"])
+        save_result(result, options["results"])
+
+        self.stdout.write(f"Release {result['release']} on {result['database']}, size {result['size']}")
+        for phase, timing in result["phases"].items():
+            line = f"  {phase:<18} {timing['seconds']:>9.3f}s  (median {timing['median']:.3f}s, {timing['queries']} queries)"
+            if previous and phase in previous["phases"]:
+                before = previous["phases"][phase]["seconds"]
+                if before:
+                    line += f"  {(timing['seconds'] - before) / before:+.0%} vs {previous['release']}"
+            self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(f"Saved to {options['results']}"))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from assignments.benchmark import BRANCH, generate_course
+
+
+class Command(BaseCommand):
+    help = "Generate a synthetic course repository (for benchmarks and load tests)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("dest", help="Directory of the new repository (must not exist).")
+        parser.add_argument("--chapters", type=int, default=20)
+        parser.add_argument("--assignments", type=int, default=10, help="Assignments per chapter.")
+        parser.add_argument("--data-files", type=int, default=1, help="CSV files per assignment.")
+        parser.add_argument("--data-rows", type=int, default=200, help="Rows per CSV file.")
+        parser.add_argument("--tests", type=int, default=5, help="Test cases per test runner.")
+        parser.add_argument("--book", action="store_true", help="Add a book/ with one page per chapter.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            generate_course(
+                options["dest"],
+                chapters=options["chapters"],
+                assignments=options["assignments"],
+                data_files=options["data_files"],
+                data_rows=options["data_rows"],
+                tests=options["tests"],
+                book=options["book"],
+                seed=options["seed"],
+            )
+        except FileExistsError as e:
+            raise CommandError(e)
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {options['chapters'] * options['assignments']} assignments in "
+            f"{options['dest']} (branch {BRANCH})."
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from assignments.search import index_assignments
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of all assignments"
+
+    def handle(self, *args, **options):
+        count = index_assignments()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} assignments."))
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-19 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assignments', '0011_assignment_publish_result_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignment',
+            name='defer_grading',
+            field=models.BooleanField(default=False, help_text='Exams only: store submissions and grade them in one batch after the deadline'),
+        ),
+    ]
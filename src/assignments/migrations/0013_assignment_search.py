@@ -0,0 +1,46 @@
+# Generated by Django 5.1.15 on 2026-10-19 17:25
+
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+# Vendor-specific part of the search index (see assignments/search.py)
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE INDEX assignments_assignment_search_gin "
+            "ON assignments_assignment USING GIN (search_vector)"
+        )
+    elif schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE assignments_assignment_fts "
+            "USING fts5(title, body, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS assignments_assignment_search_gin")
+    elif schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS assignments_assignment_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assignments', '0012_assignment_defer_grading'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignment',
+            name='search_text',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='assignment',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
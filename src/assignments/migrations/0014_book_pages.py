@@ -0,0 +1,38 @@
+# Generated by Django 5.1.15 on 2026-10-19 17:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assignments', '0013_assignment_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=300, unique=True)),
+                ('title', models.CharField(blank=True, max_length=300)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BookSection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('anchor', models.CharField(blank=True, max_length=300)),
+                ('title', models.CharField(blank=True, max_length=300)),
+                ('text', models.TextField(blank=True)),
+                ('order', models.PositiveIntegerField(default=0)),
+                ('page', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sections', to='assignments.bookpage')),
+            ],
+            options={
+                'ordering': ['page', 'order'],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.15 on 2026-10-19 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assignments', '0014_book_pages'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(fields=['chapter', 'status', 'publish_at'], name='assignment_chapter_pub_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.15 on 2026-10-19 17:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assignments', '0015_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('branch', models.CharField(max_length=200, unique=True)),
+                ('commit_sha', models.CharField(blank=True, max_length=40)),
+                ('toc_file', models.CharField(blank=True, max_length=200)),
+                ('synced_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.15 on 2026-10-19 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assignments', '0016_sync_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncstate',
+            name='last_duration',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='syncstate',
+            name='last_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='syncstate',
+            name='last_result',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='syncstate',
+            name='last_run_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
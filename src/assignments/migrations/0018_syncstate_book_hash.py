@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-19 17:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assignments', '0017_sync_run_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncstate',
+            name='book_hash',
+            field=models.CharField(blank=True, max_length=40),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-19 17:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assignments', '0018_syncstate_book_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignment',
+            name='asset_version',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
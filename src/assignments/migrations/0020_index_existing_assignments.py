@@ -0,0 +1,21 @@
+# Generated by Django 5.1.15 on 2026-10-19 19:02
+
+from django.db import migrations
+
+
+# Assignments synced before 0013 have no search entries until their next change
+def index_existing_assignments(apps, schema_editor):
+    from assignments.search import index_assignments
+
+    index_assignments(model=apps.get_model("assignments", "Assignment"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assignments', '0019_assignment_asset_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_existing_assignments, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,4 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils import timezone
 
@@ -16,6 +17,26 @@ class Chapter(models.Model):
     def __str__(self):
         return self.title
 
+# Large text columns of Assignment. Lists and navigation never need them, so
+# they are deferred everywhere except on the detail page / in the grader.
+CONTENT_FIELDS = ("description", "test_runner", "solution", "search_text", "search_vector")
+
+
+def deferred_content(prefix=""):
+    """CONTENT_FIELDS as lookups, e.g. deferred_content("assignment__") for Submission queries."""
+    return [prefix + name for name in CONTENT_FIELDS]
+
+
+class AssignmentQuerySet(models.QuerySet):
+    def published(self, now=None):
+        now = now or timezone.now()
+        return self.filter(publish_at__isnull=False, publish_at__lte=now, status="active")
+
+    def listing(self):
+        """Narrow rows for lists and prev/next links: no description/test_runner/solution."""
+        return self.defer(*CONTENT_FIELDS)
+
+
 class Assignment(models.Model):
     chapter     = models.ForeignKey(
         Chapter,
@@ -51,11 +72,27 @@ class Assignment(models.Model):
         default="active",
     )
     is_exam = models.BooleanField(default=False)
+    defer_grading = models.BooleanField(
+        default=False,
+        help_text="Exams only: store submissions and grade them in one batch after the deadline"
+    )
     last_synced = models.DateTimeField(auto_now=True)
-    
+    # sha256 of the test runner + data files manifest in the asset store (assignments.assets)
+    asset_version = models.CharField(max_length=64, blank=True, editable=False)
+
+    # Full-text search, filled by assignments.search at sync time
+    search_text   = models.TextField(blank=True, editable=False)                # description without markup
+    search_vector = SearchVectorField(null=True, editable=False)                # PostgreSQL only (GIN indexed)
+
+    objects = AssignmentQuerySet.as_manager()
+
     class Meta:
         unique_together = (("chapter", "slug"),)        # each slug is unique per chapter
         ordering        = ["chapter__order", "order"]   # default sort
+        indexes = [
+            # Published assignments of a chapter (views, catalog)
+            models.Index(fields=["chapter", "status", "publish_at"], name="assignment_chapter_pub_idx"),
+        ]
 
     def __str__(self):
         # shows “intro_to_python/assignment-01”
@@ -63,4 +100,65 @@ class Assignment(models.Model):
 
     @property
     def is_published(self):
-        return self.publish_at and self.publish_at <= timezone.now()
\ No newline at end of file
+        return self.publish_at and self.publish_at <= timezone.now()
+
+    @property
+    def grading_deferred(self):
+        """
+        True while submissions should only be stored, not graded: the exam opted
+        into deferred grading and its results are not public yet anyway.
+        """
+        return bool(
+            self.defer_grading
+            and self.is_exam
+            and self.publish_until
+            and self.publish_result_at
+            and self.publish_result_at > timezone.now()
+        )
+
+class BookPage(models.Model):
+    """One built JupyterBook page (book/_build/html), re-extracted when its content changes."""
+    path         = models.CharField(max_length=300, unique=True)              # intro_to_python/loops.html
+    title        = models.CharField(max_length=300, blank=True)
+    content_hash = models.CharField(max_length=64)                            # sha1 of the built HTML
+    updated_at   = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.path
+
+
+class BookSection(models.Model):
+    """A <section> of a book page with its visible text, for the site search."""
+    page   = models.ForeignKey(
+        BookPage,
+        on_delete=models.CASCADE,
+        related_name="sections",
+    )
+    anchor = models.CharField(max_length=300, blank=True)                     # id of the section, "" for the page top
+    title  = models.CharField(max_length=300, blank=True)
+    text   = models.TextField(blank=True)
+    order  = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["page", "order"]
+
+    def __str__(self):
+        return f"{self.page.path}#{self.anchor}"
+
+
+class SyncState(models.Model):
+    """Commit of the course repository the database was last synced to (one row per branch)."""
+    branch     = models.CharField(max_length=200, unique=True)
+    commit_sha = models.CharField(max_length=40, blank=True)
+    toc_file   = models.CharField(max_length=200, blank=True)                  # TOC_FILE_NAME used for that sync
+    synced_at  = models.DateTimeField(null=True, blank=True)
+    book_hash  = models.CharField(max_length=40, blank=True)                  # git tree of book/ that is served
+
+    # Last run of the task, including runs that found nothing to do
+    last_run_at     = models.DateTimeField(null=True, blank=True)
+    last_duration   = models.FloatField(null=True, blank=True)               # seconds
+    last_result     = models.CharField(max_length=20, blank=True)            # synced / unchanged / failed
+    last_error      = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.branch}@{self.commit_sha[:12]}"
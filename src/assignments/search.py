@@ -0,0 +1,136 @@
+"""
+Full-text search over assignment titles and descriptions.
+
+The sync stores each description without its markup in `search_text` and
+calls `index_assignments()`. The index itself depends on the database:
+
+- PostgreSQL: `search_vector` (title weighted above the text), GIN indexed,
+  ranked with ts_rank and highlighted with ts_headline,
+- SQLite: the FTS5 table `assignments_assignment_fts`, ranked with bm25()
+  and highlighted with snippet(),
+- anything else: a plain `icontains` over the stripped text, unranked.
+
+Every search word is matched as a prefix and all words must match.
+"""
+import html
+import re
+
+from django.contrib.postgres.search import (
+    SearchHeadline,
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils.html import escape, strip_tags
+from django.utils.safestring import mark_safe
+
+from .models import Assignment
+
+SEARCH_CONFIG = "simple"
+FTS_TABLE = "assignments_assignment_fts"
+
+# Highlight markers the text itself cannot contain; replaced by <mark> after escaping
+_START, _STOP = "\x02", "\x03"
+SNIPPET_WORDS = 16
+
+
+def html_to_text(value: str) -> str:
+    """Visible text of an HTML fragment, whitespace collapsed."""
+    text = html.unescape(strip_tags(value or ""))
+    text = text.replace(_START, "").replace(_STOP, "")
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _terms(query: str):
+    return re.findall(r"\w+", (query or "").lower())
+
+
+def _highlight(snippet: str):
+    return mark_safe(escape(snippet).replace(_START, "<mark>").replace(_STOP, "</mark>"))
+
+
+def index_assignments(pks=None, model=Assignment):
+    """
+    (Re)build the search entries of the given assignments (default: all).
+    Migrations pass their historical `model`.
+    """
+    qs = model.objects.all() if pks is None else model.objects.filter(pk__in=pks)
+
+    with transaction.atomic():
+        rows = list(qs.only("pk", "title", "description"))
+        for a in rows:
+            a.search_text = html_to_text(a.description)
+        model.objects.bulk_update(rows, ["search_text"], batch_size=500)
+
+        if connection.vendor == "postgresql":
+            qs.update(
+                search_vector=(
+                    SearchVector("title", weight="A", config=SEARCH_CONFIG)
+                    + SearchVector("search_text", weight="B", config=SEARCH_CONFIG)
+                )
+            )
+        elif connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                if pks is None:
+                    cursor.execute(f"DELETE FROM {FTS_TABLE}")
+                else:
+                    for start in range(0, len(rows), 500):
+                        batch = [a.pk for a in rows[start:start + 500]]
+                        cursor.execute(
+                            f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(batch))})", batch
+                        )
+                cursor.executemany(
+                    f"INSERT INTO {FTS_TABLE} (rowid, title, body) VALUES (%s, %s, %s)",
+                    [(a.pk, a.title, a.search_text) for a in rows],
+                )
+
+    return len(rows)
+
+
+def search_assignments(query: str):
+    """
+    Ranked matches for `query` over all indexed assignments, best first:
+    a list of (assignment pk, snippet) where the snippet is safe HTML with the
+    matched words in <mark>. Callers restrict the pks to what they show.
+    """
+    terms = _terms(query)
+    if not terms:
+        return []
+
+    if connection.vendor == "postgresql":
+        search = SearchQuery(" & ".join(f"{t}:*" for t in terms), search_type="raw", config=SEARCH_CONFIG)
+        rows = (
+            Assignment.objects.filter(search_vector=search)
+            .annotate(
+                rank=SearchRank("search_vector", search),
+                snippet=SearchHeadline(
+                    "search_text",
+                    search,
+                    config=SEARCH_CONFIG,
+                    start_sel=_START,
+                    stop_sel=_STOP,
+                    max_words=SNIPPET_WORDS,
+                    min_words=SNIPPET_WORDS // 2,
+                ),
+            )
+            .order_by("-rank", "pk")
+            .values_list("pk", "snippet")
+        )
+        return [(pk, _highlight(snippet)) for pk, snippet in rows]
+
+    if connection.vendor == "sqlite":
+        match = " ".join(f'"{t}"*' for t in terms)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, snippet({FTS_TABLE}, 1, %s, %s, '…', %s) FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s ORDER BY bm25({FTS_TABLE}, 10.0, 1.0), rowid",
+                [_START, _STOP, SNIPPET_WORDS, match],
+            )
+            return [(pk, _highlight(snippet)) for pk, snippet in cursor.fetchall()]
+
+    cond = Q()
+    for t in terms:
+        cond &= Q(title__icontains=t) | Q(search_text__icontains=t)
+    return [(pk, "") for pk in Assignment.objects.filter(cond).order_by("pk").values_list("pk", flat=True)]
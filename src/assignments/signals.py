@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog import invalidate_catalog
+from .models import Assignment, Chapter
+
+
+@receiver([post_save, post_delete], sender=Assignment)
+@receiver([post_save, post_delete], sender=Chapter)
+def drop_cached_catalog(sender, **kwargs):
+    # Bulk .update() calls (archival in the sync) bypass this; the sync
+    # invalidates explicitly once it is done.
+    invalidate_catalog()
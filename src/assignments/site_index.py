@@ -0,0 +1,168 @@
+"""
+In-memory inverted index for the site-wide search (book sections + assignments).
+
+Each web process builds the index once from BookSection rows and the published
+assignments of the catalog, and keeps it until the catalog changes (sync,
+book build, publication boundary). A query only reads the catalog's version
+stamp from the shared cache; the rest is a few dict lookups and a bisect per
+word, without touching the database.
+
+Words are matched as prefixes and every word must match. Scores are
+idf * log(1 + weight), where a word in the title weighs TITLE_BOOST times a
+word in the text.
+"""
+import bisect
+import heapq
+import math
+import re
+import threading
+
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .catalog import catalog_key, get_catalog
+from .models import Assignment, BookSection
+
+TITLE_BOOST = 5
+# How many indexed words one (short) query word may expand to
+MAX_EXPANSIONS = 50
+SNIPPET_CHARS = 160
+
+_lock = threading.Lock()
+# "key" and "valid_until" of the catalog the index was built from
+_current = {"key": None, "valid_until": None, "index": None}
+
+
+def tokenize(text: str):
+    return re.findall(r"\w+", (text or "").lower())
+
+
+def build_index(catalog):
+    """Return {"docs", "terms" (sorted), "postings" {term: ((doc, weight), ...)}}."""
+    docs = []
+
+    chapters = {ch.pk: ch for ch in catalog["chapters"]}
+    published = [a for assignments in catalog["assignments"].values() for a in assignments]
+    texts = dict(
+        Assignment.objects.filter(pk__in=[a.pk for a in published]).values_list("pk", "search_text")
+    )
+    for a in published:
+        chapter = chapters.get(a.chapter_id)
+        docs.append({
+            "kind": "assignment",
+            "title": a.title,
+            "context": chapter.title if chapter else a.chapter_id,
+            "url": reverse(
+                "assignments:assignment-detail",
+                kwargs={"chapter_slug": a.chapter_id, "assignment_slug": a.slug},
+            ),
+            "text": texts.get(a.pk, ""),
+        })
+
+    for section in BookSection.objects.select_related("page").order_by("page__path", "order"):
+        url = reverse("jupyterbook", kwargs={"path": section.page.path})
+        docs.append({
+            "kind": "book",
+            "title": section.title or section.page.title,
+            "context": section.page.title,
+            "url": f"{url}#{section.anchor}" if section.anchor else url,
+            "text": section.text,
+        })
+
+    postings = {}
+    for doc_id, doc in enumerate(docs):
+        weights = {}
+        for term in tokenize(doc["text"]):
+            weights[term] = weights.get(term, 0) + 1
+        for term in tokenize(doc["title"]):
+            weights[term] = weights.get(term, 0) + TITLE_BOOST
+        for term, weight in weights.items():
+            postings.setdefault(term, []).append((doc_id, math.log1p(weight)))
+
+    return {
+        "docs": docs,
+        "terms": sorted(postings),
+        "postings": {term: tuple(entries) for term, entries in postings.items()},
+    }
+
+
+def _fresh(key):
+    # Book builds invalidate the catalog too, so its key covers BookSection
+    valid_until = _current["valid_until"]
+    return _current["key"] == key and (valid_until is None or timezone.now() < valid_until)
+
+
+def get_index():
+    key = catalog_key()
+    if not _fresh(key):
+        with _lock:
+            if not _fresh(key):
+                catalog = get_catalog()
+                key, valid_until = catalog["version"]
+                _current.update(index=build_index(catalog), key=key, valid_until=valid_until)
+    return _current["index"]
+
+
+def _expand(index, word):
+    terms = index["terms"]
+    start = bisect.bisect_left(terms, word)
+    found = []
+    for term in terms[start:start + MAX_EXPANSIONS]:
+        if not term.startswith(word):
+            break
+        found.append(term)
+    return found
+
+
+def _snippet(text, words):
+    pattern = re.compile(r"\b(?:" + "|".join(re.escape(w) for w in words) + r")\w*", re.IGNORECASE)
+    match = pattern.search(text)
+    start = max(0, match.start() - SNIPPET_CHARS // 3) if match else 0
+    window = text[start:start + SNIPPET_CHARS]
+    highlighted = pattern.sub(lambda m: f"\x02{m.group(0)}\x03", window)
+    html = escape(highlighted).replace("\x02", "<mark>").replace("\x03", "</mark>")
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if start + SNIPPET_CHARS < len(text) else ""
+    return mark_safe(prefix + html + suffix)
+
+
+def search(query: str, limit: int = 20):
+    """Best matches first: [{"kind", "title", "context", "url", "snippet"}]."""
+    words = tokenize(query)
+    if not words:
+        return []
+    index = get_index()
+    total = len(index["docs"]) or 1
+
+    scores = None
+    for word in words:
+        word_scores = {}
+        for term in _expand(index, word):
+            entries = index["postings"][term]
+            idf = math.log(1 + total / len(entries))
+            for doc_id, weight in entries:
+                score = idf * weight
+                if score > word_scores.get(doc_id, 0):
+                    word_scores[doc_id] = score
+        scores = word_scores if scores is None else {
+            doc_id: score + word_scores[doc_id]
+            for doc_id, score in scores.items()
+            if doc_id in word_scores
+        }
+        if not scores:
+            return []
+
+    best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+    results = []
+    for doc_id, _ in best:
+        doc = index["docs"][doc_id]
+        results.append({
+            "kind": doc["kind"],
+            "title": doc["title"],
+            "context": doc["context"],
+            "url": doc["url"],
+            "snippet": _snippet(doc["text"], words),
+        })
+    return results
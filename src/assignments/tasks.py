@@ -1,17 +1,39 @@
+"""
+Celery tasks that sync the course repository and build the JupyterBook.
+
+Every process imports this module (the web process to queue the tasks,
+Celery autodiscovery in workers and beat), so it stays cheap to import:
+GitPython and PyYAML are imported in the functions that use them, and a
+missing REPO_URL only fails the sync, not the import.
+"""
 import os
-import subprocess
+from pathlib import Path
 
-import yaml
 from celery import shared_task
 from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
-from git import Repo
-from path import Path
 
-from .models import Assignment, Chapter
+from grader.progress import refresh_chapters
 
-REPO_URL   = os.environ["REPO_URL"]
+from .assets import DATA_SUFFIXES, publish_assets
+from .book import sync_book_pages
+from .book_build import book_tree_hash, export_sources, html_root, publish, run_build
+from .catalog import invalidate_catalog
+from .locks import (
+    BOOK_LOCK_KEY,
+    BOOK_PENDING_KEY,
+    SYNC_LOCK_KEY,
+    SYNC_PENDING_KEY,
+    single_flight,
+)
+from .models import Assignment, Chapter, SyncState
+from .search import index_assignments
+
+REPO_URL   = os.environ.get("REPO_URL", "")
 
 BRANCH     = os.environ.get("REPO_BRANCH")
 
@@ -23,210 +45,504 @@ toc_target = os.getenv("TOC_BOOK_BUILD", "build-main")
 
 # print(f"DEBUG: LOCAL repo path is → {LOCAL_PATH}")
 
-TOC_PATH   = LOCAL_PATH / TOC_FILE_NAME
+# Clone size: commits of history (0 = all), partial clone filter ("" = all
+# blobs) and sparse checkout patterns (comma-separated, "" = whole tree;
+# unset = the files listed in _sparse_paths)
+CLONE_DEPTH = int(os.environ.get("REPO_CLONE_DEPTH", "1"))
+CLONE_FILTER = os.environ.get("REPO_CLONE_FILTER", "blob:none")
+SPARSE_PATHS = os.environ.get("REPO_SPARSE_PATHS")
+
+# Files of an assignment folder <chapter>/<assignment>/ that the sync reads
+# (besides its data files, see assets.DATA_SUFFIXES)
+ASSIGNMENT_FILES = ("description.html", "test_runner.py", "solution.py")
+
+# How long a tick that found the sync running keeps its follow-up request
+SYNC_PENDING_TTL = 60 * 60
+
+def _sparse_paths():
+    """Sparse checkout patterns (gitignore style), [] for a full checkout."""
+    if SPARSE_PATHS is not None:
+        return [p.strip() for p in SPARSE_PATHS.split(",") if p.strip()]
+    # Everything the platform reads: the TOC, the book sources, the assignment files
+    files = [*ASSIGNMENT_FILES, *(f"*{suffix}" for suffix in DATA_SUFFIXES)]
+    return [f"/{TOC_FILE_NAME}", "/book/"] + [f"/*/*/{name}" for name in files]
+
+
+def _configure_sparse_checkout(repo):
+    paths = _sparse_paths()
+    if paths:
+        repo.git.sparse_checkout("set", "--no-cone", *paths)
+    elif repo.config_reader().get_value("core", "sparseCheckout", False):
+        repo.git.sparse_checkout("disable")
+
 
 def clone_or_pull_repo():
+    """
+    Check out the current tree of BRANCH, as cheaply as configured: a clone
+    of REPO_CLONE_DEPTH commits (shallow), without blobs outside the sparse
+    checkout (partial clone, REPO_CLONE_FILTER), with only the paths the
+    platform reads in the work tree. The sync copes with the truncated
+    history: a last synced commit that is not available means a full sync.
+    """
+    from git import Repo
+
+    if not REPO_URL:
+        raise ImproperlyConfigured("REPO_URL is not set")
 
     if not LOCAL_PATH.exists():                                 # If not create one.
-        LOCAL_PATH.makedirs()
+        LOCAL_PATH.mkdir(parents=True)
 
     git_dir = LOCAL_PATH / ".git"                           # Build the filesystem path to the .git metadata folder inside your cloned repository. Decision factor for clone/pull
 
     if git_dir.is_dir():                          # already cloned → pull latest. This is done by seeing the .git file in the cloned folder
         repo = Repo(str(LOCAL_PATH))
         origin = repo.remotes.origin
-        origin.fetch()
+        if CLONE_DEPTH:
+            origin.fetch(BRANCH, depth=CLONE_DEPTH)
+        else:
+            origin.fetch()
+        # Patterns may have changed since the clone (env, TOC file name)
+        _configure_sparse_checkout(repo)
         # Reset local branch to match the remote exactly
         repo.git.reset("--hard", f"origin/{BRANCH}")
 
     else:                                               # fresh clone if the .git file is not there
-        Repo.clone_from(REPO_URL, str(LOCAL_PATH), branch = BRANCH)
-
-
-@shared_task
-def sync_assignments_repo():
-
-    clone_or_pull_repo()
-
-    # Path to theory book folder
-    book_dir = LOCAL_PATH / "book"
-
-    # Build the JupyterBook if folder exists
-    if book_dir.is_dir():
-        print("JupyterBook build started")
-        result = subprocess.run(
-            ["make", toc_target],
-            cwd=book_dir,
-            capture_output=True,
-            text=True
+        options = {"branch": BRANCH, "single_branch": True, "no_checkout": True}
+        if CLONE_DEPTH:
+            options["depth"] = CLONE_DEPTH
+        if CLONE_FILTER:
+            options["filter"] = CLONE_FILTER
+        repo = Repo.clone_from(REPO_URL, str(LOCAL_PATH), **options)
+        # Check out only after the patterns are set, so nothing else is downloaded
+        _configure_sparse_checkout(repo)
+        repo.git.checkout(BRANCH)
+
+    return repo
+
+
+def _changed_paths(repo, old_sha, new_sha):
+    """Paths changed between two commits, or None when `old_sha` is not in the local history."""
+    from git import GitCommandError
+
+    if not old_sha:
+        return None
+    try:
+        out = repo.git.diff("--name-only", "--no-renames", old_sha, new_sha)
+    except GitCommandError:
+        return None
+    return {line for line in out.splitlines() if line}
+
+
+def _toc_at(repo, sha):
+    """The TOC as it was at commit `sha` ({} if it did not exist)."""
+    import yaml
+    from git import GitCommandError
+
+    try:
+        return yaml.safe_load(repo.git.show(f"{sha}:{TOC_FILE_NAME}")) or {}
+    except GitCommandError:
+        return {}
+
+
+def _toc_entries(toc):
+    """{chapter slug: entry without its assignments}, {(chapter slug, assignment slug): entry}."""
+    chapters, assignments = {}, {}
+    for chap in toc.get("chapters", []):
+        chapters[chap["slug"]] = {key: value for key, value in chap.items() if key != "assignments"}
+        for a in chap.get("assignments", []):
+            assignments[(chap["slug"], a["slug"])] = a
+    return chapters, assignments
+
+
+def _dirty_entries(old_toc, new_toc, paths):
+    """
+    Chapter slugs and (chapter, assignment) slugs that have to be written again:
+    entries that are new or differ in the TOC, assignments with changed files
+    under <chapter>/<assignment>/. Book links are refreshed by `build_book`.
+    """
+    old_chapters, old_assignments = _toc_entries(old_toc)
+    new_chapters, new_assignments = _toc_entries(new_toc)
+    changed_dirs = {tuple(p.split("/")[:2]) for p in paths if p.count("/") >= 2}
+
+    chapters = {
+        slug for slug, entry in new_chapters.items()
+        if entry != old_chapters.get(slug)
+    }
+    assignments = {
+        key for key, entry in new_assignments.items()
+        if entry != old_assignments.get(key) or key in changed_dirs
+    }
+    return chapters, assignments
+
+
+def _parse_toc_datetime(a, field):
+    """An aware datetime from the TOC entry `a`, or None if missing/invalid."""
+    try:
+        raw = a.get(field)
+        if not raw:
+            return None
+
+        dt = parse_datetime(raw)
+        if dt is None:
+            # parse_datetime returned None (invalid format)
+            print(f"Invalid datetime format for '{a['slug']}': {raw}")
+            return None
+
+        # If datetime is naive (no timezone info), make it aware
+        return timezone.make_aware(dt) if timezone.is_naive(dt) else dt
+
+    except Exception as e:
+        print(f"Invalid {field} in assignment '{a['slug']}': {e}")
+        return None
+
+
+# Columns written on conflict by the bulk upserts of the sync
+CHAPTER_SYNC_FIELDS = ["title", "order", "book_url", "status"]
+ASSIGNMENT_SYNC_FIELDS = [
+    "title", "order", "description", "test_runner", "solution", "points", "difficulty",
+    "publish_at", "publish_until", "publish_result_at", "is_exam", "defer_grading",
+    "status", "last_synced", "asset_version",
+]
+SYNC_BATCH_SIZE = 500
+
+
+def _read(path):
+    return path.open(encoding="utf-8").read() if path.is_file() else ""
+
+
+def _book_url(chap):
+    """Link of a TOC chapter into the served book, if that page was built."""
+    book_field = chap.get("book", None)
+
+    if book_field:
+        book_path = html_root() / Path(book_field).with_suffix(".html")
+
+        if book_path.is_file():
+            book_url = Path(book_field).with_suffix(".html")
+            print(book_url)
+        else:
+            book_url = None
+    else:
+        book_url = None
+
+    return book_url
+
+
+def _chapter_row(chap):
+    return Chapter(
+        slug=chap["slug"],
+        title=chap.get("title", chap["slug"].replace("_", " ").title()),
+        order=chap.get("order", 0),
+        book_url=_book_url(chap),
+        status="active",
+    )
+
+
+def _assignment_row(chap_slug, a):
+    folder = LOCAL_PATH / chap_slug / a["slug"]
+    description, test_runner, solution = (_read(folder / name) for name in ASSIGNMENT_FILES)
+
+    return Assignment(
+        chapter_id=chap_slug,
+        slug=a["slug"],
+        title=a.get("title", a["slug"].replace("-", " ").title()),
+        order=a.get("order", 0),
+        description=description,
+        test_runner=test_runner,
+        solution=solution,
+        asset_version=publish_assets(folder, test_runner),
+        points=a.get("points", 0),
+        difficulty=a.get("difficulty", "Easy"),
+        publish_at=_parse_toc_datetime(a, "publish_at"),
+        publish_until=_parse_toc_datetime(a, "publish_until"),
+        publish_result_at=_parse_toc_datetime(a, "publish_result_at"),
+        is_exam=a.get("is_exam", False),
+        defer_grading=a.get("defer_grading", False),
+        status="active",
+    )
+
+
+def _sync_repo(full=False):
+    """
+    Bring chapters, assignments and the book up to date with the course repository.
+
+    The commit of the last sync is kept in SyncState: if HEAD did not move the
+    task returns right after the fetch. Otherwise only the TOC entries and
+    assignment folders touched by `git diff` are written again. A full sync
+    runs on the first sync, when `full` is set, when the TOC file changed and
+    when the last synced commit is no longer in the history (force-push).
+
+    The database is reconciled in one transaction with set-based statements:
+    bulk upserts of the changed rows, one archival UPDATE per model, and the
+    counts are derived from the state read up front.
+    """
+    repo = clone_or_pull_repo()
+    head = repo.head.commit.hexsha
+
+    state, _ = SyncState.objects.get_or_create(branch=BRANCH or "")
+    if not full and state.commit_sha == head and state.toc_file == TOC_FILE_NAME:
+        print(f"Course repository unchanged at {head[:12]}, nothing to sync")
+        return "unchanged"
+
+    paths = None
+    if not full and state.toc_file == TOC_FILE_NAME:
+        paths = _changed_paths(repo, state.commit_sha, head)
+
+    # Read TOC file
+    import yaml
+
+    toc = yaml.safe_load((LOCAL_PATH / TOC_FILE_NAME).open(encoding="utf-8"))
+
+    if paths is None:
+        print(f"Full sync at {head[:12]}")
+        dirty_chapters = dirty_assignments = None
+    else:
+        dirty_chapters, dirty_assignments = _dirty_entries(_toc_at(repo, state.commit_sha), toc, paths)
+        print(
+            f"Incremental sync {state.commit_sha[:12]}..{head[:12]}: {len(paths)} file(s) changed, "
+            f"{len(dirty_chapters)} chapter(s) and {len(dirty_assignments)} assignment(s) to update"
         )
 
-        if result.returncode == 0:
-            print("JupyterBook build successful")
-        else:
-            print("JupyterBook build failed")
-            print("STDOUT:\n", result.stdout)
-            print("STDERR:\n", result.stderr)
-    
-    # Read TOC file and copy its content to models
-    toc = yaml.safe_load((TOC_PATH).open(encoding="utf-8"))
+    # Rebuild the theory book (in the background) only if book/ changed
+    book_hash = book_tree_hash(repo, head)
+    if book_hash and (book_hash != state.book_hash or not html_root().is_dir()):
+        build_book.delay(head, book_hash)
+        print(f"JupyterBook build queued for book/ {book_hash[:12]}")
+
+    # Database state before the sync: what to archive, the counts and the
+    # publication state (to refresh progress of changed chapters)
+    existing_chapters = dict(Chapter.objects.values_list("slug", "status"))
+    existing = {
+        (chapter_id, slug): (pk, status, publish_at)
+        for pk, chapter_id, slug, status, publish_at in Assignment.objects.values_list(
+            "pk", "chapter_id", "slug", "status", "publish_at"
+        )
+    }
 
+    # Rows for the (changed) TOC entries, keyed so duplicates in the TOC collapse
     repo_chapters = set()
     repo_assignments = set()
+    chapter_rows = {}
+    assignment_rows = {}
 
     for chap in toc.get("chapters", []):
 
         repo_chapters.add(chap["slug"])
 
-        book_field = chap.get("book", None)
-
-        if book_field:
-            book_path = LOCAL_PATH / "book" / "_build" / "html" / Path(book_field).with_suffix(".html")
-
-            if book_path.is_file():
-                book_url = Path(book_field).with_suffix(".html")
-                print(book_url)
-            else:
-                book_url = None
-        else:
-            book_url = None
-
-        chapter_obj, _ = Chapter.objects.update_or_create(
-            slug=chap["slug"],
-            defaults={
-                "title": chap.get("title", chap["slug"].replace("_", " ").title()),
-                "order": chap.get("order", 0),
-                "book_url": book_url,
-                "status": "active",
-            }
-        )
+        if dirty_chapters is None or chap["slug"] in dirty_chapters:
+            chapter_rows[chap["slug"]] = _chapter_row(chap)
 
         for a in chap.get("assignments", []):
 
-            repo_assignments.add((chap["slug"], a["slug"]))
-            
-            desc_path = LOCAL_PATH / chap["slug"] / a["slug"] / "description.html"
-
-            desc_content = desc_path.open(encoding="utf-8").read() if desc_path.is_file() else ""
-
-            test_path = LOCAL_PATH / chap["slug"] / a["slug"] / "test_runner.py"
+            key = (chap["slug"], a["slug"])
+            repo_assignments.add(key)
+
+            if dirty_assignments is None or key in dirty_assignments:
+                assignment_rows[key] = _assignment_row(chap["slug"], a)
+
+    archived_chapters = sorted(
+        slug for slug, status in existing_chapters.items()
+        if slug not in repo_chapters and status != "deleted"
+    )
+    # Covers the assignments of archived chapters as well: they are not in the TOC either
+    archived = {
+        key: pk for key, (pk, status, _) in existing.items()
+        if key not in repo_assignments and status != "deleted"
+    }
+
+    with transaction.atomic():
+        Chapter.objects.bulk_create(
+            chapter_rows.values(),
+            update_conflicts=True,
+            unique_fields=["slug"],
+            update_fields=CHAPTER_SYNC_FIELDS,
+            batch_size=SYNC_BATCH_SIZE,
+        )
+        Assignment.objects.bulk_create(
+            assignment_rows.values(),
+            update_conflicts=True,
+            unique_fields=["chapter", "slug"],
+            update_fields=ASSIGNMENT_SYNC_FIELDS,
+            batch_size=SYNC_BATCH_SIZE,
+        )
+        if archived_chapters:
+            Chapter.objects.filter(slug__in=archived_chapters).update(status="deleted")
+        if archived:
+            Assignment.objects.filter(pk__in=archived.values()).update(status="deleted")
+
+        # Backends that cannot return ids from an upsert leave pk unset
+        if any(row.pk is None for row in assignment_rows.values()):
+            pks = {
+                (chapter_id, slug): pk
+                for pk, chapter_id, slug in Assignment.objects.filter(
+                    chapter_id__in={c for c, _ in assignment_rows}
+                ).values_list("pk", "chapter_id", "slug")
+            }
+            for key, row in assignment_rows.items():
+                row.pk = pks.get(key)
+        synced = [row.pk for row in assignment_rows.values()]
+
+        indexed = index_assignments(None if paths is None else synced) if paths is None or synced else 0
+
+        published_before = {pk: (key[0], (status, publish_at)) for key, (pk, status, publish_at) in existing.items()}
+        published_after = dict(published_before)
+        for key, pk in archived.items():
+            published_after[pk] = (key[0], ("deleted", existing[key][2]))
+        for row in assignment_rows.values():
+            published_after[row.pk] = (row.chapter_id, (row.status, row.publish_at))
+
+        changed_chapters = {
+            chapter_id
+            for pk, (chapter_id, publication) in (published_before | published_after).items()
+            if published_before.get(pk) != published_after.get(pk)
+        }
+        if changed_chapters:
+            refresh_chapters(changed_chapters)
+
+        state.commit_sha = head
+        state.toc_file = TOC_FILE_NAME
+        state.synced_at = timezone.now()
+        # Only the sync's own fields: build_book and _record_run write the others
+        state.save(update_fields=["commit_sha", "toc_file", "synced_at"])
+
+    invalidate_catalog()
+
+    if archived_chapters:
+        print(f"Archived chapters: {', '.join(archived_chapters)}")
+    if archived:
+        print(f"Archived assignments: {', '.join(f'{c}/{a}' for c, a in sorted(archived))}")
+    if indexed:
+        print(f"Search index updated for {indexed} assignments")
+    if changed_chapters:
+        print(f"Refreshed progress of {len(changed_chapters)} chapter(s)")
+
+    # Everything in the TOC is active now, everything else archived
+    chap_active = len(repo_chapters)
+    chap_deleted = len(existing_chapters.keys() - repo_chapters)
+    assn_active = len(repo_assignments)
+    assn_deleted = len(existing.keys() - repo_assignments)
 
-            test_content = test_path.open(encoding="utf-8").read() if test_path.is_file() else ""
+    print(
+        f"Sync completed successfully.\n"
+        f"Chapters — Active: {chap_active}, Deleted: {chap_deleted}\n"
+        f"Assignments — Active: {assn_active}, Deleted: {assn_deleted}"
+    )
+    return "synced"
 
-            solution_path = LOCAL_PATH / chap["slug"] / a["slug"] / "solution.py"
 
-            solution_content = solution_path.open(encoding="utf-8").read() if solution_path.is_file() else ""
+def _record_run(started, result, error=""):
+    fields = {
+        "last_run_at": started,
+        "last_duration": (timezone.now() - started).total_seconds(),
+        "last_result": result,
+        "last_error": error,
+    }
+    # The row exists unless the run failed before reaching the database
+    if not SyncState.objects.filter(branch=BRANCH or "").update(**fields):
+        SyncState.objects.create(branch=BRANCH or "", **fields)
 
-            try:
-                raw_publish_at = a.get("publish_at")
-
-                if raw_publish_at:
-                    dt = parse_datetime(raw_publish_at)
-
-                    if dt is not None:
-                        # If datetime is naive (no timezone info), make it aware
-                        if timezone.is_naive(dt):
-                            publish_at = timezone.make_aware(dt)
-                        else:
-                            publish_at = dt
-                    else:
-                        # parse_datetime returned None (invalid format)
-                        print(f"Invalid datetime format for '{a['slug']}': {raw_publish_at}")
-                        publish_at = None
-                else:
-                    publish_at = None
-                    
-                # publish_at = parse_datetime(a.get("publish_at")) if a.get("publish_at") else None
-            except Exception as e:
-                print(f"Invalid publish_at in assignment '{a['slug']}': {e}")
-                publish_at = None
 
+@shared_task
+def sync_assignments_repo(full=False):
+    """
+    Single-flight wrapper around `_sync_repo`.
+
+    Only one sync per branch runs at a time (see locks.py). A run that finds
+    the lock taken leaves a "pending" flag and returns; the running sync
+    checks the flag when it is done and syncs once more, so any number of
+    ticks during a long build collapse into a single follow-up run.
+    """
+    pending_key = SYNC_PENDING_KEY.format(branch=BRANCH or "")
+
+    with single_flight(SYNC_LOCK_KEY.format(branch=BRANCH or "")) as acquired:
+        if not acquired:
+            cache.set(pending_key, True, timeout=SYNC_PENDING_TTL)
+            print("Sync already running, a follow-up run is queued")
+            return
+
+        while True:
+            started = timezone.now()
             try:
-                raw_publish_until = a.get("publish_until")
-
-                if raw_publish_until:
-                    dt = parse_datetime(raw_publish_until)
-
-                    if dt is not None:
-                        # If datetime is naive (no timezone info), make it aware
-                        if timezone.is_naive(dt):
-                            publish_until = timezone.make_aware(dt)
-                        else:
-                            publish_until = dt
-                    else:
-                        # parse_datetime returned None (invalid format)
-                        print(f"Invalid datetime format for '{a['slug']}': {raw_publish_until}")
-                        publish_until = None
-                else:
-                    publish_until = None
-
+                result = _sync_repo(full)
             except Exception as e:
-                print(f"Invalid publish_until in assignment '{a['slug']}': {e}")
-                publish_until = None
-
-            try:
-                raw_publish_result_at = a.get("publish_result_at")
-
-                if raw_publish_result_at:
-                    dt = parse_datetime(raw_publish_result_at)
-
-                    if dt is not None:
-                        # If datetime is naive (no timezone info), make it aware
-                        if timezone.is_naive(dt):
-                            publish_result_at = timezone.make_aware(dt)
-                        else:
-                            publish_result_at = dt
-                    else:
-                        # parse_datetime returned None (invalid format)
-                        print(f"Invalid datetime format for '{a['slug']}': {raw_publish_result_at}")
-                        publish_result_at = None
-                else:
-                    publish_result_at = None
+                _record_run(started, "failed", f"{type(e).__name__}: {e}")
+                raise
+            _record_run(started, result)
+            print(f"Sync {result} in {(timezone.now() - started).total_seconds():.1f}s")
+
+            # Ticks that arrived meanwhile
+            if not cache.delete(pending_key):
+                break
+            full = False
+
+    # A tick between the last check and the release
+    if cache.get(pending_key):
+        sync_assignments_repo.delay()
+
+
+def _refresh_book_links(repo, sha):
+    """Point chapters at the pages of the newly published build."""
+    chapters = _toc_entries(_toc_at(repo, sha))[0]
+    rows = []
+    for chapter in Chapter.objects.filter(slug__in=chapters).only("slug", "book_url"):
+        book_url = _book_url(chapters[chapter.slug])
+        book_url = str(book_url) if book_url else None
+        if chapter.book_url != book_url:
+            chapter.book_url = book_url
+            rows.append(chapter)
+    Chapter.objects.bulk_update(rows, ["book_url"])
+    return len(rows)
+
+
+def _build_book(sha, book_hash):
+    from git import Repo
+
+    repo = Repo(str(LOCAL_PATH))
+    workspace = export_sources(repo, sha)
+
+    print(f"JupyterBook build started for {sha[:12]}")
+    result = run_build(workspace, toc_target)
+    if result.returncode != 0:
+        print("JupyterBook build failed")
+        print("STDOUT:\n", result.stdout)
+        print("STDERR:\n", result.stderr)
+        return False
+    print("JupyterBook build successful")
+
+    served = publish(workspace, book_hash)
+
+    # Extract the text of new/changed book pages for the site search
+    changed, removed = sync_book_pages(served)
+    print(f"Book search: {changed} page(s) updated, {removed} removed")
+
+    # Cached pages and search results show book pages and links
+    links_changed = _refresh_book_links(repo, sha)
+    if links_changed or changed or removed:
+        invalidate_catalog()
+    SyncState.objects.filter(branch=BRANCH or "").update(book_hash=book_hash)
+    return True
 
-            except Exception as e:
-                print(f"Invalid publish_until in assignment '{a['slug']}': {e}")
-                publish_result_at = None
-
-            Assignment.objects.update_or_create(
-                chapter=chapter_obj,
-                slug=a["slug"],
-                defaults={
-                    "title":       a.get("title", a["slug"].replace("-", " ").title()),
-                    "order":       a.get("order", 0),
-                    "description": desc_content,
-                    "test_runner": test_content,
-                    "solution":    solution_content,
-                    "points":      a.get("points", 0),
-                    "difficulty":  a.get("difficulty", "Easy"),
-                    "publish_at": publish_at,
-                    "publish_until": publish_until,
-                    "publish_result_at": publish_result_at,
-                    "is_exam":      a.get("is_exam", False),
-                    "status":      "active",
-                }
-            )
-
-    existing_chapters = set(Chapter.objects.values_list("slug", flat=True))
-    missing_chapters = existing_chapters - repo_chapters
-    if missing_chapters:
-        Chapter.objects.filter(slug__in=missing_chapters).update(status="deleted")
-        Assignment.objects.filter(chapter__slug__in=missing_chapters).update(status="deleted")
-        print(f"Archived chapters: {', '.join(missing_chapters)}")
-
-    existing_assignments = set(Assignment.objects.values_list("chapter__slug", "slug"))
-    missing_assignments = existing_assignments - repo_assignments
-    if missing_assignments:
-        for chap_slug, ass_slug in missing_assignments:
-            Assignment.objects.filter(chapter__slug=chap_slug, slug=ass_slug).update(status="deleted")
-        print(f"Archived assignments: {', '.join(f'{c}/{a}' for c, a in missing_assignments)}")
-
-    chap_active = Chapter.objects.filter(status="active").count()
-    chap_deleted = Chapter.objects.filter(status="deleted").count()
-    assn_active = Assignment.objects.filter(status="active").count()
-    assn_deleted = Assignment.objects.filter(status="deleted").count()
 
-    print(
-        f"Sync completed successfully.\n"
-        f"Chapters — Active: {chap_active}, Deleted: {chap_deleted}\n"
-        f"Assignments — Active: {assn_active}, Deleted: {assn_deleted}"
-    )
\ No newline at end of file
+@shared_task
+def build_book(sha, book_hash):
+    """
+    Build and publish the book of commit `sha` (see book_build.py). Routed to
+    the "book" queue; like the sync, builds queued while one runs collapse
+    into one follow-up build of the newest book.
+    """
+    pending_key = BOOK_PENDING_KEY.format(branch=BRANCH or "")
+
+    with single_flight(BOOK_LOCK_KEY.format(branch=BRANCH or "")) as acquired:
+        if not acquired:
+            cache.set(pending_key, [sha, book_hash], timeout=SYNC_PENDING_TTL)
+            print("JupyterBook build already running, a follow-up build is queued")
+            return
+
+        while True:
+            _build_book(sha, book_hash)
+
+            pending = cache.get(pending_key)
+            cache.delete(pending_key)
+            if not pending or pending[1] == book_hash:
+                break
+            sha, book_hash = pending
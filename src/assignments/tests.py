@@ -1,3 +1,895 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import yaml
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from git import Actor, Repo
+
+from grader.models import Submission, UserChapterProgress
+from grader.progress import record_grade
+
+from . import assets, site_index, tasks
+from .benchmark import generate_course
+from .book import sync_book_pages
+from .book_build import html_root, publish
+from .catalog import CATALOG_VERSION_KEY, get_catalog, invalidate_catalog
+from .locks import SYNC_LOCK_KEY, SYNC_PENDING_KEY, check_shared_cache, single_flight
+from .models import Assignment, BookPage, BookSection, Chapter, SyncState
+from .search import index_assignments
+
+
+def create_chapter(number, user=None, assignments=3):
+    """A chapter with published assignments and, optionally, graded submissions."""
+    chapter = Chapter.objects.create(slug=f"chapter-{number}", title=f"Chapter {number}", order=number)
+    for i in range(assignments):
+        assignment = Assignment.objects.create(
+            chapter=chapter,
+            slug=f"assignment-{i}",
+            title=f"Assignment {i}",
+            description="<p>Loops and lists</p>",
+            order=i,
+            points=10,
+            publish_at=timezone.now() - timedelta(days=1),
+            is_exam=(i == 0),
+        )
+        if user is not None:
+            sub = Submission.objects.create(
+                user=user,
+                assignment=assignment,
+                answer_script="print(1)",
+                run_status="success",
+                grade_score=10 if i % 2 == 0 else 5,
+                grade_total=10,
+            )
+            record_grade(sub.pk)
+    return chapter
+
+
+class ChapterListTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email="student@uol.de", password="Student!123")
+        self.client.force_login(self.user)
+        self.url = reverse("assignments:chapter-list")
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_chapters(self):
+        for number in range(2):
+            create_chapter(number, self.user)
+        few = self.count_queries()
+
+        for number in range(2, 8):
+            create_chapter(number, self.user)
+        many = self.count_queries()
+
+        self.assertEqual(few, many)
+
+    def test_progress_and_flags(self):
+        create_chapter(1, self.user)
+        # Unpublished assignments do not count
+        Assignment.objects.create(
+            chapter=Chapter.objects.get(pk="chapter-1"),
+            slug="later",
+            title="Later",
+            description="",
+            publish_at=timezone.now() + timedelta(days=1),
+        )
+
+        resp = self.client.get(self.url)
+
+        chapter = resp.context["chapters"][0]
+        self.assertEqual((chapter.passed_count, chapter.total_count), (2, 3))
+        self.assertEqual((chapter.points_achieved, chapter.points_available), (25, 30))
+        self.assertTrue(chapter.has_exam)
+        self.assertEqual(len(chapter.assignments_filtered), 3)
+
+
+class ContentDeferralTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(email="reader@uol.de", password="Reader!123")
+        self.client.force_login(self.user)
+        create_chapter(1, self.user)
+
+    def selected_columns(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        # Only look at what is selected, search filters may still use description
+        return " ".join(q["sql"].split(" FROM ")[0] for q in ctx.captured_queries)
+
+    def test_lists_and_navigation_skip_heavy_content(self):
+        for url in [
+            reverse("assignments:chapter-list"),
+            reverse("assignments:chapter-assignments", kwargs={"chapter_slug": "chapter-1"}),
+        ]:
+            columns = self.selected_columns(url)
+            for field in ("description", "test_runner", "solution"):
+                self.assertNotIn(f'"assignments_assignment"."{field}"', columns, url)
+
+    def test_detail_loads_only_its_own_description(self):
+        url = reverse(
+            "assignments:assignment-detail",
+            kwargs={"chapter_slug": "chapter-1", "assignment_slug": "assignment-1"},
+        )
+        columns = self.selected_columns(url)
+        self.assertEqual(columns.count('"assignments_assignment"."description"'), 1)
+        self.assertNotIn('"assignments_assignment"."solution"', columns)
+
+        # Rendered description is a cached fragment until the sync touches the assignment
+        self.assertNotIn('"assignments_assignment"."description"', self.selected_columns(url))
+
+        assignment = Assignment.objects.get(slug="assignment-1")
+        assignment.description = "<p>Updated by the sync</p>"
+        assignment.save()
+        resp = self.client.get(url)
+        self.assertContains(resp, "Updated by the sync")
+
+
+class ChapterCardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(email="cards@uol.de", password="Cards!123")
+        self.client.force_login(self.user)
+        create_chapter(1, self.user)
+
+    def test_cards_follow_progress_and_content(self):
+        url = reverse("assignments:chapter-list")
+        self.assertContains(self.client.get(url), "25 of 30 points")
+
+        sub = Submission.objects.get(user=self.user, assignment__slug="assignment-1")
+        sub.grade_score = 10
+        sub.save()
+        record_grade(sub.pk)
+        self.assertContains(self.client.get(url), "30 of 30 points")
+
+        Chapter.objects.filter(pk="chapter-1").update(title="Renamed")
+        invalidate_catalog()
+        self.assertContains(self.client.get(url), "Renamed")
+
+
+class CatalogTests(TestCase):
+    def setUp(self):
+        self.chapter = create_chapter(1, assignments=2)
+        self.publish_at = timezone.now() + timedelta(hours=2)
+        Assignment.objects.create(
+            chapter=self.chapter, slug="later", title="Later", description="", order=5, publish_at=self.publish_at
+        )
+
+    def slugs(self):
+        return [a.slug for a in get_catalog()["assignments"].get(self.chapter.pk, [])]
+
+    def test_expires_at_the_next_publication_boundary(self):
+        self.assertEqual(get_catalog()["valid_until"], self.publish_at)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.slugs(), ["assignment-0", "assignment-1"])
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        later = self.publish_at + timedelta(seconds=1)
+        with mock.patch("assignments.catalog.timezone.now", return_value=later):
+            self.assertEqual(self.slugs(), ["assignment-0", "assignment-1", "later"])
+
+    def test_process_keeps_its_copy_until_the_version_changes(self):
+        catalog = get_catalog()
+        with mock.patch.object(cache, "get", wraps=cache.get) as cache_get:
+            self.assertIs(get_catalog(), catalog)
+        # Only the version stamp is read from the shared cache
+        self.assertEqual([c.args[0] for c in cache_get.call_args_list], [CATALOG_VERSION_KEY])
+
+        invalidate_catalog()
+        self.assertIsNot(get_catalog(), catalog)
+
+    def test_sync_invalidation(self):
+        get_catalog()
+        # Bulk updates (as the sync's archival) bypass the model signals ...
+        Assignment.objects.filter(slug="assignment-0").update(status="deleted")
+        self.assertEqual(self.slugs(), ["assignment-0", "assignment-1"])
+
+        # ... so the sync drops the catalog explicitly when it is done
+        invalidate_catalog()
+        self.assertEqual(self.slugs(), ["assignment-1"])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email="searcher@uol.de", password="Searcher!123")
+        chapter = Chapter.objects.create(slug="basics", title="Basics", order=1)
+        for i, (title, description) in enumerate([
+            ("Lists", '<p class="hint">Append items to a list &amp; sort them.</p>'),
+            ("Loops", "<p>Use a <code>for</code> loop over a list.</p>"),
+            ("Strings", "<p>Slicing strings.</p>"),
+        ]):
+            Assignment.objects.create(
+                chapter=chapter,
+                slug=title.lower(),
+                title=title,
+                description=description,
+                order=i,
+                publish_at=timezone.now() - timedelta(days=1),
+            )
+        index_assignments()
+        self.url = reverse("assignments:chapter-assignments", kwargs={"chapter_slug": "basics"})
+
+    def titles(self, query):
+        resp = self.client.get(self.url, {"q": query})
+        return [a.title for a in resp.context["assignments"]], resp
+
+    def test_ranked_prefix_matches_without_markup(self):
+        # Title matches rank above matches in the text only
+        self.assertEqual(self.titles("list")[0], ["Lists", "Loops"])
+        self.assertEqual(self.titles("loop list")[0], ["Loops"])
+        # Attributes and tag names are not searchable
+        self.assertEqual(self.titles("hint")[0], [])
+        self.assertEqual(self.titles("code")[0], [])
+
+    def test_snippets_highlight_matches(self):
+        titles, resp = self.titles("sort")
+        self.assertEqual(titles, ["Lists"])
+        self.assertContains(resp, "items to a list &amp; <mark>sort</mark> them.")
+
+
+BOOK_PAGE = """<html><head><title>{title} — Course</title></head><body>
+<nav>Navigation {title}</nav>
+<main><article class="bd-article">
+<section id="{anchor}"><h1>{title}<a class="headerlink" href="#{anchor}">#</a></h1>
+<p>{text}</p>
+</section></article></main></body></html>"""
+
+
+class SiteSearchTests(TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        (self.root / "basics").mkdir()
+        (self.root / "_static").mkdir()
+        self.write("basics/loops.html", "Loops", "loops", "A for loop repeats a block for every item.")
+        self.write("basics/strings.html", "Strings", "strings", "Strings can be sliced.")
+        self.write("_static/theme.html", "Theme", "theme", "loop loop loop")
+
+        chapter = Chapter.objects.create(slug="basics", title="Basics", order=1)
+        Assignment.objects.create(
+            chapter=chapter,
+            slug="loop-practice",
+            title="Loop practice",
+            description="<p>Write a loop.</p>",
+            publish_at=timezone.now() - timedelta(days=1),
+        )
+        index_assignments()
+
+    def write(self, path, title, anchor, text):
+        (self.root / path).write_text(BOOK_PAGE.format(title=title, anchor=anchor, text=text))
+
+    def test_only_changed_pages_are_extracted(self):
+        self.assertEqual(sync_book_pages(self.root), (2, 0))
+        self.assertEqual(sync_book_pages(self.root), (0, 0))
+
+        self.write("basics/strings.html", "Strings", "strings", "Strings are immutable.")
+        (self.root / "basics" / "loops.html").unlink()
+        self.assertEqual(sync_book_pages(self.root), (1, 1))
+
+        section = BookSection.objects.get()
+        self.assertEqual((section.page.path, section.anchor, section.title), ("basics/strings.html", "strings", "Strings"))
+        self.assertEqual(section.text, "Strings are immutable.")
+        self.assertEqual(BookPage.objects.count(), 1)
+
+    def test_search_returns_book_sections_and_assignments(self):
+        sync_book_pages(self.root)
+        invalidate_catalog()
+
+        resp = self.client.get(reverse("assignments:site-search"), {"q": "loo"})
+        results = resp.json()["results"]
+
+        self.assertEqual([(r["kind"], r["title"]) for r in results], [("book", "Loops"), ("assignment", "Loop practice")])
+        self.assertEqual(results[0]["url"], "/book/basics/loops.html#loops")
+        self.assertIn("<mark>loop</mark>", results[0]["snippet"])
+
+        # Served from memory until the catalog changes
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse("assignments:site-search"), {"q": "strings sliced"})
+        self.assertFalse([q for q in ctx.captured_queries if "bookpage" in q["sql"].lower()])
+        # ... and only the catalog's version stamp is read from the shared cache
+        with mock.patch.object(cache, "get", wraps=cache.get) as cache_get:
+            self.assertTrue(site_index.search("loop"))
+        self.assertEqual([c.args[0] for c in cache_get.call_args_list], [CATALOG_VERSION_KEY])
+
+
+def sequential_scans(plan, tables):
+    """Tables of `tables` that an EXPLAIN plan reads with a full (non-index) scan."""
+    if connection.vendor == "postgresql":
+        found = re.findall(r"Seq Scan on (\w+)", plan)
+    else:
+        # SQLite: "SCAN t" is a full scan, "SCAN t USING [COVERING] INDEX i" is not
+        found = re.findall(r"\bSCAN (\w+)\b(?! USING)", plan)
+    return sorted(set(found) & set(tables))
+
+
+class QueryPlanTests(TestCase):
+    """EXPLAIN the hot lookups on a seeded dataset; a sequential scan is a regression."""
+
+    HOT_TABLES = ["grader_submission", "assignments_assignment", "grader_userchapterprogress"]
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.users = [User.objects.create_user(email=f"user{i}@uol.de", password="Seed!123") for i in range(10)]
+        for number in range(5):
+            create_chapter(number, assignments=8)
+        assignments = list(Assignment.objects.all())
+        # Graded, apart from the last assignment's submissions
+        Submission.objects.bulk_create(
+            Submission(
+                user=user, assignment=a, answer_script="pass", grade_score=5, grade_total=10,
+                run_status="pending" if a == assignments[-1] else "success",
+            )
+            for user in cls.users
+            for a in assignments
+        )
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+
+    def assertNoSequentialScan(self, queryset):
+        plan = queryset.explain()
+        self.assertEqual(sequential_scans(plan, self.HOT_TABLES), [], plan)
+
+    def test_hot_lookups_use_indexes(self):
+        user = self.users[3]
+        assignment = Assignment.objects.order_by("pk")[12]
+
+        queries = {
+            "latest submission": Submission.objects.filter(user=user, assignment=assignment).order_by("-id")[:1],
+            "chapter navigation": Assignment.objects.published()
+            .filter(chapter_id=assignment.chapter_id)
+            .listing()
+            .order_by("order", "id"),
+            "admin submissions": Submission.objects.order_by("-updated_at")[:100],
+            "deferred grading": Submission.objects.filter(run_status="pending", task_id__isnull=True).order_by("id"),
+            "chapter progress": UserChapterProgress.objects.filter(
+                user=user, chapter__in=["chapter-0", "chapter-1"]
+            ),
+        }
+        for name, queryset in queries.items():
+            with self.subTest(name):
+                self.assertNoSequentialScan(queryset)
+
+    def test_deferred_grading_uses_the_partial_index(self):
+        plan = Submission.objects.filter(run_status="pending", task_id__isnull=True).order_by("id").explain()
+        self.assertIn("submission_unclaimed_idx", plan)
+
+
+COURSE_TOC = """chapters:
+  - slug: basics
+    title: Basics
+    order: 1
+    assignments:
+      - slug: lists
+        title: Lists
+        publish_at: "2024-01-01T00:00:00"
+      - slug: loops
+        title: Loops
+        publish_at: "2024-01-01T00:00:00"
+"""
+
+
+class CourseRepoMixin:
+    """A local course repository as `origin`, cloned into a temporary LOCAL_PATH."""
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.origin = Repo.init(self.tmp / "origin", initial_branch="main")
+        self.commit({
+            "toc.yml": COURSE_TOC,
+            "basics/lists/description.html": "<p>Lists</p>",
+            "basics/loops/description.html": "<p>Loops</p>",
+        })
+        storages = {**settings.STORAGES, "course_assets": {
+            "BACKEND": "django.core.files.storage.FileSystemStorage",
+            "OPTIONS": {"location": self.tmp / "assets"},
+        }}
+        settings_patcher = override_settings(STORAGES=storages)
+        settings_patcher.enable()
+        self.addCleanup(settings_patcher.disable)
+        patcher = mock.patch.object(assets, "ASSET_CACHE_DIR", self.tmp / "asset-cache")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        local_path = self.tmp / "clone"
+        for name, value in {
+            "REPO_URL": str(self.tmp / "origin"),
+            "BRANCH": "main",
+            "TOC_FILE_NAME": "toc.yml",
+            "LOCAL_PATH": local_path,
+        }.items():
+            patcher = mock.patch.object(tasks, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def commit(self, files, message="update"):
+        root = Path(self.origin.working_tree_dir)
+        for name, content in files.items():
+            (root / name).parent.mkdir(parents=True, exist_ok=True)
+            (root / name).write_text(content, encoding="utf-8")
+        self.origin.index.add(list(files))
+        author = Actor("Course", "course@example.com")
+        return self.origin.index.commit(message, author=author, committer=author).hexsha
+
+
+class IncrementalSyncTests(CourseRepoMixin, TestCase):
+    def synced_at(self):
+        return dict(Assignment.objects.values_list("slug", "last_synced"))
+
+    def test_unchanged_head_is_a_no_op(self):
+        tasks.sync_assignments_repo()
+        self.assertEqual(Assignment.objects.filter(status="active").count(), 2)
+        self.assertEqual(SyncState.objects.get().commit_sha, self.origin.head.commit.hexsha)
+
+        with CaptureQueriesContext(connection) as queries:
+            tasks.sync_assignments_repo()
+        self.assertLessEqual(len(queries), 2)
+
+    def test_only_changed_assignments_are_written(self):
+        tasks.sync_assignments_repo()
+        before = self.synced_at()
+
+        self.commit({"basics/loops/description.html": "<p>While loops</p>"})
+        tasks.sync_assignments_repo()
+
+        after = self.synced_at()
+        self.assertEqual(after["lists"], before["lists"])
+        self.assertGreater(after["loops"], before["loops"])
+        self.assertEqual(Assignment.objects.get(slug="loops").description, "<p>While loops</p>")
+
+    def test_toc_changes_add_and_archive_assignments(self):
+        tasks.sync_assignments_repo()
+        self.commit({"toc.yml": COURSE_TOC.replace("slug: lists", "slug: dicts").replace("Lists", "Dicts")})
+        tasks.sync_assignments_repo()
+
+        states = dict(Assignment.objects.values_list("slug", "status"))
+        self.assertEqual(states, {"lists": "deleted", "loops": "active", "dicts": "active"})
+
+    def test_unknown_last_commit_falls_back_to_a_full_sync(self):
+        tasks.sync_assignments_repo()
+        SyncState.objects.update(commit_sha="0" * 40)
+        Assignment.objects.update(title="stale")
+
+        tasks.sync_assignments_repo()
+        self.assertEqual(sorted(Assignment.objects.values_list("title", flat=True)), ["Lists", "Loops"])
+
+    def test_query_count_does_not_grow_with_the_course(self):
+        def sync_with(count):
+            entries = "".join(
+                f"      - slug: a{i}\n        publish_at: \"2024-01-01T00:00:00\"\n" for i in range(count)
+            )
+            self.commit({"toc.yml": "chapters:\n  - slug: basics\n    assignments:\n" + entries})
+            with CaptureQueriesContext(connection) as queries:
+                tasks.sync_assignments_repo(full=True)
+            return len(queries)
+
+        tasks.sync_assignments_repo()
+        small = sync_with(3)
+        # Only the number of insert batches grows
+        self.assertLess(sync_with(300) - small, 10)
+        self.assertEqual(Assignment.objects.filter(status="active").count(), 300)
+        # The two assignments of the initial TOC were archived
+        self.assertEqual(Assignment.objects.filter(status="deleted").count(), 2)
+
+
+class SyncLockTests(CourseRepoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_lease_is_renewed_while_held(self):
+        with single_flight("test:lock", lease=0.3) as acquired:
+            self.assertTrue(acquired)
+            time.sleep(0.7)
+            with single_flight("test:lock") as again:
+                self.assertFalse(again)
+        self.assertIsNone(cache.get("test:lock"))
+
+    def test_process_local_cache_is_reported(self):
+        with override_settings(CACHE_URL=""):
+            self.assertEqual([w.id for w in check_shared_cache(None)], ["assignments.W001"])
+        # The tests swap a configured Redis for locmem themselves
+        with override_settings(CACHE_URL="redis://redis:6379/2"):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_ticks_during_a_sync_collapse_into_one_follow_up(self):
+        runs = []
+
+        def sync(full=False):
+            runs.append(full)
+            if len(runs) == 1:
+                # Three ticks while the first run is busy
+                for _ in range(3):
+                    tasks.sync_assignments_repo()
+            return "unchanged"
+
+        with mock.patch.object(tasks, "_sync_repo", side_effect=sync):
+            tasks.sync_assignments_repo(full=True)
+
+        self.assertEqual(runs, [True, False])
+        self.assertIsNone(cache.get(SYNC_PENDING_KEY.format(branch="main")))
+        self.assertIsNone(cache.get(SYNC_LOCK_KEY.format(branch="main")))
+
+    def test_runs_are_recorded(self):
+        tasks.sync_assignments_repo()
+        state = SyncState.objects.get()
+        self.assertEqual(state.last_result, "synced")
+        self.assertIsNotNone(state.last_duration)
+
+        with mock.patch.object(tasks, "clone_or_pull_repo", side_effect=RuntimeError("offline")):
+            with self.assertRaises(RuntimeError):
+                tasks.sync_assignments_repo()
+        state.refresh_from_db()
+        self.assertEqual((state.last_result, state.last_error), ("failed", "RuntimeError: offline"))
+
+
+@override_settings(SYNC_WEBHOOK_SECRET="s3cret", SYNC_WEBHOOK_DEBOUNCE=30)
+class SyncWebhookTests(CourseRepoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.url = reverse("assignments:sync-webhook")
+        patcher = mock.patch("assignments.views.sync_assignments_repo.apply_async")
+        self.apply_async = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def push(self, payload=None, **headers):
+        body = json.dumps(payload or {"ref": "refs/heads/main"})
+        return self.client.post(self.url, body, content_type="application/json", headers=headers)
+
+    def test_requires_a_valid_token_or_signature(self):
+        self.assertEqual(self.push().status_code, 403)
+        self.assertEqual(self.push(Authorization="Bearer wrong").status_code, 403)
+        self.assertEqual(self.push(X_Hub_Signature_256="sha256=00").status_code, 403)
+
+        body = json.dumps({"ref": "refs/heads/main"}).encode()
+        signature = "sha256=" + hmac.new(b"s3cret", body, hashlib.sha256).hexdigest()
+        self.assertEqual(self.push(X_Hub_Signature_256=signature).status_code, 202)
+
+        with override_settings(SYNC_WEBHOOK_SECRET=""):
+            self.assertEqual(self.push(Authorization="Bearer s3cret").status_code, 404)
+
+    def test_pushes_are_debounced_and_other_branches_ignored(self):
+        for _ in range(3):
+            self.push(Authorization="Bearer s3cret")
+        self.push({"ref": "refs/heads/feature"}, Authorization="Bearer s3cret")
+        self.apply_async.assert_called_once_with(countdown=30)
+
+    def test_push_to_a_local_remote_syncs_the_change(self):
+        tasks.sync_assignments_repo()
+        self.apply_async.side_effect = lambda **kwargs: tasks.sync_assignments_repo()
+
+        self.commit({"basics/lists/description.html": "<p>Nested lists</p>"})
+        self.assertEqual(self.push(X_Gitlab_Token="s3cret").status_code, 202)
+        self.assertEqual(Assignment.objects.get(slug="lists").description, "<p>Nested lists</p>")
+
+
+BOOK_MAKEFILE = """html:
+\tmkdir -p _build/html/basics
+\tcp basics/intro.html _build/html/basics/intro.html
+\techo build >> _build/builds.log
+"""
+
+
+class BookBuildTests(CourseRepoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        settings_patcher = override_settings(BOOK_BUILD_ROOT=self.tmp / "book_build")
+        settings_patcher.enable()
+        self.addCleanup(settings_patcher.disable)
+        for name, value in {"toc_target": "html"}.items():
+            patcher = mock.patch.object(tasks, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # Run queued builds right away
+        patcher = mock.patch.object(tasks.build_book, "delay", side_effect=tasks.build_book)
+        self.delay = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.commit({
+            "toc.yml": COURSE_TOC.replace("    order: 1\n", "    order: 1\n    book: basics/intro\n"),
+            "book/Makefile": BOOK_MAKEFILE,
+            "book/basics/intro.html": BOOK_PAGE.format(title="Intro", anchor="intro", text="Variables"),
+        })
+
+    def test_build_is_published_and_linked(self):
+        tasks.sync_assignments_repo()
+
+        self.assertTrue(html_root().is_symlink())
+        self.assertIn("Variables", (html_root() / "basics" / "intro.html").read_text())
+        self.assertEqual(Chapter.objects.get().book_url, "basics/intro.html")
+        self.assertEqual(BookSection.objects.get().text, "Variables")
+
+    def test_build_only_runs_when_the_book_changed(self):
+        tasks.sync_assignments_repo()
+        self.commit({"basics/lists/description.html": "<p>Only an assignment</p>"})
+        tasks.sync_assignments_repo()
+        self.assertEqual(self.delay.call_count, 1)
+
+        self.commit({"book/basics/intro.html": BOOK_PAGE.format(title="Intro", anchor="intro", text="Functions")})
+        tasks.sync_assignments_repo()
+        self.assertEqual(self.delay.call_count, 2)
+        self.assertIn("Functions", (html_root() / "basics" / "intro.html").read_text())
+
+        # The build cache survives between builds, old releases do not pile up
+        workspace = self.tmp / "book_build" / "workspace" / "book"
+        self.assertEqual((workspace / "_build" / "builds.log").read_text().split(), ["build", "build"])
+        self.assertEqual(len(list((self.tmp / "book_build" / "releases").iterdir())), 2)
+
+    def test_changed_pages_invalidate_the_catalog(self):
+        tasks.sync_assignments_repo()
+
+        # Same links, new page text, built after the sync is done
+        self.commit({"book/basics/intro.html": BOOK_PAGE.format(title="Intro", anchor="intro", text="Functions")})
+        repo = tasks.clone_or_pull_repo()
+        version = get_catalog()["version"]
+        tasks.build_book(repo.head.commit.hexsha, tasks.book_tree_hash(repo, "HEAD"))
+        self.assertNotEqual(get_catalog()["version"], version)
+
+    def test_failed_build_keeps_serving_the_last_one(self):
+        tasks.sync_assignments_repo()
+        self.commit({"book/Makefile": "html:\n\tfalse\n"})
+        tasks.sync_assignments_repo()
+
+        self.assertIn("Variables", (html_root() / "basics" / "intro.html").read_text())
+        self.assertNotEqual(SyncState.objects.get().book_hash, tasks.book_tree_hash(self.origin, "HEAD"))
+
+
+class BookServeTests(TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        settings_patcher = override_settings(BOOK_BUILD_ROOT=self.tmp / "book_build", BOOK_SENDFILE="")
+        settings_patcher.enable()
+        self.addCleanup(settings_patcher.disable)
+
+        html = self.tmp / "workspace" / "_build" / "html"
+        (html / "_static").mkdir(parents=True)
+        (html / "_static" / "book.css").write_text("body { color: black; }\n" * 100)
+        (html / "_static" / "video.mp4").write_bytes(bytes(range(256)))
+        (html / "index.html").write_text(
+            '<link href="_static/book.css" rel="stylesheet">'
+            '<script src="_static/missing.js"></script>'
+            '<a href="https://example.com/x.css">x</a>' + "<p>Intro</p>" * 100
+        )
+        publish(self.tmp / "workspace", "abc")
+
+    def get(self, path, **headers):
+        return self.client.get(f"/book/{path}", headers=headers)
+
+    def test_assets_are_fingerprinted_and_immutable(self):
+        page = (html_root() / "index.html").read_text()
+        version = re.search(r'href="_static/book.css\?v=(\w+)"', page).group(1)
+        self.assertIn('src="_static/missing.js"', page)
+        self.assertIn('href="https://example.com/x.css"', page)
+
+        response = self.get(f"_static/book.css?v={version}")
+        self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+        gzipped = self.get(f"_static/book.css?v={version}", accept_encoding="gzip")
+        self.assertEqual(gzipped["Content-Encoding"], "gzip")
+        self.assertEqual(gzipped["Cache-Control"], "public, max-age=31536000, immutable")
+        # Only the file's own hash makes it immutable
+        self.assertEqual(self.get("_static/book.css?v=stale")["Cache-Control"], "public, max-age=3600")
+        self.assertEqual(self.get("")["Cache-Control"], "no-cache")
+
+    def test_precompressed_variant_is_negotiated(self):
+        plain = self.get("index.html")
+        gzipped = self.get("index.html", accept_encoding="gzip, deflate")
+
+        self.assertNotIn("Content-Encoding", plain)
+        self.assertEqual(gzipped["Content-Encoding"], "gzip")
+        self.assertLess(int(gzipped["Content-Length"]), int(plain["Content-Length"]))
+        self.assertNotEqual(gzipped["ETag"], plain["ETag"])
+        self.assertIn("Accept-Encoding", gzipped["Vary"])
+
+    def test_revalidation_and_ranges(self):
+        etag = self.get("_static/video.mp4")["ETag"]
+        self.assertEqual(self.get("_static/video.mp4", if_none_match=etag).status_code, 304)
+
+        partial = self.get("_static/video.mp4", range="bytes=10-19")
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial.content, bytes(range(10, 20)))
+        self.assertEqual(partial["Content-Range"], "bytes 10-19/256")
+        self.assertEqual(self.get("_static/video.mp4", range="bytes=-6").content, bytes(range(250, 256)))
+        self.assertEqual(self.get("_static/video.mp4", range="bytes=300-").status_code, 416)
+        # A range of another version of the file gets the whole new one
+        self.assertEqual(self.get("_static/video.mp4", range="bytes=0-1", if_range='"old"').status_code, 200)
+
+    def test_missing_and_outside_paths(self):
+        self.assertEqual(self.get("nope.html").status_code, 404)
+        self.assertEqual(self.get("../releases/abc/index.html").status_code, 404)
+
+    @override_settings(BOOK_SENDFILE="nginx")
+    def test_nginx_sends_the_file(self):
+        response = self.get("index.html", accept_encoding="gzip")
+        self.assertEqual(response["X-Accel-Redirect"], "/_book_build/releases/abc/index.html.gz")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response.content, b"")
+
+
+class PartialCloneTests(CourseRepoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.origin.git.config("uploadpack.allowFilter", "true")
+        self.commit({"basics/lists/data/large.csv": "x,y\n" * 1000, "basics/lists/lists.ipynb": "{}"})
+        patcher = mock.patch.object(tasks, "REPO_URL", f"file://{self.tmp / 'origin'}")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.clone = self.tmp / "clone"
+
+    def test_shallow_partial_sparse_clone(self):
+        tasks.sync_assignments_repo()
+        repo = Repo(self.clone)
+
+        self.assertEqual(repo.git.rev_list("--count", "HEAD"), "1")
+        self.assertEqual(repo.git.config("remote.origin.partialclonefilter"), "blob:none")
+        self.assertTrue((self.clone / "basics" / "lists" / "description.html").is_file())
+        self.assertFalse((self.clone / "basics" / "lists" / "data").exists())
+        self.assertFalse((self.clone / "basics" / "lists" / "lists.ipynb").exists())
+
+    def test_incremental_sync_on_truncated_history(self):
+        tasks.sync_assignments_repo()
+        self.commit({"basics/lists/description.html": "<p>Sorting</p>"})
+        self.commit({"basics/loops/description.html": "<p>Ranges</p>"})
+        tasks.sync_assignments_repo()
+
+        descriptions = dict(Assignment.objects.values_list("slug", "description"))
+        self.assertEqual(descriptions, {"lists": "<p>Sorting</p>", "loops": "<p>Ranges</p>"})
+        self.assertEqual(Repo(self.clone).git.rev_list("--count", "HEAD"), "1")
+
+    def test_sync_after_recloning_with_truncated_history(self):
+        tasks.sync_assignments_repo()
+        self.commit({"basics/lists/description.html": "<p>Sorting</p>"})
+        shutil.rmtree(self.clone)
+
+        tasks.sync_assignments_repo()
+        self.assertEqual(Assignment.objects.get(slug="lists").description, "<p>Sorting</p>")
+
+
+class AssetStoreTests(CourseRepoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.commit({
+            "basics/lists/test_runner.py": "print('v1')",
+            "basics/lists/data.csv": "a,b\n1,2\n",
+            "basics/lists/notes.md": "not a data file",
+        })
+
+    def fetched(self, version, **kwargs):
+        dest = Path(tempfile.mkdtemp(dir=self.tmp))
+        assets.fetch_assets(version, dest, **kwargs)
+        return {file.name: file.read_text() for file in dest.iterdir()}
+
+    def test_sync_publishes_versioned_assets(self):
+        tasks.sync_assignments_repo()
+        v1 = Assignment.objects.get(slug="lists").asset_version
+        self.assertEqual(self.fetched(v1), {"test_runner.py": "print('v1')", "data.csv": "a,b\n1,2\n"})
+
+        self.commit({"basics/lists/data.csv": "a,b\n3,4\n"})
+        tasks.sync_assignments_repo()
+        v2 = Assignment.objects.get(slug="lists").asset_version
+        self.assertNotEqual(v1, v2)
+
+        # Old versions stay intact for regrades; workers need no checkout
+        shutil.rmtree(self.tmp / "clone")
+        self.assertEqual(self.fetched(v1)["data.csv"], "a,b\n1,2\n")
+        self.assertEqual(self.fetched(v2)["data.csv"], "a,b\n3,4\n")
+        self.assertNotIn("test_runner.py", self.fetched(v2, exclude=("test_runner.py",)))
+
+    def test_local_cache_is_bounded(self):
+        tasks.sync_assignments_repo()
+        version = Assignment.objects.get(slug="lists").asset_version
+        with mock.patch.object(assets, "ASSET_CACHE_MAX_BYTES", 20):
+            self.fetched(version)
+        cached = list((self.tmp / "asset-cache").iterdir())
+        self.assertLessEqual(sum(file.stat().st_size for file in cached), 20)
+
+
+class SyncBenchmarkTests(TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        cache.clear()
+
+    def test_generated_course(self):
+        repo = generate_course(self.tmp / "course", chapters=2, assignments=3, data_files=2, book=True)
+        root = Path(repo.working_tree_dir)
+
+        toc = yaml.safe_load((root / "toc.yml").read_text())
+        self.assertEqual([len(c["assignments"]) for c in toc["chapters"]], [3, 3])
+        self.assertLessEqual(
+            {a["difficulty"] for c in toc["chapters"] for a in c["assignments"]},
+            {"Easy", "Intermediate", "Hard"},
+        )
+        folder = root / "chapter-001" / "assignment-002"
+        self.assertEqual(
+            sorted(p.name for p in folder.iterdir()),
+            ["data_0.csv", "data_1.csv", "description.html", "solution.py", "test_runner.py"],
+        )
+        self.assertFalse(repo.is_dirty(untracked_files=True))
+
+    def test_benchmark_times_the_phases_and_rolls_back(self):
+        results = self.tmp / "sync.jsonl"
+        options = {"chapters": 2, "assignments": 2, "book": True, "repeat": 1, "results": results}
+        out = io.StringIO()
+        call_command("benchmark_sync", stdout=out, **options)
+        call_command("benchmark_sync", stdout=out, **options)
+
+        runs = [json.loads(line) for line in results.read_text().splitlines()]
+        self.assertEqual(len(runs), 2)
+        phases = runs[0]["phases"]
+        self.assertEqual(
+            list(phases), ["clone", "initial sync", "no-op sync", "small-change sync", "full rebuild"]
+        )
+        self.assertLess(phases["no-op sync"]["queries"], phases["full rebuild"]["queries"])
+        self.assertIn("vs ", out.getvalue())
+        self.assertFalse(Chapter.objects.exists())
+        self.assertFalse(SyncState.objects.exists())
+
+    def test_benchmark_refuses_a_database_with_chapters(self):
+        Chapter.objects.create(slug="real", title="Real", order=1)
+        with self.assertRaises(CommandError):
+            call_command("benchmark_sync", chapters=1, assignments=1, repeat=1, results=self.tmp / "sync.jsonl")
+        self.assertEqual(Chapter.objects.get().status, "active")
+
+
+IMPORT_PROBE = """
+import json, sys, time
+import django
+django.setup()
+started = time.perf_counter()
+import project.urls, assignments.tasks
+print(json.dumps({"seconds": time.perf_counter() - started, "modules": sorted(sys.modules)}))
+"""
+
+
+class ImportTimeTests(TestCase):
+    # The URLconf (every view) and the task modules on top of django.setup(),
+    # in a fresh interpreter: about 0.08s, so one heavy import (GitPython
+    # alone is 0.15s) breaks the budget
+    BUDGET = 0.25
+    LAZY_MODULES = {"git", "gitdb", "path"}
+
+    def test_web_startup_stays_light(self):
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": settings.SETTINGS_MODULE}
+        env.pop("REPO_URL", None)                      # only needed by the sync itself
+        probe = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+        )
+        result = json.loads(probe.stdout.splitlines()[-1])
+
+        self.assertEqual(self.LAZY_MODULES & set(result["modules"]), set())
+        self.assertLess(result["seconds"], self.BUDGET)
@@ -6,6 +6,12 @@ app_name = 'assignments'
 urlpatterns = [
     path('', views.chapter_list, name='chapter-list'),
 
+    # Site-wide search over book sections and assignments (JSON)
+    path('search/', views.site_search, name='site-search'),
+
+    # Push notifications of the course repository (git hosting webhook / post-receive hook)
+    path('sync/webhook/', views.sync_webhook, name='sync-webhook'),
+
     # NEW route for the page that lists all assignments in a chapter
     path(
         '<slug:chapter_slug>/assignments/',
@@ -1,119 +1,111 @@
+import copy
+import hashlib
+import hmac
+import json
+
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
 from django.db import transaction
 from django.db.models import Q
-from django.http import Http404
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
 from grader.forms import SubmissionForm
-from grader.models import Submission
-from grader.tasks import run_user_code
-
+from grader.models import Submission, UserAssignmentProgress, UserChapterProgress
+from grader.precheck import precheck_submission
+from grader.progress import PASSING_THRESHOLD
+from grader.tasks import run_only, run_user_code, store_result
+from site_data.cache import get_version
+from site_data.page_cache import anonymous_page_cache
+
+from . import site_index
+from .catalog import get_catalog
 from .models import Assignment, Chapter
+from .search import search_assignments
+from .tasks import BRANCH, sync_assignments_repo
+
+# How many quick-run task ids a session may poll (see grader.views.run_status)
+MAX_SESSION_RUNS = 20
+
+# Lifetime of cached template fragments; their keys change with the content anyway
+FRAGMENT_CACHE_TTL = 60 * 60 * 24
+
+# Set while a webhook-triggered sync is waiting for its countdown
+SYNC_DEBOUNCE_KEY = "assignments:sync:webhook:debounce"
+
+
+def _search_matches(query):
+    """{assignment pk: (rank, snippet)} for a ?q= search, rank 0 is the best match."""
+    return {pk: (rank, snippet) for rank, (pk, snippet) in enumerate(search_assignments(query))}
 
-# Passing threshold for a "completed" assignment (percent)
-PASSING_THRESHOLD = 80
 
+def _matching(assignments, matches):
+    """The assignments found by a search, best match first, with a `snippet` each."""
+    found = []
+    for a in assignments:
+        if a.pk in matches:
+            a = copy.copy(a)                # catalog rows are shared, see get_catalog
+            a.search_rank, a.snippet = matches[a.pk]
+            found.append(a)
+    return sorted(found, key=lambda a: a.search_rank)
 
+
+@anonymous_page_cache(lambda: get_version("site_data"), lambda: get_catalog()["version"])
 def chapter_list(request):
     """
     Lists all chapters that have at least one published assignment. 
-    Progress per chapter is computed from the user's latest
-    submission per assignment: score >= PASSING_THRESHOLD => "passed".
-    If no score is available, we fall back to any `assignment.completion` value.
+    Progress per chapter is computed from the user's submission per
+    assignment: score >= PASSING_THRESHOLD => "passed".
+
+    Chapters and assignments come from the cached catalog (see
+    assignments.catalog); the database is only asked for the user's progress
+    rows and, when searching, for the ranked matches (see assignments.search).
     """
     query = (request.GET.get("q") or "").strip()
-
-    # Only include chapters that have at least one published assignment
-    chapters = (
-        Chapter.objects.prefetch_related("assignments")
-        .filter(assignments__publish_at__isnull=False, assignments__publish_at__lte=timezone.now(), status="active")
-#        .filter(Q(assignments__publish_until__isnull=True) | Q(assignments__publish_until__gte=timezone.now()))
-        .distinct().order_by("order")
-    )
-
-    # Apply per-chapter assignment filtering for the UI
-    for chapter in chapters:
-        published_qs = chapter.assignments.filter(
-            publish_at__isnull=False,
-            publish_at__lte=timezone.now(),
-            status="active"
+    now = timezone.now()
+    catalog = get_catalog()
+    matches = _search_matches(query) if query else None
+
+    chapters = []
+    for ch in catalog["chapters"]:
+        # The catalog is shared by the requests of this process: annotate a copy
+        ch = copy.copy(ch)
+        published_assignments = catalog["assignments"][ch.pk]
+        ch.assignments_filtered = (
+            _matching(published_assignments, matches) if query else published_assignments
         )
-        # .filter(
-        #     Q(publish_until__isnull=True) |
-        #     Q(publish_until__gte=timezone.now())
-        # )
-        if query:
-            chapter.assignments_filtered = published_qs.filter(
-                Q(title__icontains=query) | Q(description__icontains=query)
-            )
-        else:
-            chapter.assignments_filtered = published_qs
-        
-        # Determine exam and public result flags
-        exams_qs = published_qs.filter(is_exam=True)
-        chapter.has_exam = exams_qs.exists()
-        chapter.has_unpublished_results = exams_qs.filter(
-            publish_result_at__isnull=False, publish_result_at__gte=timezone.now()
-        ).exists()
-        chapter.published_qs = published_qs
-
-    chapters = [ch for ch in chapters if ch.assignments_filtered.exists()]
-    # Build chapter progress
-    chapter_progress = {}
-
-    # Collect all assignment ids across these chapters
-    all_assignment_ids = []
-    for ch in chapters:
-        all_assignment_ids.extend(a.id for a in ch.assignments.all())
-
-    latest_by_assignment = {}
-    if request.user.is_authenticated and all_assignment_ids:
-        # newest first; keep first seen per assignment_id
-        subs = (
-            Submission.objects.filter(
-                user=request.user, assignment_id__in=all_assignment_ids
-            )
-            .order_by("-id")
-            .values("assignment_id", "grade_score", "grade_total")
+        # Only include chapters that have at least one published (and matching) assignment
+        if not ch.assignments_filtered:
+            continue
+        ch.published_count = len(published_assignments)
+        exams = [a for a in published_assignments if a.is_exam]
+        ch.exam_count = len(exams)
+        ch.unpublished_results_count = sum(
+            1 for a in exams if a.publish_result_at and a.publish_result_at >= now
         )
-        for s in subs:
-            aid = s["assignment_id"]
-            if aid not in latest_by_assignment:
-                latest_by_assignment[aid] = s
+        chapters.append(ch)
 
-    for ch in chapters:
-        assigns = list(ch.published_qs)
-        total = len(assigns)
-        passed = 0
-        points_achieved = 0
-        points_available = 0
-
-        for a in assigns:
-            sub = latest_by_assignment.get(a.id)
-            score = grade_total = 0
-            if sub and sub.get("grade_total"):
-                try:
-                    pct = 100.0 * (
-                        float(sub["grade_score"]) / float(sub["grade_total"])
-                    )
-                    score = float(sub["grade_score"] or 0)
-                    grade_total = float(sub["grade_total"] or 0)
-                except Exception:
-                    pct = 0.0
-                    score = grade_total = 0
-            else:
-                # fallback to any assignment-level completion field (0..100)
-                pct = float(getattr(a, "completion", 0) or 0)
+    # Per-chapter totals are maintained incrementally by grader.progress
+    progress_by_chapter = {}
+    if request.user.is_authenticated and chapters:
+        rows = UserChapterProgress.objects.filter(
+            user=request.user, chapter__in=[ch.pk for ch in chapters]
+        ).values("chapter_id", "passed_count", "points_achieved", "points_available", "updated_at")
+        progress_by_chapter = {row["chapter_id"]: row for row in rows}
 
-            if pct >= PASSING_THRESHOLD:
-                passed += 1
+    chapter_progress = {}
+    for ch in chapters:
+        row = progress_by_chapter.get(ch.pk, {})
+        total = ch.published_count
+        passed = row.get("passed_count") or 0
+        points_achieved = row.get("points_achieved") or 0
+        points_available = row.get("points_available") or 0
 
-            # Accumulate totals
-            points_achieved += score
-            points_available += grade_total
-        
         pct_ch = int(round((passed / total) * 100)) if total else 0
 
         # Use pk (works even if the primary key is not named "id")
@@ -126,12 +118,18 @@ def chapter_list(request):
             }
 
         # Also set attributes so existing templates (chapter.progress) keep working
+        ch.has_exam = ch.exam_count > 0
+        ch.has_unpublished_results = ch.unpublished_results_count > 0
         ch.progress = pct_ch
         ch.passed_count = passed
         ch.total_count = total
         ch.points_achieved = points_achieved
         ch.points_available = points_available
 
+        # Cache keys of the rendered card (see chapter_list.html)
+        ch.content_version = catalog["version"]
+        ch.progress_version = f"{request.user.pk}:{row.get('updated_at')}"
+
     return render(
         request,
         "assignments/chapter_list.html",
@@ -140,6 +138,7 @@ def chapter_list(request):
             "query": query,
             "chapter_progress": chapter_progress,
             "passing_threshold": PASSING_THRESHOLD,
+            "fragment_ttl": FRAGMENT_CACHE_TTL,
         },
     )
 
@@ -147,36 +146,34 @@ def chapter_list(request):
 @login_required
 def assignment_detail(request, chapter_slug, assignment_slug):
     assignment = get_object_or_404(
-        Assignment, 
-        chapter__slug=chapter_slug, 
-        slug=assignment_slug, 
-        publish_at__isnull=False, 
-        publish_at__lte=timezone.now(), 
-        status="active"
+        # The description is only loaded when its cached fragment is missing
+        Assignment.objects.published().defer("description", "solution", "search_text", "search_vector"),
+        chapter__slug=chapter_slug,
+        slug=assignment_slug,
     )
     # if assignment.publish_until and assignment.publish_until < timezone.now():
     #     raise Http404("This assignment is no longer available.")
 
     # Ordered assignments in this chapter
-    assignments = Assignment.objects.filter(
-        chapter=assignment.chapter, 
-        publish_at__isnull=False, 
-        publish_at__lte=timezone.now(), 
-        status="active"
-    ).order_by("order", "id")
-
-    # .filter(
-    #     Q(publish_until__isnull=True) |
-    #     Q(publish_until__gte=timezone.now())
-    # )
+    assignments_list = get_catalog()["assignments"].get(assignment.chapter_id, [])
 
     submission_open = (
         assignment.publish_until is None or
         assignment.publish_until >= timezone.now()
     )
 
-    assignments_list = list(assignments)
-    current_index = assignments_list.index(assignment)
+    ids = [a.pk for a in assignments_list]
+    if assignment.pk not in ids:
+        # Published after the catalog was built: one more query than usual
+        assignments_list = list(
+            Assignment.objects.published()
+            .filter(chapter_id=assignment.chapter_id)
+            .select_related("chapter")
+            .listing()
+            .order_by("order", "id")
+        )
+        ids = [a.pk for a in assignments_list]
+    current_index = ids.index(assignment.pk)
 
     prev_assignment = assignments_list[current_index - 1] if current_index > 0 else None
     next_assignment = (
@@ -193,7 +190,22 @@ def assignment_detail(request, chapter_slug, assignment_slug):
         .first()
     )
 
-    if request.method == "POST":
+    run_task_id = None
+    run_error = None
+
+    if request.method == "POST" and request.POST.get("action") == "run":
+        # Quick "Run": execute the program only, on the fast lane; nothing is graded
+        form = SubmissionForm(request.POST)
+        if submission_open and form.is_valid():
+            code = form.cleaned_data["answer_script"]
+            rejected = precheck_submission(code)
+            if rejected:
+                run_error = rejected["user"]["stderr"]
+            else:
+                run_task_id = run_only.delay(assignment.id, code).id
+                runs = request.session.get("run_task_ids", [])
+                request.session["run_task_ids"] = (runs + [run_task_id])[-MAX_SESSION_RUNS:]
+    elif request.method == "POST":
         if not submission_open:
             messages.error(request, "⏰ The submission period has ended.")
             return redirect(
@@ -211,6 +223,39 @@ def assignment_detail(request, chapter_slug, assignment_slug):
             new_sub.user = request.user
             new_sub.assignment = assignment
             new_sub.run_status = "pending"
+
+            # Empty code, syntax errors and banned imports are graded right here,
+            # unless grades are only released with the deferred batch
+            rejected = (
+                None
+                if assignment.grading_deferred
+                else precheck_submission(new_sub.answer_script, assignment.points)
+            )
+            if rejected:
+                new_sub.task_id = None
+                new_sub.save()
+                store_result(new_sub.pk, rejected)
+                return redirect(
+                    "assignments:assignment-detail",
+                    chapter_slug=chapter_slug,
+                    assignment_slug=assignment_slug,
+                )
+
+            if assignment.grading_deferred:
+                # Stored only; graded in one batch after the deadline
+                # (see grader.tasks.grade_deferred_submissions).
+                new_sub.task_id = None
+                new_sub.save()
+                messages.success(
+                    request,
+                    "✅ Your submission has been saved. It will be graded after the submission deadline.",
+                )
+                return redirect(
+                    "assignments:assignment-detail",
+                    chapter_slug=chapter_slug,
+                    assignment_slug=assignment_slug,
+                )
+
             new_sub.save()
 
             def _enqueue():
@@ -218,6 +263,7 @@ def assignment_detail(request, chapter_slug, assignment_slug):
                     new_sub.id,
                     code=new_sub.answer_script,
                     test_runner=assignment.test_runner or "",
+                    asset_version=assignment.asset_version,
                 )
                 Submission.objects.filter(pk=new_sub.id).update(
                     task_id=async_result.id
@@ -249,6 +295,10 @@ def assignment_detail(request, chapter_slug, assignment_slug):
             "score": submission.grade_score if submission else None,
             "total": submission.grade_total if submission else assignment.points,
             "is_exam": assignment.is_exam,
+            "grading_deferred": assignment.grading_deferred,
+            "run_task_id": run_task_id,
+            "run_error": run_error,
+            "fragment_ttl": FRAGMENT_CACHE_TTL,
         },
     )
 
@@ -256,33 +306,28 @@ def assignment_detail(request, chapter_slug, assignment_slug):
 def chapter_assignments(request, chapter_slug):
     """
     Page that lists all assignments for a single chapter.
-    Supports optional ?q= filtering (title/description).
+    Supports optional ?q= full-text search (title/description), best match first.
     """
     user = request.user
     query = (request.GET.get("q") or "").strip()
-    chapter = get_object_or_404(Chapter, slug=chapter_slug)
-
-    assignments_qs = chapter.assignments.filter(
-        publish_at__isnull=False,
-        publish_at__lte=timezone.now(),
-        status="active"
-    ).order_by("order", "id")
-
-    # .filter(
-    #     Q(publish_until__isnull=True) |
-    #     Q(publish_until__gte=timezone.now())
-    # )
+    catalog = get_catalog()
+    chapter = next((ch for ch in catalog["chapters"] if ch.slug == chapter_slug), None)
+    if chapter is None:
+        # Not in the catalog: the chapter exists but has nothing published
+        chapter = get_object_or_404(Chapter, slug=chapter_slug)
+    # Copies: the catalog is shared by the requests of this process
+    chapter = copy.copy(chapter)
+    assignments = [copy.copy(a) for a in catalog["assignments"].get(chapter.pk, [])]
+
     # Indicate if chapter has any exam assignments
-    chapter.has_exam = assignments_qs.filter(is_exam=True).exists()
+    chapter.has_exam = any(a.is_exam for a in assignments)
 
     if query:
-        assignments_qs = assignments_qs.filter(
-            Q(title__icontains=query) | Q(description__icontains=query)
-        )
+        assignments = _matching(assignments, _search_matches(query))
 
     # Determine for each assignment whether results are public
     now = timezone.now()
-    for assignment in assignments_qs:
+    for assignment in assignments:
         if assignment.is_exam and assignment.publish_result_at:
             assignment.show_output = now >= assignment.publish_result_at
         else:
@@ -291,26 +336,76 @@ def chapter_assignments(request, chapter_slug):
     # Latest score per assignment for current user
     user_scores = {}
     if user.is_authenticated:
-        subs = (
-            Submission.objects.filter(user=user, assignment__in=assignments_qs)
-            .order_by("-id")
-            .values("assignment_id", "grade_score", "grade_total")
-        )
-        for s in subs:
-            aid = s["assignment_id"]
-            if aid not in user_scores:
-                user_scores[aid] = {
-                    "grade_score": s["grade_score"],
-                    "grade_total": s["grade_total"],
-                }
+        user_scores = {
+            row["assignment_id"]: {"grade_score": row["grade_score"], "grade_total": row["grade_total"]}
+            for row in UserAssignmentProgress.objects.filter(
+                user=user, assignment_id__in=[a.pk for a in assignments]
+            ).values("assignment_id", "grade_score", "grade_total")
+        }
 
     return render(
         request,
         "assignments/chapter_assignments.html",
         {
             "chapter": chapter,
-            "assignments": assignments_qs,
+            "assignments": assignments,
             "query": query,
             "user_scores": user_scores,
         },
     )
+
+
+def site_search(request):
+    """
+    JSON search over book sections and published assignments, best match
+    first. Served from the in-memory index (see assignments.site_index).
+    """
+    query = (request.GET.get("q") or "").strip()
+    try:
+        limit = min(max(int(request.GET.get("limit", 20)), 1), 50)
+    except ValueError:
+        limit = 20
+    return JsonResponse({"query": query, "results": site_index.search(query, limit=limit)})
+
+
+def _webhook_authenticated(request, secret):
+    """A shared token (Bearer / X-Gitlab-Token) or a GitHub/Gitea HMAC signature of the body."""
+    signature = request.headers.get("X-Hub-Signature-256", "")
+    if signature:
+        expected = "sha256=" + hmac.new(secret.encode(), request.body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(signature, expected)
+
+    auth = request.headers.get("Authorization", "")
+    token = auth.removeprefix("Bearer ") if auth.startswith("Bearer ") else request.headers.get("X-Gitlab-Token", "")
+    return bool(token) and hmac.compare_digest(token, secret)
+
+
+@csrf_exempt
+@require_POST
+def sync_webhook(request):
+    """
+    Queue a course sync after a push. Pushes to other branches are ignored
+    (if the payload names one), and all pushes within SYNC_WEBHOOK_DEBOUNCE
+    seconds share one sync that starts when the window closes.
+
+    Works with any git remote, e.g. from a post-receive hook:
+    curl -X POST -H "Authorization: Bearer $SECRET" https://<host>/assignments/sync/webhook/
+    """
+    secret = settings.SYNC_WEBHOOK_SECRET
+    if not secret:
+        raise Http404
+    if not _webhook_authenticated(request, secret):
+        return JsonResponse({"error": "Invalid signature"}, status=403)
+
+    try:
+        ref = json.loads(request.body or b"{}").get("ref")
+    except (ValueError, AttributeError):
+        ref = None
+    if ref and BRANCH and ref != f"refs/heads/{BRANCH}":
+        return JsonResponse({"queued": False, "reason": f"ignored {ref}"})
+
+    debounce = settings.SYNC_WEBHOOK_DEBOUNCE
+    queued = cache.add(SYNC_DEBOUNCE_KEY, True, timeout=debounce)
+    if queued:
+        sync_assignments_repo.apply_async(countdown=debounce)
+    return JsonResponse({"queued": queued}, status=202)
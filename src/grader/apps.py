@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class GraderConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'grader'
+
+    def ready(self):
+        import grader.signals
@@ -4,7 +4,7 @@ from pathlib import Path
 from django.core.management.base import BaseCommand
 
 from grader.models import Submission
-from grader.tasks import run_user_code
+from grader.tasks import BATCH_SIZE, run_batch, run_user_code
 
 
 class Command(BaseCommand):
@@ -21,6 +21,17 @@ class Command(BaseCommand):
             type=int,
             help="Only re-evaluate submissions for a specific user ID.",
         )
+        parser.add_argument(
+            "--batch",
+            action="store_true",
+            help="Grade many submissions of the same assignment per sandbox session.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help=f"Submissions per sandbox session in --batch mode (default: {BATCH_SIZE}).",
+        )
     def handle(self, *args, **options):
         assignment_id = options.get("assignment")
         user_id = options.get("user")
@@ -31,20 +42,26 @@ class Command(BaseCommand):
         if user_id:
             qs = qs.filter(user_id=user_id)
         
+        if options.get("batch"):
+            self.handle_batch(qs, options["batch_size"])
+            return
+
         for sub in qs:
             code = sub.answer_script
             assignment_dir = Path(os.environ.get("LOCAL_PATH", "/app/python_course_repo"))
             print("Assignment:", sub.assignment.slug)
             print(f"Sub ID: {sub.id}")
 
+            # The synced asset version if there is one, else the working copy
+            version = sub.assignment.asset_version
             test_file = assignment_dir / sub.assignment.chapter.slug / sub.assignment.slug / "test_runner.py"
             try:
-                test_runner = test_file.read_text(encoding="utf-8")
+                test_runner = "" if version else test_file.read_text(encoding="utf-8")
             except Exception as e:
                 print(e)
                 test_runner = ""
             
-            res = run_user_code.delay(sub.id, code, test_runner).get()
+            res = run_user_code.delay(sub.id, code, test_runner, asset_version=version).get()
             sub.grade_score = res["grading"]["score"]
             print("Score:", sub.grade_score)
             sub.grade_total = res["grading"]["total"]
@@ -55,3 +72,31 @@ class Command(BaseCommand):
             sub.save()
 
         print(self.style.SUCCESS("Done."))
+
+    def handle_batch(self, qs, batch_size):
+        # run_batch stores every grade itself; chunks of one assignment share a sandbox
+        assignment_dir = Path(os.environ.get("LOCAL_PATH", "/app/python_course_repo"))
+        by_assignment = {}
+        for sub in qs.select_related("assignment__chapter").order_by("assignment_id", "id"):
+            by_assignment.setdefault(sub.assignment, []).append(sub.id)
+
+        for assignment, ids in by_assignment.items():
+            print("Assignment:", assignment.slug)
+            # None: run_batch grades the assignment's asset version
+            test_runner = None
+            if not assignment.asset_version:
+                test_file = assignment_dir / assignment.chapter.slug / assignment.slug / "test_runner.py"
+                try:
+                    test_runner = test_file.read_text(encoding="utf-8")
+                except Exception as e:
+                    print(e)
+                    test_runner = ""
+            pending = [
+                run_batch.delay(ids[i:i + batch_size], test_runner)
+                for i in range(0, len(ids), batch_size)
+            ]
+            for res in pending:
+                for sub_id, grade_pct in res.get().items():
+                    print(f"Sub ID: {sub_id}  Grade: {grade_pct}%")
+
+        print(self.style.SUCCESS("Done."))
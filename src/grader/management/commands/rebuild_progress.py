@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from grader.progress import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-user progress tables from all submissions"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of rows inserted per query.",
+        )
+
+    def handle(self, *args, **options):
+        assignments, chapters = rebuild(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt progress: {assignments} assignment rows, {chapters} chapter rows."
+        ))
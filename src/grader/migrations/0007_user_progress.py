@@ -0,0 +1,93 @@
+# Generated by Django 5.1.15 on 2026-10-19 17:18
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_progress(apps, schema_editor):
+    # Same as grader.progress.rebuild(), on the historical models
+    PASSING_THRESHOLD = 80
+
+    Submission = apps.get_model("grader", "Submission")
+    UserAssignmentProgress = apps.get_model("grader", "UserAssignmentProgress")
+    UserChapterProgress = apps.get_model("grader", "UserChapterProgress")
+
+    chapters = {}
+    now = django.utils.timezone.now()
+    for sub in Submission.objects.select_related("assignment").iterator():
+        score, total = sub.grade_score, sub.grade_total
+        passed = bool(total) and 100.0 * (score or 0) / total >= PASSING_THRESHOLD
+        UserAssignmentProgress.objects.create(
+            user_id=sub.user_id,
+            assignment_id=sub.assignment_id,
+            chapter_id=sub.assignment.chapter_id,
+            grade_score=score,
+            grade_total=total,
+            passed=passed,
+        )
+        a = sub.assignment
+        if a.status != "active" or a.publish_at is None or a.publish_at > now:
+            continue
+        row = chapters.setdefault((sub.user_id, a.chapter_id), [0, 0.0, 0.0])
+        row[0] += passed
+        if total:
+            row[1] += score or 0
+            row[2] += total
+
+    UserChapterProgress.objects.bulk_create(
+        UserChapterProgress(
+            user_id=user_id,
+            chapter_id=chapter_id,
+            passed_count=passed,
+            points_achieved=achieved,
+            points_available=available,
+        )
+        for (user_id, chapter_id), (passed, achieved, available) in chapters.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assignments', '0012_assignment_defer_grading'),
+        ('grader', '0006_submission_result_output'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserAssignmentProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grade_score', models.FloatField(blank=True, null=True)),
+                ('grade_total', models.FloatField(blank=True, null=True)),
+                ('passed', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_progress', to='assignments.assignment')),
+                ('chapter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='assignments.chapter')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='assignment_progress', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'chapter'], name='grader_user_user_id_8d1233_idx')],
+                'unique_together': {('user', 'assignment')},
+            },
+        ),
+        migrations.CreateModel(
+            name='UserChapterProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('passed_count', models.PositiveIntegerField(default=0)),
+                ('points_achieved', models.FloatField(default=0)),
+                ('points_available', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('chapter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_progress', to='assignments.chapter')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chapter_progress', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'chapter')},
+            },
+        ),
+        migrations.RunPython(populate_progress, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.15 on 2026-10-19 17:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assignments', '0015_hot_lookup_indexes'),
+        ('grader', '0007_user_progress'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['-updated_at'], name='submission_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(condition=models.Q(('run_status', 'pending'), ('task_id__isnull', True)), fields=['assignment', 'id'], name='submission_unclaimed_idx'),
+        ),
+    ]
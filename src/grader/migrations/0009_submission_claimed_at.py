@@ -0,0 +1,25 @@
+# Generated by Django 5.1.15 on 2026-10-19 18:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assignments', '0019_assignment_asset_version'),
+        ('grader', '0008_hot_lookup_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submission',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(condition=models.Q(('claimed_at__isnull', False)), fields=['claimed_at'], name='submission_claimed_idx'),
+        ),
+    ]
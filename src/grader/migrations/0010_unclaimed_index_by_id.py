@@ -0,0 +1,24 @@
+# Generated by Django 5.1.15 on 2026-10-19 18:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assignments', '0020_index_existing_assignments'),
+        ('grader', '0009_submission_claimed_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='submission',
+            name='submission_unclaimed_idx',
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(condition=models.Q(('run_status', 'pending'), ('task_id__isnull', True)), fields=['id'], name='submission_unclaimed_idx'),
+        ),
+    ]
@@ -1,7 +1,7 @@
 from django.conf import settings
 from django.db import models
 
-from assignments.models import Assignment
+from assignments.models import Assignment, Chapter
 
 
 class Submission(models.Model):
@@ -18,6 +18,8 @@ class Submission(models.Model):
     answer_script    = models.TextField(help_text="The user’s submitted solution")
     result_output = models.TextField(blank=True, null=True, help_text="Full test runner output")
     task_id = models.CharField(max_length=255, blank=True, null=True)
+    # When deferred grading claimed the row for task_id (see grader.tasks.dispatch_batches)
+    claimed_at = models.DateTimeField(blank=True, null=True)
     run_status = models.CharField(
         max_length=20,
         choices=[("pending","pending"),("success","success"),("error","error")],
@@ -32,6 +34,85 @@ class Submission(models.Model):
     class Meta:
         unique_together = (("user", "assignment"),)
         ordering = ["-updated_at"]
+        indexes = [
+            # Default ordering, admin change list
+            models.Index(fields=["-updated_at"], name="submission_updated_idx"),
+            # Deferred exam grading picks unclaimed pending rows in id order
+            models.Index(
+                fields=["id"],
+                name="submission_unclaimed_idx",
+                condition=models.Q(run_status="pending", task_id__isnull=True),
+            ),
+            # Claims whose batch never finished are released after a timeout
+            models.Index(
+                fields=["claimed_at"],
+                name="submission_claimed_idx",
+                condition=models.Q(claimed_at__isnull=False),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username} → {self.assignment} @ {self.updated_at:%Y-%m-%d %H:%M}"
+
+
+class UserAssignmentProgress(models.Model):
+    """
+    Denormalized grade of one user on one assignment, kept in sync by
+    grader.progress whenever a grade is written.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="assignment_progress",
+    )
+    assignment = models.ForeignKey(
+        Assignment,
+        on_delete=models.CASCADE,
+        related_name="user_progress",
+    )
+    chapter = models.ForeignKey(
+        Chapter,
+        on_delete=models.CASCADE,
+        related_name="+",
+    )
+    grade_score = models.FloatField(blank=True, null=True)
+    grade_total = models.FloatField(blank=True, null=True)
+    passed = models.BooleanField(default=False)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = (("user", "assignment"),)
+        indexes = [models.Index(fields=["user", "chapter"])]
+
+    def __str__(self):
+        return f"{self.user} → {self.assignment}: {self.grade_score}/{self.grade_total}"
+
+
+class UserChapterProgress(models.Model):
+    """
+    Per-user totals of a chapter over its active assignments, recomputed from
+    UserAssignmentProgress on every grade write and when assignments are
+    archived or restored by the sync.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="chapter_progress",
+    )
+    chapter = models.ForeignKey(
+        Chapter,
+        on_delete=models.CASCADE,
+        related_name="user_progress",
+    )
+    passed_count = models.PositiveIntegerField(default=0)
+    points_achieved = models.FloatField(default=0)
+    points_available = models.FloatField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = (("user", "chapter"),)
+
+    def __str__(self):
+        return f"{self.user} → {self.chapter}: {self.passed_count} passed"
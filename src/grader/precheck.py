@@ -0,0 +1,72 @@
+"""
+Cheap in-process checks that run before a submission is queued.
+
+Submissions that are empty, do not compile or import a banned module can be
+graded right away: there is no point in sending them through the broker and
+two sandbox runs just to report the same error.
+"""
+import ast
+import traceback
+
+# Modules the sandbox would block or that only make sense for escaping it
+BANNED_IMPORTS = {"ctypes", "multiprocessing", "socket", "subprocess"}
+
+
+def _imported_modules(tree):
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                yield node.lineno, alias.name.split(".")[0]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            yield node.lineno, node.module.split(".")[0]
+        elif (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and node.func.id == "__import__"
+            and node.args
+            and isinstance(node.args[0], ast.Constant)
+            and isinstance(node.args[0].value, str)
+        ):
+            yield node.lineno, node.args[0].value.split(".")[0]
+
+
+def _rejection(message: str, total: float) -> dict:
+    # Same shape as the payload of grader.tasks.run_user_code
+    return {
+        "status": "success",
+        "user": {"stdout": "", "stderr": message, "exit_code": 1},
+        "grading": {"grade_pct": 0.0, "score": 0.0, "total": float(total or 0), "output": message, "errors": [message]},
+        "images": [],
+    }
+
+
+def precheck_submission(code: str, total: float = 0):
+    """
+    Return a graded run payload (score 0) if `code` can be rejected without
+    running it, otherwise None.
+    """
+    if not (code or "").strip():
+        return _rejection("Your submission is empty.", total)
+
+    try:
+        tree = ast.parse(code, filename="user_submission.py")
+        # Some errors ("return" outside a function, ...) only show up when compiling
+        compile(tree, "user_submission.py", "exec")
+    except (SyntaxError, ValueError) as e:
+        message = "".join(traceback.format_exception_only(type(e), e)).rstrip()
+        return _rejection(message, total)
+    except (RecursionError, MemoryError):
+        # Too deeply nested to check here: the sandbox runs it as usual
+        return None
+
+    banned = sorted(
+        f"line {lineno}: {module}"
+        for lineno, module in _imported_modules(tree)
+        if module in BANNED_IMPORTS
+    )
+    if banned:
+        return _rejection(
+            "Importing these modules is not allowed: " + ", ".join(banned), total
+        )
+
+    return None
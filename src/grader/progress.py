@@ -0,0 +1,165 @@
+"""
+Incrementally maintained progress tables (UserAssignmentProgress and
+UserChapterProgress).
+
+Progress pages read these rows instead of re-aggregating raw submissions on
+every request. They are updated:
+
+- for one user and assignment whenever a grade is written (`record_grade`)
+  or a submission is deleted (`forget_grade`),
+- for whole chapters when the sync archives, restores or (un)publishes
+  assignments (`refresh_chapters`), and when a future `publish_at` passes
+  (`refresh_published_between`, run every minute by
+  grader.tasks.refresh_published_progress),
+- from scratch by `manage.py rebuild_progress` (`rebuild`).
+
+Submissions can only be made to published assignments, so a chapter's totals
+only move when the sync changes an assignment's status or publish date, or
+when an assignment that already has grades (its date was moved back) becomes
+published.
+"""
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from assignments.models import Assignment
+
+from .models import Submission, UserAssignmentProgress, UserChapterProgress
+
+# Passing threshold for a "completed" assignment (percent)
+PASSING_THRESHOLD = 80
+
+
+def is_passed(grade_score, grade_total):
+    if not grade_total:
+        return False
+    return 100.0 * float(grade_score or 0) / float(grade_total) >= PASSING_THRESHOLD
+
+
+def _chapter_totals(filters):
+    """Per (user, chapter) totals over published, active assignments."""
+    graded = Q(grade_total__gt=0)
+    return (
+        UserAssignmentProgress.objects.filter(
+            filters,
+            assignment__status="active",
+            assignment__publish_at__isnull=False,
+            assignment__publish_at__lte=timezone.now(),
+        )
+        .values("user_id", "chapter_id")
+        .annotate(
+            passed_count=Count("id", filter=Q(passed=True)),
+            points_achieved=Sum("grade_score", filter=graded),
+            points_available=Sum("grade_total", filter=graded),
+        )
+        .order_by()
+    )
+
+
+def _write_chapter_rows(filters):
+    # Callers delete the rows they recompute first, so this is a plain insert
+    totals = list(_chapter_totals(filters))
+    rows = [
+        UserChapterProgress(
+            user_id=row["user_id"],
+            chapter_id=row["chapter_id"],
+            passed_count=row["passed_count"],
+            points_achieved=row["points_achieved"] or 0,
+            points_available=row["points_available"] or 0,
+        )
+        for row in totals
+    ]
+    return len(UserChapterProgress.objects.bulk_create(rows))
+
+
+def _refresh_user_chapter(user_id, chapter_id):
+    UserChapterProgress.objects.filter(user_id=user_id, chapter_id=chapter_id).delete()
+    _write_chapter_rows(Q(user_id=user_id, chapter_id=chapter_id))
+
+
+def record_grade(submission_id: int):
+    """Bring the progress rows of one submission's user and chapter up to date."""
+    sub = (
+        Submission.objects.filter(pk=submission_id)
+        .values("user_id", "assignment_id", "assignment__chapter_id", "grade_score", "grade_total")
+        .first()
+    )
+    if sub is None:
+        return
+
+    with transaction.atomic():
+        UserAssignmentProgress.objects.update_or_create(
+            user_id=sub["user_id"],
+            assignment_id=sub["assignment_id"],
+            defaults={
+                "chapter_id": sub["assignment__chapter_id"],
+                "grade_score": sub["grade_score"],
+                "grade_total": sub["grade_total"],
+                "passed": is_passed(sub["grade_score"], sub["grade_total"]),
+            },
+        )
+        _refresh_user_chapter(sub["user_id"], sub["assignment__chapter_id"])
+
+
+def forget_grade(user_id: int, assignment_id: int):
+    """Drop the progress of a deleted submission."""
+    with transaction.atomic():
+        row = UserAssignmentProgress.objects.filter(user_id=user_id, assignment_id=assignment_id).first()
+        if row is not None:
+            row.delete()
+            _refresh_user_chapter(user_id, row.chapter_id)
+
+
+def refresh_chapters(chapter_ids):
+    """Recompute the chapter rows of every user for these chapters."""
+    chapter_ids = set(chapter_ids)
+    if not chapter_ids:
+        return
+
+    with transaction.atomic():
+        UserChapterProgress.objects.filter(chapter_id__in=chapter_ids).delete()
+        _write_chapter_rows(Q(chapter_id__in=chapter_ids))
+
+
+def refresh_published_between(since, until):
+    """Refresh the chapters with an active assignment published in (since, until]."""
+    chapter_ids = set(
+        Assignment.objects.filter(status="active", publish_at__gt=since, publish_at__lte=until)
+        .values_list("chapter_id", flat=True)
+    )
+    refresh_chapters(chapter_ids)
+    return len(chapter_ids)
+
+
+def rebuild(batch_size: int = 1000):
+    """Recompute every progress row from the submissions table."""
+    with transaction.atomic():
+        UserChapterProgress.objects.all().delete()
+        UserAssignmentProgress.objects.all().delete()
+
+        rows = (
+            UserAssignmentProgress(
+                user_id=sub["user_id"],
+                assignment_id=sub["assignment_id"],
+                chapter_id=sub["assignment__chapter_id"],
+                grade_score=sub["grade_score"],
+                grade_total=sub["grade_total"],
+                passed=is_passed(sub["grade_score"], sub["grade_total"]),
+            )
+            for sub in Submission.objects.values(
+                "user_id", "assignment_id", "assignment__chapter_id", "grade_score", "grade_total"
+            ).iterator(chunk_size=batch_size)
+        )
+        created = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                created += len(UserAssignmentProgress.objects.bulk_create(batch))
+                batch = []
+        if batch:
+            created += len(UserAssignmentProgress.objects.bulk_create(batch))
+
+        chapters = _write_chapter_rows(Q())
+
+    return created, chapters
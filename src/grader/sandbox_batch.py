@@ -0,0 +1,198 @@
+"""
+Batch runner executed *inside* the sandbox container.
+
+`grader.tasks.run_batch` copies this file next to one folder per submission and
+starts it as the container's main program, so N submissions share a single
+container start-up. Every submission still gets:
+
+- its own forked child process with a CPU limit and its own session; memory
+  is capped for the whole container (`docker run --memory`, as for single
+  runs), the child is the first the OOM killer picks so the runner survives,
+- its own uid (GRADER_UID_BASE + position in the batch), so it can neither
+  touch other workspaces nor signal or inspect the runner,
+- its own fresh workspace that only exists while it runs,
+- its own wall-clock timeouts for Phase A (student program) and Phase B (tests).
+
+After each phase every process of that uid is killed, daemons included, and
+the shared scratch dirs (/tmp, ...) are wiped before the next submission.
+
+One JSON object per submission is printed to stdout as soon as it is done, so
+the grader can store results while the rest of the batch is still running.
+Each line is prefixed with an HMAC under the batch key, which the grader
+writes to KEY_FILE and the runner removes before the first child starts.
+
+Only the standard library is used here: the sandbox image has no app code.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+from pathlib import Path
+
+TIMEOUT_USER = int(os.environ.get("GRADER_TIMEOUT_USER", "10"))
+TIMEOUT_TESTS = int(os.environ.get("GRADER_TIMEOUT_TESTS", "10"))
+MAX_IMAGE_SIZE = int(os.environ.get("GRADER_MAX_IMAGE_SIZE", str(2 * 1024 * 1024)))
+MAX_IMAGE_COUNT = int(os.environ.get("GRADER_MAX_IMAGE_COUNT", "3"))
+IMAGE_EXTS = {".png", ".jpg", ".jpeg", ".svg"}
+
+# First uid of the children; 0 runs them as the runner's own user (no root)
+UID_BASE = int(os.environ.get("GRADER_UID_BASE", "20000"))
+# World-writable dirs that are emptied between two submissions
+SCRATCH_DIRS = [Path(d) for d in os.environ.get("GRADER_SCRATCH_DIRS", "/tmp,/var/tmp,/dev/shm").split(",") if d]
+
+WORK_ROOT = Path.cwd()
+RUN_DIR = WORK_ROOT / "_run"
+KEY_FILE = WORK_ROOT / ".batch_key"
+
+
+def _become(uid):
+    os.setgroups([])
+    os.setgid(uid)
+    os.setuid(uid)
+
+
+def _apply_limits(uid):
+    # Runs in the forked child right before exec. No RLIMIT_AS: numpy & co.
+    # reserve far more address space than they use; --memory caps what is used
+    try:
+        with open("/proc/self/oom_score_adj", "w") as f:
+            f.write("1000")
+    except OSError:
+        pass
+    cpu = TIMEOUT_USER + TIMEOUT_TESTS
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu))
+    if uid:
+        _become(uid)
+
+
+def _kill_all(proc, uid):
+    """Kill the process group of `proc` and, with a uid of its own, everything running under it."""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    if not uid:
+        return
+    # kill(-1) as that uid reaches processes that left the group (setsid, double fork)
+    for _ in range(2):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _become(uid)
+                os.kill(-1, signal.SIGKILL)
+            except OSError:
+                pass
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+
+def _run(script, cwd, timeout, uid):
+    proc = subprocess.Popen(
+        [sys.executable, script],
+        cwd=cwd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        env={**os.environ, "HOME": str(cwd)},
+        preexec_fn=lambda: _apply_limits(uid),
+        start_new_session=True,
+    )
+    try:
+        stdout, stderr = proc.communicate(timeout=timeout)
+        result = {"stdout": stdout, "stderr": stderr, "exit_code": proc.returncode, "timed_out": False}
+    except subprocess.TimeoutExpired:
+        _kill_all(proc, uid)
+        stdout, stderr = proc.communicate()
+        return {"stdout": stdout or "", "stderr": stderr or "", "exit_code": -1, "timed_out": True}
+    # Background processes of a program that exited normally must not outlive it
+    _kill_all(proc, uid)
+    return result
+
+
+def _wipe_scratch():
+    for scratch in SCRATCH_DIRS:
+        if not scratch.is_dir():
+            continue
+        for entry in scratch.iterdir():
+            if entry.is_dir() and not entry.is_symlink():
+                shutil.rmtree(entry, ignore_errors=True)
+            else:
+                entry.unlink(missing_ok=True)
+
+
+def _images(workspace):
+    images = []
+    for file in sorted(workspace.iterdir()):
+        # The student owns the workspace: never follow its links as root
+        if file.suffix.lower() not in IMAGE_EXTS or file.is_symlink() or not file.is_file():
+            continue
+        if len(images) >= MAX_IMAGE_COUNT:
+            break
+        data = file.read_bytes()
+        if len(data) > MAX_IMAGE_SIZE:
+            continue
+        images.append({
+            "name": file.name,
+            "data_uri": f"data:image/{file.suffix[1:]};base64,{base64.b64encode(data).decode('utf-8')}",
+        })
+    return images
+
+
+def _load_inputs(names):
+    # Read every submission into memory and remove its folder, so a student
+    # program can never see another student's files while it runs.
+    inputs = []
+    for name in names:
+        folder = WORK_ROOT / name
+        files = {p.name: p.read_bytes() for p in folder.iterdir() if p.is_file()}
+        shutil.rmtree(folder, ignore_errors=True)
+        inputs.append((name, files))
+    return inputs
+
+
+def _read_key():
+    try:
+        key = KEY_FILE.read_bytes()
+    except FileNotFoundError:
+        return b""
+    KEY_FILE.unlink()
+    return key
+
+
+def main(names):
+    key = _read_key()
+    if UID_BASE:
+        # Children may pass through /work to their own workspace, nothing else
+        os.chmod(WORK_ROOT, 0o711)
+    RUN_DIR.mkdir(mode=0o711, exist_ok=True)
+
+    for index, (name, files) in enumerate(_load_inputs(names)):
+        uid = UID_BASE + index if UID_BASE else 0
+        workspace = RUN_DIR / name
+        workspace.mkdir(mode=0o700)
+        for filename, data in files.items():
+            (workspace / filename).write_bytes(data)
+        if uid:
+            for path in [workspace, *workspace.iterdir()]:
+                os.chown(path, uid, uid)
+
+        user = _run("user_submission.py", workspace, TIMEOUT_USER, uid)
+        images = _images(workspace)
+        tests = _run("test_runner.py", workspace, TIMEOUT_TESTS, uid)
+
+        shutil.rmtree(workspace, ignore_errors=True)
+        _wipe_scratch()
+        line = json.dumps({"id": name, "user": user, "tests": tests, "images": images})
+        mac = hmac.new(key, line.encode("utf-8"), hashlib.sha256).hexdigest()
+        print(f"{mac} {line}", flush=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import Submission
+from .progress import forget_grade
+
+
+@receiver(post_delete, sender=Submission)
+def drop_submission_progress(sender, instance, **kwargs):
+    forget_grade(instance.user_id, instance.assignment_id)
@@ -1,16 +1,29 @@
 # tasks.py
 import base64
+import hashlib
+import hmac
 import json
 import os
+import queue
+import secrets
 import shutil
 import subprocess
 import tempfile
+import threading
+import time
+from datetime import timedelta
 from pathlib import Path
 
-from celery import shared_task, states
+from celery import group, shared_task, states
 from celery.exceptions import SoftTimeLimitExceeded
+from celery.utils import uuid
+from django.core.cache import cache
+from django.utils import timezone
 
+from assignments.assets import TEST_RUNNER, fetch_assets
+from assignments.models import Assignment, deferred_content
 from grader.models import Submission
+from grader.progress import record_grade, refresh_published_between
 
 SANDBOX_IMAGE = "python-course-platform-sandbox:3.12"
 
@@ -21,9 +34,22 @@ PIDS_LIMIT = "128"
 TMPFS_OPTS = "rw,nosuid,nodev,noexec,size=64m"
 TIMEOUT_USER = 10
 TIMEOUT_TESTS = 10
+TIMEOUT_RUN = 5  # "Run" button: student program only, on the fast queue
 MAX_IMAGE_SIZE = 2 * 1024 * 1024  # 2 MB
 MAX_IMAGE_COUNT = 3
 
+# Stop the test runner at the first failing test (streaming protocol only)
+FAIL_FAST = os.environ.get("GRADER_FAIL_FAST", "").lower() in ("1", "true", "yes")
+
+# Batch grading: submissions graded per sandbox session, and the script that
+# runs them inside the container (see sandbox_batch.py)
+BATCH_SIZE = 25
+BATCH_RUNNER = Path(__file__).with_name("sandbox_batch.py")
+
+# Deferred submissions claimed by a batch that never reported back (worker
+# killed, lost message, ...) are released and dispatched again after this long
+CLAIM_TIMEOUT = timedelta(seconds=int(os.environ.get("GRADER_CLAIM_TIMEOUT", "3600")))
+
 # Shared dir mapping:
 # - Inside Celery container: GRADER_HOST_DIR (default: /grader)
 # - On the host (Docker daemon filesystem): GRADER_BIND_DIR (default: /var/tmp/grader)
@@ -42,7 +68,7 @@ def _container_to_host_path(container_path: str) -> str:
     host_path = h_root / rel
     return str(host_path)
 
-def run_in_sandbox(args, host_workdir_container, rw_mount=False, timeout=8, env=None):
+def sandbox_command(args, host_workdir_container, rw_mount=False, env=None, name=None):
     host_mount = _container_to_host_path(host_workdir_container)
     mount_flag = f"{host_mount}:/work:{'rw' if rw_mount else 'ro'},Z"
 
@@ -51,8 +77,11 @@ def run_in_sandbox(args, host_workdir_container, rw_mount=False, timeout=8, env=
         for k, v in env.items():
             env_args += ["-e", f"{k}={v}"]
 
+    name_args = ["--name", name] if name else []
+
     cmd = [
         "docker", "run", "--rm",
+        *name_args,
         "--network", "none",
 #        "--cpus", CPU_LIMIT,
         "--memory", MEM_LIMIT,
@@ -68,8 +97,232 @@ def run_in_sandbox(args, host_workdir_container, rw_mount=False, timeout=8, env=
     ]
     print(f"[DEBUG] Host mount for sandbox: {host_mount} -> /work")
     print(f"[DEBUG] Running sandbox command: {' '.join(cmd)}")
+    return cmd
+
+def run_in_sandbox(args, host_workdir_container, rw_mount=False, timeout=8, env=None):
+    cmd = sandbox_command(args, host_workdir_container, rw_mount=rw_mount, env=env)
     return subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
 
+def stream_in_sandbox(args, host_workdir_container, on_line, rw_mount=False, timeout=8, env=None):
+    """
+    Like `run_in_sandbox`, but hands every stdout line to `on_line` as soon as it
+    is printed. `on_line` returns True to stop the run early. Output produced
+    before a timeout is kept.
+
+    Returns (stdout, stderr, exit_code, timed_out).
+    """
+    container_name = f"grader-{uuid()}"
+    cmd = sandbox_command(args, host_workdir_container, rw_mount=rw_mount, env=env, name=container_name)
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+    lines = queue.Queue()
+    stderr_chunks = []
+
+    def _pump_stdout():
+        for line in proc.stdout:
+            lines.put(line)
+        lines.put(None)
+
+    def _pump_stderr():
+        stderr_chunks.append(proc.stderr.read())
+
+    threading.Thread(target=_pump_stdout, daemon=True).start()
+    stderr_thread = threading.Thread(target=_pump_stderr, daemon=True)
+    stderr_thread.start()
+
+    deadline = time.monotonic() + timeout
+    stdout_lines = []
+    timed_out = stopped = False
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            timed_out = True
+            break
+        try:
+            line = lines.get(timeout=remaining)
+        except queue.Empty:
+            timed_out = True
+            break
+        if line is None:
+            break
+        stdout_lines.append(line)
+        if on_line(line):
+            stopped = True
+            break
+
+    if timed_out or stopped:
+        # Killing the docker client alone would leave the container running
+        subprocess.run(["docker", "kill", container_name], capture_output=True)
+        proc.kill()
+
+    exit_code = proc.wait()
+    stderr_thread.join(timeout=1)
+    return "".join(stdout_lines), "".join(stderr_chunks), exit_code, timed_out
+
+def copy_assignment_files(assignment, work_c: Path):
+    """Copy the assignment's data files (CSVs and TXTs) into a sandbox work dir."""
+    assignment_dir = Path(os.environ.get("LOCAL_PATH", "/app/python_course_repo")) / assignment.chapter.slug / assignment.slug
+
+    for file in assignment_dir.glob("*"):
+        if file.suffix in [".csv", ".txt"]:
+            shutil.copy(file, work_c / file.name)
+            print(f"[DEBUG] Copied file to sandbox: {file.name}")
+
+def stage_assignment_files(work_c: Path, assignment, asset_version: str = "", include_test_runner=True):
+    """
+    Put the files of `asset_version` (data files and test_runner.py) from the
+    asset store into a sandbox work dir and return True. Without a version, or
+    if the store fails, copy the data files from the working copy instead and
+    return False: the caller then writes the test runner itself.
+    """
+    if asset_version:
+        try:
+            exclude = () if include_test_runner else (TEST_RUNNER,)
+            names = fetch_assets(asset_version, work_c, exclude=exclude)
+            print(f"[DEBUG] Fetched assets {asset_version[:12]}: {', '.join(names)}")
+            return True
+        except Exception as e:
+            print(f"[DEBUG] Could not fetch assets {asset_version[:12]}: {e}")
+    copy_assignment_files(assignment, work_c)
+    return False
+
+# Test runner protocol
+#
+# Legacy: print a single JSON object at the end:
+#     {"score": 7, "total": 10, "output": "...", "errors": [...]}
+#
+# Streaming: print one JSON object per line while the tests run (flush after each):
+#     {"type": "plan", "total": 10}                                  (optional, first)
+#     {"type": "test", "name": "...", "passed": true, "score": 1, "total": 1, "output": "..."}
+#     {"type": "summary", "score": 7, "total": 10, "output": "..."}  (optional, last)
+# Tests reported before a timeout or crash still count; the plan's total keeps
+# the maximum score right even if later tests never ran. With GRADER_FAIL_FAST=1
+# in its environment the runner may stop after the first failing test.
+
+def parse_test_record(line: str):
+    """Return the streaming-protocol record on this stdout line, or None."""
+    line = line.strip()
+    if not line.startswith("{"):
+        return None
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    if isinstance(record, dict) and record.get("type") in ("plan", "test", "summary"):
+        return record
+    return None
+
+def grading_from_records(records: list, stderr: str = "", timed_out: bool = False) -> dict:
+    plan_total = None
+    summary = None
+    tests = []
+    for record in records:
+        if record["type"] == "plan":
+            plan_total = float(record.get("total", 0) or 0)
+        elif record["type"] == "test":
+            tests.append(record)
+        else:
+            summary = record
+
+    score = sum(float(t.get("score", 0) or 0) for t in tests)
+    total = sum(float(t.get("total", 0) or 0) for t in tests)
+    if plan_total is not None:
+        total = max(total, plan_total)
+
+    output_lines = []
+    for t in tests:
+        mark = "✔" if t.get("passed") else "✘"
+        text = str(t.get("output", "")).strip()
+        output_lines.append(f"{mark} {t.get('name', 'test')}" + (f": {text}" if text else ""))
+    output = "\n".join(output_lines)
+
+    errors = []
+    if timed_out:
+        errors.append(f"Timed out while running tests ({len(tests)} completed).")
+        print(f"[DEBUG] Test runner timed out, keeping {len(tests)} streamed results")
+    elif summary is not None:
+        score = float(summary.get("score", score) or 0)
+        total = float(summary.get("total", total) or 0)
+        output = str(summary.get("output", "")).strip() or output
+        if isinstance(summary.get("errors"), list):
+            errors = list(summary["errors"])
+
+    if stderr and (timed_out or not tests):
+        errors.append(stderr.strip())
+
+    return {"score": score, "total": total, "output": output, "errors": errors}
+
+def parse_test_output(stdout: str, stderr: str, timed_out: bool = False) -> dict:
+    """Turn the test runner's stdout (either protocol) into the grading dict."""
+    stdout_json = (stdout or "").strip()
+
+    records = [r for r in map(parse_test_record, stdout_json.splitlines()) if r]
+    if records:
+        return grading_from_records(records, stderr, timed_out=timed_out)
+
+    if timed_out:
+        print("[DEBUG] Test runner timed out")
+        return {"score": 0, "total": 0, "output": "", "errors": ["Timed out while running tests."]}
+
+    if not stdout_json:
+        print("[DEBUG] Test runner produced no stdout")
+        return {
+            "score": 0,
+            "total": 0,
+            "output": "",
+            "errors": ["Test runner produced no output", (stderr or "").strip()],
+        }
+
+    try:
+        data = json.loads(stdout_json)
+        print(f"[DEBUG] Parsed JSON: {data}")
+        score = float(data.get("score", 0))
+        total = float(data.get("total", 0)) or 0.0
+        output = str(data.get("output", "")).strip()
+        errors = list(data.get("errors", [])) if isinstance(data.get("errors", []), list) else []
+        return {"score": score, "total": total, "output": output, "errors": errors}
+    except Exception as parse_err:
+        print(f"[DEBUG] Failed to parse JSON: {parse_err}")
+        return {
+            "score": 0,
+            "total": 0,
+            "output": stdout_json,
+            "errors": [f"Failed to parse test JSON: {parse_err}", (stderr or "").strip()],
+        }
+
+def run_student_program(host_tmp_container, timeout):
+    """Phase A: run user_submission.py in the sandbox. Returns (stdout, stderr, exit_code)."""
+    print("[DEBUG] Phase A: Running user code")
+    try:
+        proc_user = run_in_sandbox(
+            ["user_submission.py"],
+            host_workdir_container=host_tmp_container,
+            rw_mount=True,
+            timeout=timeout,
+            env=None,
+        )
+    except subprocess.TimeoutExpired:
+        print("[DEBUG] User code timed out")
+        return "", "Timed out while running the student program.", -1
+
+    print(f"[DEBUG] User code exit={proc_user.returncode}")
+    print(f"[DEBUG] User stdout:\n{proc_user.stdout}")
+    print(f"[DEBUG] User stderr:\n{proc_user.stderr}")
+    return proc_user.stdout, proc_user.stderr, proc_user.returncode
+
+def build_payload(user_stdout, user_stderr, user_exit, grading, images):
+    score = float(grading.get("score", 0) or 0)
+    total = float(grading.get("total", 0) or 0)
+    grade_pct = round(100.0 * score / total, 2) if total > 0 else 0.0
+    print(f"[DEBUG] Computed grade_pct={grade_pct}")
+
+    return {
+        "status": "success",
+        "user": {"stdout": user_stdout, "stderr": user_stderr, "exit_code": user_exit},
+        "grading": {"grade_pct": grade_pct, **grading},
+        "images": images,
+    }
+
 def encode_images_for_ui(work_c: Path):
     supported_exts = {".png", ".jpg", ".jpeg", ".svg"}
     images = []
@@ -105,8 +358,38 @@ def encode_images_for_ui(work_c: Path):
 
     return images
 
+def store_result(submission_id: int, payload: dict, **fields):
+    """Write the grading part of a run payload (plus any extra `fields`) onto the submission row."""
+    grading = payload.get("grading", {})
+    updates = {
+        "run_status": payload.get("status", "success"),
+        "result_output": grading.get("output", ""),
+        **fields,
+    }
+
+    if grading.get("score") is not None:
+        updates["grade_score"] = grading["score"]
+
+    if grading.get("total") is not None:
+        updates["grade_total"] = grading["total"]
+
+    Submission.objects.filter(pk=submission_id).update(**updates)
+    record_grade(submission_id)
+
 @shared_task(bind=True, soft_time_limit=max(TIMEOUT_USER, TIMEOUT_TESTS) + 5)
-def run_user_code(self, submission_id: int, code: str, test_runner: str):
+def run_user_code(
+    self,
+    submission_id: int,
+    code: str,
+    test_runner: str = "",
+    fail_fast: bool | None = None,
+    asset_version: str = "",
+):
+    """
+    Grade one submission. With `asset_version` the test runner and data files
+    come from the asset store (exactly that version); `test_runner` is only
+    used for tasks queued without one.
+    """
     print(f"[DEBUG] Starting run_user_code for submission {submission_id}")
 
     try:
@@ -124,23 +407,23 @@ def run_user_code(self, submission_id: int, code: str, test_runner: str):
     work_c = Path(host_tmp_container)
     # work_h = Path(host_tmp_host)
 
-    # Locate assignment directory and copy additional files like CSVs and TXTs
+    # Test runner and additional files like CSVs and TXTs
+    from_store = False
     try:
-        sub = Submission.objects.select_related("assignment__chapter").get(pk=submission_id)
-        assignment_dir = Path(os.environ.get("LOCAL_PATH", "/app/python_course_repo")) / sub.assignment.chapter.slug / sub.assignment.slug
-
-        # Copy any .csv or .txt files in the assignment folder
-        for file in assignment_dir.glob("*"):
-            if file.suffix in [".csv", ".txt"]:
-                shutil.copy(file, work_c / file.name)
-                print(f"[DEBUG] Copied file to sandbox: {file.name}")
+        sub = (
+            Submission.objects.select_related("assignment__chapter")
+            .defer(*deferred_content("assignment__"))
+            .get(pk=submission_id)
+        )
+        from_store = stage_assignment_files(work_c, sub.assignment, asset_version)
     except Exception as e:
         print(f"[DEBUG] Could not copy CSV/TXT files to sandbox: {e}")
 
     user_file = work_c / "user_submission.py"
     tests_file = work_c / "test_runner.py"
     user_file.write_text(code, encoding="utf-8")
-    tests_file.write_text(test_runner, encoding="utf-8")
+    if not from_store:
+        tests_file.write_text(test_runner, encoding="utf-8")
     print("[DEBUG] Wrote user_submission.py and test_runner.py")
     try:
         print("[DEBUG] Container view of work dir contents:")
@@ -150,30 +433,7 @@ def run_user_code(self, submission_id: int, code: str, test_runner: str):
         print(f"[DEBUG] Could not list container work dir: {e}")
 
     # Phase A: run submitted code
-    print("[DEBUG] Phase A: Running user code")
-    try:
-        proc_user = run_in_sandbox(
-            ["user_submission.py"],
-            host_workdir_container=host_tmp_container,
-            rw_mount=True,
-            timeout=TIMEOUT_USER,
-            env=None,
-        )
-    except subprocess.TimeoutExpired:
-        print("[DEBUG] User code timed out")
-        proc_user = None
-
-    if proc_user is None:
-        user_stdout = ""
-        user_stderr = "Timed out while running the student program."
-        user_exit = -1
-    else:
-        print(f"[DEBUG] User code exit={proc_user.returncode}")
-        print(f"[DEBUG] User stdout:\n{proc_user.stdout}")
-        print(f"[DEBUG] User stderr:\n{proc_user.stderr}")
-        user_stdout = proc_user.stdout
-        user_stderr = proc_user.stderr
-        user_exit = proc_user.returncode
+    user_stdout, user_stderr, user_exit = run_student_program(host_tmp_container, TIMEOUT_USER)
     
     # === Capture image outputs ===
     image_files = encode_images_for_ui(work_c)
@@ -182,72 +442,350 @@ def run_user_code(self, submission_id: int, code: str, test_runner: str):
     # for img in image_files:
     #     print(f"[DEBUG] - {img['name']} ({len(img['data_uri'])} characters)")
 
-    # Phase B: run the test runner (prints JSON)
+    # Phase B: run the test runner (prints JSON, possibly one record per test)
     print("[DEBUG] Phase B: Running test runner")
-    grading = {"score": 0, "total": 0, "output": "", "errors": ["No results"]}
+    if fail_fast is None:
+        fail_fast = FAIL_FAST
+
+    def _on_test_line(line):
+        record = parse_test_record(line)
+        if record and record["type"] == "test":
+            print(f"[DEBUG] Test {record.get('name')}: passed={record.get('passed')}")
+            return fail_fast and not record.get("passed")
+        return False
+
+    tests_stdout, tests_stderr, tests_exit, tests_timed_out = stream_in_sandbox(
+        ["test_runner.py"],
+        host_workdir_container=host_tmp_container,
+        on_line=_on_test_line,
+        rw_mount=True,
+        timeout=TIMEOUT_TESTS,
+        env={"PYTHONUNBUFFERED": "1", "GRADER_FAIL_FAST": "1" if fail_fast else "0"},
+    )
+    print(f"[DEBUG] Test runner exit={tests_exit} timed_out={tests_timed_out}")
+    print(f"[DEBUG] Test runner stdout:\n{tests_stdout}")
+    print(f"[DEBUG] Test runner stderr:\n{tests_stderr}")
+
+    grading = parse_test_output(tests_stdout, tests_stderr, timed_out=tests_timed_out)
+
+    payload = build_payload(user_stdout, user_stderr, user_exit, grading, image_files)
+
+    # print(f"[DEBUG] Final payload: {payload}")
+    self.update_state(state=states.SUCCESS, meta=payload)
+
+    # Persist right away so nobody has to poll the result backend for it
+    # (deferred exam grades are written long before anyone looks at them).
+    store_result(submission_id, payload)
+
+    # Cleanup
     try:
-        proc_tests = run_in_sandbox(
-            ["test_runner.py"],
-            host_workdir_container=host_tmp_container,
-            rw_mount=True,
-            timeout=TIMEOUT_TESTS,
-            env=None,
-        )
-        print(f"[DEBUG] Test runner exit={proc_tests.returncode}")
-        print(f"[DEBUG] Test runner stdout:\n{proc_tests.stdout}")
-        print(f"[DEBUG] Test runner stderr:\n{proc_tests.stderr}")
+        shutil.rmtree(host_tmp_container, ignore_errors=True)
+        print(f"[DEBUG] Cleaned up temp dir (container path) {host_tmp_container}")
+    except Exception as e:
+        print(f"[DEBUG] Failed to cleanup temp dir: {e}")
 
-        stdout_json = (proc_tests.stdout or "").strip()
-        if stdout_json:
-            try:
-                data = json.loads(stdout_json)
-                print(f"[DEBUG] Parsed JSON: {data}")
-                score = float(data.get("score", 0))
-                total = float(data.get("total", 0)) or 0.0
-                output = str(data.get("output", "")).strip()
-                errors = list(data.get("errors", [])) if isinstance(data.get("errors", []), list) else []
-                grading = {"score": score, "total": total, "output": output, "errors": errors}
-            except Exception as parse_err:
-                print(f"[DEBUG] Failed to parse JSON: {parse_err}")
-                grading = {
-                    "score": 0,
-                    "total": 0,
-                    "output": stdout_json,
-                    "errors": [f"Failed to parse test JSON: {parse_err}", (proc_tests.stderr or "").strip()],
-                }
-        else:
-            print("[DEBUG] Test runner produced no stdout")
-            grading = {
-                "score": 0,
-                "total": 0,
-                "output": "",
-                "errors": ["Test runner produced no output", (proc_tests.stderr or "").strip()],
-            }
+    return payload
 
-    except subprocess.TimeoutExpired:
-        print("[DEBUG] Test runner timed out")
-        grading = {"score": 0, "total": 0, "output": "", "errors": ["Timed out while running tests."]}
+@shared_task(bind=True, soft_time_limit=TIMEOUT_RUN + 5)
+def run_only(self, assignment_id: int, code: str):
+    """
+    Quick "Run": execute only the student program (Phase A) and return its
+    output and images. Nothing is graded and no Submission is touched.
+    Routed to the "fast" queue (see CELERY_TASK_ROUTES).
+    """
+    print(f"[DEBUG] Starting run_only for assignment {assignment_id}")
 
-    score = float(grading.get("score", 0) or 0)
-    total = float(grading.get("total", 0) or 0)
-    grade_pct = round(100.0 * score / total, 2) if total > 0 else 0.0
-    print(f"[DEBUG] Computed grade_pct={grade_pct}")
+    Path(CONTAINER_SHARED_ROOT).mkdir(parents=True, exist_ok=True)
+    host_tmp_container = tempfile.mkdtemp(prefix=f"run_{assignment_id}_", dir=CONTAINER_SHARED_ROOT)
+    work_c = Path(host_tmp_container)
+
+    try:
+        assignment = Assignment.objects.select_related("chapter").listing().get(pk=assignment_id)
+        # Never the test runner: the student program could read it
+        stage_assignment_files(work_c, assignment, assignment.asset_version, include_test_runner=False)
+    except Exception as e:
+        print(f"[DEBUG] Could not copy CSV/TXT files to sandbox: {e}")
 
-    payload = {
+    (work_c / "user_submission.py").write_text(code, encoding="utf-8")
+
+    try:
+        user_stdout, user_stderr, user_exit = run_student_program(host_tmp_container, TIMEOUT_RUN)
+        images = encode_images_for_ui(work_c)
+    finally:
+        shutil.rmtree(host_tmp_container, ignore_errors=True)
+
+    return {
         "status": "success",
         "user": {"stdout": user_stdout, "stderr": user_stderr, "exit_code": user_exit},
-        "grading": {"grade_pct": grade_pct, **grading},
-        "images": image_files,
+        "images": images,
     }
 
-    # print(f"[DEBUG] Final payload: {payload}")
-    self.update_state(state=states.SUCCESS, meta=payload)
+def _batch_result_to_payload(result: dict) -> dict:
+    user = result.get("user", {})
+    tests = result.get("tests", {})
 
-    # Cleanup
+    if user.get("timed_out"):
+        user_stderr = "Timed out while running the student program."
+    else:
+        user_stderr = user.get("stderr", "")
+
+    grading = parse_test_output(
+        tests.get("stdout", ""), tests.get("stderr", ""), timed_out=tests.get("timed_out", False)
+    )
+
+    return build_payload(
+        "" if user.get("timed_out") else user.get("stdout", ""),
+        user_stderr,
+        user.get("exit_code", -1),
+        grading,
+        result.get("images", []),
+    )
+
+@shared_task(bind=True)
+def run_batch(self, submission_ids: list, test_runner: str | None = None):
+    """
+    Grade several submissions of the same assignment in one sandbox session.
+
+    The container runs sandbox_batch.py, which forks one limit-enforced child per
+    submission, under its own uid in its own workspace, and prints one signed
+    JSON line per finished submission. Results are stored as the lines arrive;
+    only correctly signed lines for the next expected submission are accepted. Submissions that did not
+    come back (container killed, crashed, ...) fall back to `run_user_code`.
+
+    Without an explicit `test_runner` the assignment's current asset version
+    is graded (see assignments.assets). If the batch fails as a whole, the
+    submissions it claimed are released for the next deferred-grading tick.
+    """
     try:
-        shutil.rmtree(host_tmp_container, ignore_errors=True)
-        print(f"[DEBUG] Cleaned up temp dir (container path) {host_tmp_container}")
+        return _grade_batch(self.request.id, submission_ids, test_runner)
+    except Exception:
+        Submission.objects.filter(
+            pk__in=submission_ids, run_status="pending", task_id=self.request.id
+        ).update(task_id=None, claimed_at=None)
+        raise
+
+def _grade_batch(batch_id, submission_ids: list, test_runner: str | None):
+    subs = {
+        sub.id: sub
+        for sub in Submission.objects.select_related("assignment__chapter").filter(pk__in=submission_ids).order_by("id")
+    }
+    if not subs:
+        return {}
+
+    assignments = {sub.assignment_id for sub in subs.values()}
+    if len(assignments) != 1:
+        raise ValueError("run_batch expects submissions of a single assignment")
+
+    assignment = next(iter(subs.values())).assignment
+    asset_version = ""
+    if test_runner is None:
+        asset_version = assignment.asset_version
+        test_runner = assignment.test_runner or ""
+
+    print(f"[DEBUG] Starting run_batch for {len(subs)} submissions of {assignment}")
+
+    Path(CONTAINER_SHARED_ROOT).mkdir(parents=True, exist_ok=True)
+    host_tmp_container = tempfile.mkdtemp(prefix=f"batch_{assignment.id}_", dir=CONTAINER_SHARED_ROOT)
+    root = Path(host_tmp_container)
+
+    # Data files are the same for every submission: copy them once, then per submission
+    shared = root / "_shared"
+    shared.mkdir()
+    from_store = False
+    try:
+        from_store = stage_assignment_files(shared, assignment, asset_version)
     except Exception as e:
-        print(f"[DEBUG] Failed to cleanup temp dir: {e}")
+        print(f"[DEBUG] Could not copy CSV/TXT files to sandbox: {e}")
+    if not from_store:
+        asset_version = ""
+
+    names = []
+    for sub in subs.values():
+        name = f"sub_{sub.id}"
+        work_c = root / name
+        shutil.copytree(shared, work_c)
+        (work_c / "user_submission.py").write_text(sub.answer_script, encoding="utf-8")
+        if not from_store:
+            (work_c / "test_runner.py").write_text(test_runner, encoding="utf-8")
+        names.append(name)
+    shutil.rmtree(shared, ignore_errors=True)
+    shutil.copy(BATCH_RUNNER, root / "batch_runner.py")
+
+    # Result lines are signed with a key only the runner reads (it removes the
+    # file before starting any student code), see sandbox_batch.py
+    key = secrets.token_bytes(32)
+    key_file = root / ".batch_key"
+    key_file.write_bytes(key)
+    key_file.chmod(0o600)
+
+    container_name = f"grader-batch-{batch_id or uuid()}"
+    cmd = sandbox_command(
+        ["batch_runner.py", *names],
+        host_workdir_container=host_tmp_container,
+        rw_mount=True,
+        env={
+            "GRADER_TIMEOUT_USER": TIMEOUT_USER,
+            "GRADER_TIMEOUT_TESTS": TIMEOUT_TESTS,
+            "GRADER_MAX_IMAGE_SIZE": MAX_IMAGE_SIZE,
+            "GRADER_MAX_IMAGE_COUNT": MAX_IMAGE_COUNT,
+            "GRADER_FAIL_FAST": "1" if FAIL_FAST else "0",
+            "PYTHONUNBUFFERED": "1",
+        },
+        name=container_name,
+    )
+
+    # Worst case every submission uses both of its time budgets, plus start-up
+    timeout = len(names) * (TIMEOUT_USER + TIMEOUT_TESTS) + 30
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+    def _kill():
+        print(f"[DEBUG] Batch {container_name} exceeded {timeout}s, killing it")
+        subprocess.run(["docker", "kill", container_name], capture_output=True)
+        proc.kill()
+
+    watchdog = threading.Timer(timeout, _kill)
+    watchdog.start()
+
+    grades = {}
+    # The runner reports submissions in the order it was given them
+    expected = iter(names)
+    next_name = next(expected, None)
+    try:
+        for line in proc.stdout:
+            mac, _, line = line.rstrip("\n").partition(" ")
+            signature = hmac.new(key, line.encode("utf-8"), hashlib.sha256).hexdigest()
+            if not hmac.compare_digest(mac, signature):
+                print("[DEBUG] Ignoring unsigned batch output line")
+                continue
+            try:
+                result = json.loads(line)
+            except ValueError as parse_err:
+                print(f"[DEBUG] Ignoring batch output line: {parse_err}")
+                continue
+            if result.get("id") != next_name:
+                print(f"[DEBUG] Ignoring out-of-order batch result {result.get('id')!r}")
+                continue
+            next_name = next(expected, None)
+            sub_id = int(result["id"].removeprefix("sub_"))
+
+            payload = _batch_result_to_payload(result)
+            # The batch has no per-submission Celery result, so the row itself is the result
+            store_result(sub_id, payload, task_id=None, claimed_at=None)
+            grades[sub_id] = payload["grading"]["grade_pct"]
+            print(f"[DEBUG] Batch graded submission {sub_id}: {grades[sub_id]}%")
+        proc.wait()
+    finally:
+        watchdog.cancel()
+        print(f"[DEBUG] Batch sandbox stderr:\n{proc.stderr.read()}")
+        shutil.rmtree(host_tmp_container, ignore_errors=True)
+
+    missing = [sub_id for sub_id in subs if sub_id not in grades]
+    for sub_id in missing:
+        sub = subs[sub_id]
+        async_result = run_user_code.delay(
+            sub_id, code=sub.answer_script, test_runner=test_runner, asset_version=asset_version
+        )
+        Submission.objects.filter(pk=sub_id).update(task_id=async_result.id, claimed_at=timezone.now())
+    if missing:
+        print(f"[DEBUG] Batch fell back to single runs for submissions {missing}")
+
+    return grades
+
+def dispatch_batches(submissions, test_runner: str | None = None, batch_size: int = BATCH_SIZE):
+    """
+    Split submissions into per-assignment chunks and enqueue one `run_batch` for
+    each chunk, all at once as a Celery group so they spread over every worker.
+
+    Every chunk first claims its unclaimed rows with the id its `run_batch` task
+    will run under, so an overlapping beat tick cannot enqueue a submission
+    twice and the UI polls a real task. Returns the number of claimed rows.
+    """
+    by_assignment = {}
+    for sub in submissions:
+        by_assignment.setdefault(sub.assignment_id, []).append(sub.id)
+
+    now = timezone.now()
+    jobs = []
+    claimed = 0
+    for ids in by_assignment.values():
+        for i in range(0, len(ids), batch_size):
+            batch_id = uuid()
+            chunk = Submission.objects.filter(pk__in=ids[i:i + batch_size])
+            chunk.filter(task_id__isnull=True).update(task_id=batch_id, claimed_at=now)
+            chunk_ids = list(chunk.filter(task_id=batch_id).order_by("id").values_list("id", flat=True))
+            if chunk_ids:
+                jobs.append(run_batch.s(chunk_ids, test_runner).set(task_id=batch_id))
+                claimed += len(chunk_ids)
+
+    if jobs:
+        group(jobs).apply_async()
+    return claimed
+
+def release_stale_claims():
+    """Release pending rows claimed longer than CLAIM_TIMEOUT ago (their batch is gone)."""
+    return Submission.objects.filter(
+        claimed_at__lt=timezone.now() - CLAIM_TIMEOUT, run_status="pending"
+    ).update(task_id=None, claimed_at=None)
+
+PUBLISHED_SINCE_KEY = "grader:progress:published-until"
+# Look-back of the first run (or after the cache was cleared)
+PUBLISHED_LOOKBACK = timedelta(hours=1)
+
+
+@shared_task
+def refresh_published_progress():
+    """
+    Chapter progress counts only published assignments: recompute the chapters
+    whose assignments were published since the previous run (beat, every minute).
+    """
+    now = timezone.now()
+    since = cache.get(PUBLISHED_SINCE_KEY) or now - PUBLISHED_LOOKBACK
+    refreshed = refresh_published_between(since, now)
+    cache.set(PUBLISHED_SINCE_KEY, now, timeout=None)
+    if refreshed:
+        print(f"[DEBUG] Refreshed progress of {refreshed} chapter(s) with newly published assignments")
+    return refreshed
+
+
+@shared_task
+def grade_deferred_submissions():
+    """
+    Grade the stored submissions of deferred-grading exams whose deadline has passed.
+
+    Each user has a single submission row per assignment, so whatever is stored at
+    the deadline is the final version. All of them are dispatched at once as a
+    group of batches so the whole worker pool grades them in parallel before
+    `publish_result_at`.
+    """
+    released = release_stale_claims()
+    if released:
+        print(f"[DEBUG] Released {released} stale deferred-grading claims")
+
+    now = timezone.now()
+    subs = list(
+        Submission.objects.filter(
+            assignment__defer_grading=True,
+            assignment__is_exam=True,
+            assignment__publish_until__lte=now,
+            run_status="pending",
+            task_id__isnull=True,
+        )
+        .select_related("assignment")
+        .defer(*deferred_content("assignment__"))
+        .order_by("assignment__publish_result_at", "id")
+    )
+    if not subs:
+        return 0
+
+    # Claimed per batch with its task id; run_batch clears the claim again
+    claimed = dispatch_batches(subs)
+
+    late = {
+        sub.assignment for sub in subs
+        if sub.assignment.publish_result_at and sub.assignment.publish_result_at <= now
+    }
+    for assignment in late:
+        print(f"[DEBUG] Deferred grading for {assignment} started after publish_result_at")
 
-    return payload
\ No newline at end of file
+    print(f"[DEBUG] Dispatched {claimed} deferred submissions for grading")
+    return claimed
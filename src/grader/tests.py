@@ -1,3 +1,432 @@
+import hashlib
+import hmac
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from assignments.models import Assignment, Chapter
+from grader.models import Submission, UserAssignmentProgress, UserChapterProgress
+from grader.precheck import precheck_submission
+from grader.progress import rebuild, refresh_chapters
+from grader.tasks import (
+    BATCH_RUNNER,
+    CLAIM_TIMEOUT,
+    grade_deferred_submissions,
+    parse_test_output,
+    refresh_published_progress,
+    run_batch,
+    store_result,
+)
+
+
+class DeferredGradingTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(email="student@uol.de", password="Student!123")
+        self.chapter = Chapter.objects.create(slug="exam", title="Exam", order=1)
+        now = timezone.now()
+        self.assignment = Assignment.objects.create(
+            chapter=self.chapter,
+            slug="exam-01",
+            title="Exam 01",
+            description="<p>Exam</p>",
+            test_runner="print('{}')",
+            publish_at=now - timedelta(hours=2),
+            publish_until=now + timedelta(hours=1),
+            publish_result_at=now + timedelta(days=1),
+            is_exam=True,
+            defer_grading=True,
+        )
+        self.url = reverse(
+            "assignments:assignment-detail",
+            kwargs={"chapter_slug": "exam", "assignment_slug": "exam-01"},
+        )
+
+    def test_submission_is_stored_without_grading_before_deadline(self):
+        self.client.force_login(self.user)
+        with mock.patch("assignments.views.run_user_code") as run_user_code:
+            with self.captureOnCommitCallbacks(execute=True):
+                resp = self.client.post(self.url, {"answer_script": "print(1)"})
+
+        self.assertRedirects(resp, self.url)
+        run_user_code.delay.assert_not_called()
+        sub = Submission.objects.get(user=self.user, assignment=self.assignment)
+        self.assertEqual(sub.run_status, "pending")
+        self.assertIsNone(sub.task_id)
+
+    def test_broken_submission_is_not_graded_before_release(self):
+        self.client.force_login(self.user)
+        with mock.patch("assignments.views.run_user_code"):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(self.url, {"answer_script": "print(1"})
+
+        sub = Submission.objects.get(user=self.user, assignment=self.assignment)
+        self.assertEqual(sub.run_status, "pending")
+        self.assertIsNone(sub.grade_score)
+
+    def test_batch_dispatches_final_submissions_once_after_deadline(self):
+        sub = Submission.objects.create(
+            user=self.user, assignment=self.assignment, answer_script="print(2)"
+        )
+
+        # Deadline not reached yet: nothing is graded
+        self.assertEqual(grade_deferred_submissions(), 0)
+
+        Assignment.objects.filter(pk=self.assignment.pk).update(
+            publish_until=timezone.now() - timedelta(minutes=1)
+        )
+        with mock.patch("grader.tasks.group") as group:
+            self.assertEqual(grade_deferred_submissions(), 1)
+            group.return_value.apply_async.assert_called_once()
+        (job,) = group.call_args.args[0]
+
+        # Claimed with the id of the batch task that grades it
+        sub.refresh_from_db()
+        self.assertEqual(sub.task_id, job.options["task_id"])
+        self.assertEqual(job.args[0], [sub.id])
+
+        # Already claimed rows are not dispatched again on the next tick
+        with mock.patch("grader.tasks.group"):
+            self.assertEqual(grade_deferred_submissions(), 0)
+
+    def claimed_submission(self):
+        Assignment.objects.filter(pk=self.assignment.pk).update(
+            publish_until=timezone.now() - timedelta(minutes=1)
+        )
+        sub = Submission.objects.create(
+            user=self.user, assignment=self.assignment, answer_script="print(2)"
+        )
+        with mock.patch("grader.tasks.group"):
+            grade_deferred_submissions()
+        sub.refresh_from_db()
+        return sub
+
+    def test_failed_batch_releases_its_claims(self):
+        sub = self.claimed_submission()
+        with mock.patch("grader.tasks._grade_batch", side_effect=RuntimeError("docker is down")):
+            result = run_batch.apply(args=([sub.id],), task_id=sub.task_id)
+        self.assertEqual(result.state, "FAILURE")
+
+        sub.refresh_from_db()
+        self.assertIsNone(sub.task_id)
+        self.assertIsNone(sub.claimed_at)
+        with mock.patch("grader.tasks.group"):
+            self.assertEqual(grade_deferred_submissions(), 1)
+
+    def test_stale_claims_are_dispatched_again(self):
+        sub = self.claimed_submission()
+        with mock.patch("grader.tasks.group"):
+            self.assertEqual(grade_deferred_submissions(), 0)
+
+        Submission.objects.filter(pk=sub.pk).update(
+            claimed_at=timezone.now() - CLAIM_TIMEOUT - timedelta(minutes=1)
+        )
+        with mock.patch("grader.tasks.group"):
+            self.assertEqual(grade_deferred_submissions(), 1)
+        self.assertNotEqual(Submission.objects.get(pk=sub.pk).task_id, sub.task_id)
+
+
+class RunOnlyTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email="runner@uol.de", password="Runner!123")
+        chapter = Chapter.objects.create(slug="basics", title="Basics", order=1)
+        self.assignment = Assignment.objects.create(
+            chapter=chapter,
+            slug="hello",
+            title="Hello",
+            description="<p>Hello</p>",
+            publish_at=timezone.now() - timedelta(days=1),
+        )
+        self.url = reverse(
+            "assignments:assignment-detail",
+            kwargs={"chapter_slug": "basics", "assignment_slug": "hello"},
+        )
+        self.client.force_login(self.user)
+
+    def test_run_does_not_create_or_grade_a_submission(self):
+        with mock.patch("assignments.views.run_only") as run_only:
+            run_only.delay.return_value.id = "run-123"
+            resp = self.client.post(self.url, {"action": "run", "answer_script": "print('hi')"})
+
+        self.assertEqual(resp.status_code, 200)
+        run_only.delay.assert_called_once_with(self.assignment.id, "print('hi')")
+        self.assertContains(resp, reverse("grader:run-status", args=["run-123"]))
+        self.assertFalse(Submission.objects.exists())
+
+    def test_run_status_only_serves_own_runs(self):
+        resp = self.client.get(reverse("grader:run-status", args=["someone-elses-run"]))
+        self.assertEqual(resp.status_code, 404)
+
+
+class PrecheckTests(TestCase):
+    def test_valid_code_is_queued(self):
+        self.assertIsNone(precheck_submission("import numpy as np\nprint(np.pi)", 10))
+
+    def test_too_deeply_nested_code_is_left_to_the_sandbox(self):
+        self.assertIsNone(precheck_submission("x=" + "+".join(["1"] * 200000), 10))
+        self.assertIsNone(precheck_submission("x=" + "-" * 100000 + "1", 10))
+
+    def test_rejections_are_graded_immediately(self):
+        for code, expected in [
+            ("   \n", "empty"),
+            ("print(1", "SyntaxError"),
+            ("return 1", "'return' outside function"),
+            ("from subprocess import run", "subprocess"),
+        ]:
+            payload = precheck_submission(code, 10)
+            self.assertIn(expected, payload["grading"]["output"])
+            self.assertEqual((payload["grading"]["score"], payload["grading"]["total"]), (0.0, 10.0))
+
+
+class TestOutputParsingTests(TestCase):
+    def test_legacy_single_json_object(self):
+        grading = parse_test_output('{"score": 3, "total": 4, "output": "ok"}', "")
+        self.assertEqual((grading["score"], grading["total"], grading["output"]), (3.0, 4.0, "ok"))
+
+    def test_streamed_results_survive_a_timeout(self):
+        lines = [{"type": "plan", "total": 10}] + [
+            {"type": "test", "name": f"t{i}", "passed": True, "score": 1, "total": 1}
+            for i in range(9)
+        ]
+        stdout = "\n".join(json.dumps(line) for line in lines) + "\nnoise from the student\n"
+
+        grading = parse_test_output(stdout, "", timed_out=True)
+
+        self.assertEqual((grading["score"], grading["total"]), (9.0, 10.0))
+        self.assertIn("9 completed", grading["errors"][0])
+
+
+# A Python that other uids can run, for the per-uid isolation test
+SHARED_PYTHON = "/usr/bin/python3"
+
+
+class SandboxBatchRunnerTests(TestCase):
+    """Runs the in-container batch script directly (no container needed)."""
+
+    KEY = b"batch-key"
+
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.scratch = Path(tempfile.mkdtemp())
+        self.scratch.chmod(0o1777)
+        for path in (self.root, self.scratch):
+            self.addCleanup(shutil.rmtree, path, ignore_errors=True)
+
+    def run_batch_script(self, submissions, runner, python=sys.executable, uid_base=0):
+        for name, code in submissions:
+            (self.root / name).mkdir()
+            (self.root / name / "user_submission.py").write_text(code)
+            (self.root / name / "test_runner.py").write_text(runner)
+        (self.root / ".batch_key").write_bytes(self.KEY)
+
+        proc = subprocess.run(
+            [python, str(BATCH_RUNNER), *(name for name, _ in submissions)],
+            cwd=self.root,
+            capture_output=True,
+            text=True,
+            env={
+                "GRADER_TIMEOUT_USER": "1",
+                "GRADER_TIMEOUT_TESTS": "5",
+                "GRADER_UID_BASE": str(uid_base),
+                "GRADER_SCRATCH_DIRS": str(self.scratch),
+            },
+            timeout=30,
+        )
+        results = []
+        for line in proc.stdout.splitlines():
+            mac, _, line = line.partition(" ")
+            self.assertEqual(mac, hmac.new(self.KEY, line.encode(), hashlib.sha256).hexdigest())
+            results.append(json.loads(line))
+        return results
+
+    def test_streams_one_result_per_submission(self):
+        runner = (
+            "import json, os\n"
+            "print(json.dumps({'score': len(os.listdir('.')), 'total': 10}))\n"
+        )
+        results = self.run_batch_script([("sub_1", "print('one')"), ("sub_2", "while True: pass")], runner)
+
+        self.assertEqual([r["id"] for r in results], ["sub_1", "sub_2"])
+        self.assertEqual(results[0]["user"]["stdout"], "one\n")
+        self.assertTrue(results[1]["user"]["timed_out"])
+        # Each submission only ever sees its own two files; the key is gone
+        self.assertEqual(json.loads(results[0]["tests"]["stdout"])["score"], 2)
+        self.assertEqual(sorted(p.name for p in self.root.iterdir()), ["_run"])
+
+    def test_large_address_space_reservations_are_allowed(self):
+        # numpy/OpenBLAS reserve much more virtual memory than they use; only
+        # resident memory is limited (by the container), as for single runs
+        reserve = (
+            "import mmap\n"
+            "arena = mmap.mmap(-1, 1 << 30)\n"
+            "print(len(arena))\n"
+        )
+        results = self.run_batch_script([("sub_1", reserve)], "print('{}')\n")
+        self.assertEqual(results[0]["user"]["stdout"], f"{1 << 30}\n")
+
+    @skipUnless(os.geteuid() == 0 and os.access(SHARED_PYTHON, os.X_OK), "needs root and a shared Python")
+    def test_submissions_cannot_reach_each_other(self):
+        # The first student leaves a daemon (own session, reparented) that keeps
+        # writing to the shared scratch dir; the second one looks for traces
+        daemon = (
+            "import os, time\n"
+            "print(os.getuid())\n"
+            "if os.fork() == 0:\n"
+            "    os.setsid()\n"
+            "    if os.fork() == 0:\n"
+            "        devnull = os.open(os.devnull, os.O_RDWR)\n"
+            "        for fd in (0, 1, 2):\n"
+            "            os.dup2(devnull, fd)\n"
+            f"        for i in range(200):\n"
+            f"            open(os.path.join({str(self.scratch)!r}, f'left-{{i}}'), 'w').close()\n"
+            "            time.sleep(0.05)\n"
+            "    os._exit(0)\n"
+        )
+        probe = (
+            "import json, os, time\n"
+            "time.sleep(0.5)\n"
+            f"print(json.dumps({{'score': len(os.listdir({str(self.scratch)!r})), 'total': 10}}))\n"
+        )
+        runner = (
+            "import json, os\n"
+            "print(json.dumps({'score': 1, 'total': 1}))\n"
+        )
+        results = self.run_batch_script(
+            [("sub_1", daemon), ("sub_2", probe)], runner, python=SHARED_PYTHON, uid_base=20000
+        )
+
+        uids = [int(results[0]["user"]["stdout"].split()[0])]
+        self.assertEqual(uids, [20000])
+        self.assertEqual(json.loads(results[1]["user"]["stdout"])["score"], 0)
+        self.assertEqual(list(self.scratch.iterdir()), [])
+
+
+class BatchResultTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(email="batch@uol.de", password="Batch!123")
+        other = get_user_model().objects.create_user(email="other@uol.de", password="Other!123")
+        chapter = Chapter.objects.create(slug="batch", title="Batch", order=1)
+        assignment = Assignment.objects.create(
+            chapter=chapter, slug="b", title="B", description="", publish_at=timezone.now()
+        )
+        self.subs = [
+            Submission.objects.create(user=u, assignment=assignment, answer_script="pass")
+            for u in (user, other)
+        ]
+        shared_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, shared_root, ignore_errors=True)
+        for name in ("CONTAINER_SHARED_ROOT", "HOST_SHARED_ROOT"):
+            patcher = mock.patch(f"grader.tasks.{name}", shared_root)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_only_signed_results_in_order_are_stored(self):
+        first, second = (f"sub_{sub.id}" for sub in self.subs)
+
+        def sandbox(cmd, **kwargs):
+            workdir = Path(cmd[cmd.index("-v") + 1].split(":")[0])
+            key = (workdir / ".batch_key").read_bytes()
+
+            def signed(result):
+                line = json.dumps(result)
+                return hmac.new(key, line.encode(), hashlib.sha256).hexdigest() + " " + line + "\n"
+
+            graded = {"tests": {"stdout": json.dumps({"score": 1, "total": 1})}}
+            forged = {"tests": {"stdout": json.dumps({"score": 9, "total": 1})}}
+            proc = mock.Mock()
+            proc.stdout = [
+                "0" * 64 + " " + json.dumps({"id": first, **forged}) + "\n",   # wrong key
+                signed({"id": second, **forged}),                               # out of order
+                signed({"id": first, **graded}),
+            ]
+            proc.stderr.read.return_value = ""
+            return proc
+
+        with mock.patch("grader.tasks.subprocess.Popen", side_effect=sandbox), \
+                mock.patch("grader.tasks.run_user_code") as run_user_code:
+            run_user_code.delay.return_value.id = "single-run"
+            grades = run_batch([sub.id for sub in self.subs], test_runner="")
+
+        self.assertEqual(grades, {self.subs[0].id: 100.0})
+        # The second submission never reported properly: graded on its own
+        run_user_code.delay.assert_called_once()
+        self.assertEqual(Submission.objects.get(pk=self.subs[1].pk).task_id, "single-run")
+
+
+class ProgressTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email="progress@uol.de", password="Progress!123")
+        self.chapter = Chapter.objects.create(slug="loops", title="Loops", order=1)
+        self.assignments = [
+            Assignment.objects.create(
+                chapter=self.chapter,
+                slug=f"loop-{i}",
+                title=f"Loop {i}",
+                description="",
+                points=10,
+                publish_at=timezone.now() - timedelta(days=1),
+            )
+            for i in range(2)
+        ]
+        self.subs = [
+            Submission.objects.create(user=self.user, assignment=a, answer_script="pass")
+            for a in self.assignments
+        ]
+
+    def chapter_row(self):
+        row = UserChapterProgress.objects.get(user=self.user, chapter=self.chapter)
+        return row.passed_count, row.points_achieved, row.points_available
+
+    def test_grade_writes_update_progress(self):
+        store_result(self.subs[0].pk, {"grading": {"score": 9, "total": 10}})
+        store_result(self.subs[1].pk, {"grading": {"score": 4, "total": 10}})
+        self.assertEqual(self.chapter_row(), (1, 13, 20))
+
+        # Regrading replaces the previous grade instead of adding to it
+        store_result(self.subs[1].pk, {"grading": {"score": 10, "total": 10}})
+        self.assertEqual(self.chapter_row(), (2, 19, 20))
+
+        # Archived assignments drop out once the sync refreshes the chapter
+        Assignment.objects.filter(pk=self.assignments[0].pk).update(status="deleted")
+        refresh_chapters([self.chapter.pk])
+        self.assertEqual(self.chapter_row(), (1, 10, 10))
+
+        self.subs[1].delete()
+        self.assertFalse(UserChapterProgress.objects.exists())
+
+    def test_totals_follow_a_later_publication(self):
+        cache.clear()
+        store_result(self.subs[0].pk, {"grading": {"score": 9, "total": 10}})
+        store_result(self.subs[1].pk, {"grading": {"score": 4, "total": 10}})
+
+        # The second assignment moves to the future, and the sync refreshes the chapter
+        publish_at = timezone.now() + timedelta(hours=1)
+        Assignment.objects.filter(pk=self.assignments[1].pk).update(publish_at=publish_at)
+        refresh_chapters([self.chapter.pk])
+        self.assertEqual(self.chapter_row(), (1, 9, 10))
+
+        self.assertEqual(refresh_published_progress(), 0)
+        later = publish_at + timedelta(minutes=1)
+        with mock.patch("django.utils.timezone.now", return_value=later):
+            self.assertEqual(refresh_published_progress(), 1)
+        self.assertEqual(self.chapter_row(), (1, 13, 20))
+
+    def test_rebuild_matches_incremental_updates(self):
+        store_result(self.subs[0].pk, {"grading": {"score": 8, "total": 10}})
+        incremental = self.chapter_row()
 
-# Create your tests here.
+        self.assertEqual(rebuild(), (2, 1))
+        self.assertEqual(self.chapter_row(), incremental)
+        self.assertEqual(UserAssignmentProgress.objects.filter(passed=True).count(), 1)
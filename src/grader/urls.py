@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import submission_status
+from .views import run_status, submission_status
 
 app_name = 'grader'
 
@@ -9,4 +9,9 @@ urlpatterns = [
       submission_status,
       name="submission-status",
     ),
+    path(
+      "runs/<str:task_id>/status/",
+      run_status,
+      name="run-status",
+    ),
 ]
\ No newline at end of file
@@ -1,9 +1,13 @@
 from celery.result import AsyncResult
 from django.contrib.auth.decorators import login_required
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils import timezone
 
+from assignments.models import deferred_content
+
 from .models import Submission
+from .tasks import store_result
 
 
 def _coalesce_payload(result_obj):
@@ -15,7 +19,11 @@ def _coalesce_payload(result_obj):
 
 @login_required
 def submission_status(request, submission_id):
-    sub = get_object_or_404(Submission, pk=submission_id, user=request.user)
+    sub = get_object_or_404(
+        Submission.objects.select_related("assignment").defer(*deferred_content("assignment__")),
+        pk=submission_id,
+        user=request.user,
+    )
 
     assignment = sub.assignment
     show_output = True
@@ -53,7 +61,9 @@ def submission_status(request, submission_id):
     context["total"] = sub.grade_total if sub.grade_total is not None else context.get("total", None)
 
     if not sub.task_id:
-        return render(request, "grader/_run_result.html", context)
+        # Graded without a Celery result of its own (batch grading): the row is final
+        status = 286 if sub.run_status != "pending" else 200
+        return render(request, "grader/_run_result.html", context, status=status)
 
     res = AsyncResult(sub.task_id)
     state = res.state
@@ -86,19 +96,8 @@ def submission_status(request, submission_id):
         context["test_output"] = grading.get("output", "")
         context["test_errors"] = grading.get("errors", [])
 
-        updates = {
-            "run_status": "error",
-            "test_output": context["test_output"],
-        }
-
-        if score is not None:
-            updates["grade_score"] = score
-
-        if total is not None:
-            updates["grade_total"] = total
+        store_result(sub.pk, {"status": "error", "grading": grading})
 
-        Submission.objects.filter(pk=sub.pk).update(**updates)
-        
         return render(request, "grader/_run_result.html", context, status=286)
 
     # Success
@@ -124,21 +123,38 @@ def submission_status(request, submission_id):
         context["test_errors"] = grading.get("errors", [])
         context["images"] = payload.get("images", [])
 
-        updates = {
-            "run_status": "success",
-            "result_output": context["test_output"],
-        }
-        
-        if score is not None:
-            updates["grade_score"] = score
-
-        if total is not None:
-            updates["grade_total"] = total
-
-        if updates:
-            Submission.objects.filter(pk=sub.pk).update(**updates)
+        store_result(sub.pk, {**payload, "status": "success"})
 
         return render(request, "grader/_run_result.html", context, status=286)
 
     # Fallback
     return render(request, "grader/_run_result.html", context)
+
+
+@login_required
+def run_status(request, task_id):
+    """Poll a quick "Run" (grader.tasks.run_only). Only program output, never grades."""
+    if task_id not in request.session.get("run_task_ids", []):
+        raise Http404("Unknown run.")
+
+    res = AsyncResult(task_id)
+    context = {"state": res.state, "status": "pending"}
+
+    if res.state == "FAILURE":
+        context["status"] = "error"
+        context["user_stderr"] = str(res.info)
+        return render(request, "grader/_run_output.html", context, status=286)
+
+    if res.state == "SUCCESS":
+        payload = _coalesce_payload(res.result)
+        user = payload.get("user", {})
+        context.update({
+            "status": payload.get("status", "success"),
+            "user_stdout": user.get("stdout", ""),
+            "user_stderr": user.get("stderr", ""),
+            "user_exit_code": user.get("exit_code"),
+            "images": payload.get("images", []),
+        })
+        return render(request, "grader/_run_output.html", context, status=286)
+
+    return render(request, "grader/_run_output.html", context)
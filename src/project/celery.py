@@ -30,9 +30,18 @@ def debug_task(self):
     print(f'Request: {self.request!r}')
 
 app.conf.beat_schedule = {
-    "sync-assignments-every-5-mins": {
+    # Safety net only: pushes trigger the sync through the webhook (assignments.views.sync_webhook)
+    "sync-assignments-hourly": {
         "task": "assignments.tasks.sync_assignments_repo",
-        "schedule": crontab(minute="*/5"),
+        "schedule": crontab(minute=0),
+    },
+    "grade-deferred-exams-every-min": {
+        "task": "grader.tasks.grade_deferred_submissions",
+        "schedule": crontab(minute="*/1"),
+    },
+    "refresh-published-progress-every-min": {
+        "task": "grader.tasks.refresh_published_progress",
+        "schedule": crontab(minute="*/1"),
     },
 }
 
@@ -23,6 +23,23 @@ LOG_DIR.mkdir(exist_ok=True)
 
 PYTHON_COURSE_REPO = PROJECT_DIR / "python_course_repo"
 
+# JupyterBook builds and the served release (see assignments/book_build.py).
+# The web and "book" worker containers must share it, so by default it lives
+# inside the course repository volume (untracked, git reset leaves it alone).
+BOOK_BUILD_ROOT = Path(os.getenv("BOOK_BUILD_ROOT", PYTHON_COURSE_REPO / ".book_build"))
+
+# Hand book files to the front server instead of streaming them from Django
+# (see assignments/book_serve.py): "nginx" (X-Accel-Redirect to an internal
+# location BOOK_ACCEL_PREFIX aliased to BOOK_BUILD_ROOT) or "apache"
+# (X-Sendfile, mod_xsendfile). Empty: Django sends the files itself.
+BOOK_SENDFILE = os.getenv("BOOK_SENDFILE", "")
+BOOK_ACCEL_PREFIX = os.getenv("BOOK_ACCEL_PREFIX", "/_book_build/")
+
+# Content-addressed test runners and data files (see assignments/assets.py).
+# The sync writes, graders read: same volume by default, or point the
+# "course_assets" storage below at shared storage.
+ASSET_STORE_ROOT = Path(os.getenv("ASSET_STORE_ROOT", PYTHON_COURSE_REPO / ".assets"))
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
@@ -203,6 +220,10 @@ STORAGES = {
     "staticfiles": {
         "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
     },
+    "course_assets": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+        "OPTIONS": {"location": ASSET_STORE_ROOT},
+    },
 }
 
 if 'test' in sys.argv:
@@ -211,6 +232,31 @@ if 'test' in sys.argv:
         'django.contrib.staticfiles.storage.StaticFilesStorage'
     )
 
+# Cache (published catalog, see assignments/catalog.py)
+# Web and Celery processes must share it so the sync can invalidate it:
+# set CACHE_URL (e.g. redis://redis:6379/2) everywhere except single-process setups.
+CACHE_URL = os.getenv("CACHE_URL")
+
+if CACHE_URL and 'test' not in sys.argv:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Push-triggered course sync (assignments.views.sync_webhook). The endpoint
+# is disabled while no secret is set; pushes within SYNC_WEBHOOK_DEBOUNCE
+# seconds share one sync.
+SYNC_WEBHOOK_SECRET = os.getenv("SYNC_WEBHOOK_SECRET", "")
+SYNC_WEBHOOK_DEBOUNCE = int(os.getenv("SYNC_WEBHOOK_DEBOUNCE", "30"))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -13,3 +13,14 @@ CELERY_RESULT_SERIALIZER = "json"
 
 # Set to your local time zone, or leave as UTC
 CELERY_TIMEZONE = "Europe/Berlin"
+
+
+# Quick "Run" executions go to their own queue so they never wait behind grading.
+# Start a dedicated worker for it with `-Q fast`.
+#
+# JupyterBook builds run on the "book" queue (`-Q book --concurrency 1`),
+# so a long build never holds up grading or the sync.
+CELERY_TASK_ROUTES = {
+    "grader.tasks.run_only": {"queue": "fast"},
+    "assignments.tasks.build_book": {"queue": "book"},
+}
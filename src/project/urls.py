@@ -16,21 +16,22 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include, re_path
-from django.views.static import serve
 from django.shortcuts import render
 from debug_toolbar.toolbar import debug_toolbar_urls
 from pathlib import Path
 from django.http import HttpResponseForbidden
-from site_data.models import HomepageContent
+from site_data.cache import get_homepage_content, get_version
+from site_data.page_cache import anonymous_page_cache
 from django.conf import settings
 from django.conf.urls.static import static
 from site_data.views import tinymce_image_upload
+from assignments.book_serve import serve_book
 
 PROJECT_DIR = Path(__file__).resolve().parent.parent.parent
-BOOK_PATH = PROJECT_DIR / "python_course_repo" / "book" / "_build" / "html"
 
+@anonymous_page_cache(lambda: get_version("site_data"), lambda: get_version("homepage_content"))
 def home_view(request):
-    homepage_content = HomepageContent.objects.first()
+    homepage_content = get_homepage_content()
     return render(request, "home.html", {
         "homepage_content": homepage_content
     })
@@ -53,8 +54,7 @@ urlpatterns = [
     path("", include("grader.urls", namespace='grader')),
     re_path(
         r"^book/(?P<path>.*)$",
-        serve,
-        {"document_root": str(BOOK_PATH)},
+        serve_book,
         name="jupyterbook"
     ),
 ] + debug_toolbar_urls() + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,68 @@
+"""
+Two-level cache for the SiteData and HomepageContent singletons.
+
+Every page renders SiteData (context processor) and the home page renders
+HomepageContent, but both only change when an admin edits them. Each process
+keeps the objects in memory, next to the version stamp they were loaded
+under. The stamp lives in the shared cache: a save/delete (see signals.py)
+writes a new one, and on their next request all workers see the new stamp
+and reload. They load from the shared cache first and fall back to one
+database query.
+"""
+import time
+
+from django.core.cache import cache
+
+from .models import HomepageContent, SiteData
+
+SINGLETONS = {
+    "site_data": SiteData,
+    "homepage_content": HomepageContent,
+}
+
+# Entries of old versions are simply left to expire
+SHARED_TTL = 60 * 60 * 24
+
+# name -> (version, object) of this process
+_local = {}
+
+
+def _version_key(name):
+    return f"site_data:{name}:version"
+
+
+def get_version(name):
+    """The current version stamp of `name` (changes on every save/delete)."""
+    return cache.get_or_set(_version_key(name), time.time_ns, timeout=None)
+
+
+def get_singleton(name):
+    """The (first) row of a SINGLETONS model, or None."""
+    version = get_version(name)
+    local = _local.get(name)
+    if local is not None and local[0] == version:
+        return local[1]
+
+    key = f"site_data:{name}:{version}"
+    # Wrapped in a tuple, so "no row" can be cached as well
+    cached = cache.get(key)
+    if cached is None:
+        cached = (SINGLETONS[name].objects.first(),)
+        cache.set(key, cached, timeout=SHARED_TTL)
+
+    _local[name] = (version, cached[0])
+    return cached[0]
+
+
+def get_site_data():
+    return get_singleton("site_data")
+
+
+def get_homepage_content():
+    return get_singleton("homepage_content")
+
+
+def invalidate(name):
+    """Make every process reload `name` on its next read."""
+    _local.pop(name, None)
+    cache.set(_version_key(name), time.time_ns(), timeout=None)
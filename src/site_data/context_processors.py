@@ -1,5 +1,5 @@
-from .models import SiteData
+from .cache import get_site_data
 
 
 def site_data(request):
-    return {"site_data": SiteData.objects.first()}
+    return {"site_data": get_site_data()}
@@ -0,0 +1,89 @@
+"""
+Full-page cache for anonymous visitors.
+
+`anonymous_page_cache(*versions)` stores the rendered page of a view in the
+shared cache, keyed on the full path and on version tokens returned by the
+`versions` callables (e.g. the catalog version, the SiteData stamp). A sync or
+an admin edit changes a token, so old pages are never served again and simply
+expire.
+
+Only requests without a session or messages cookie are served from the cache:
+those are the only ones guaranteed to see the same page (no user, no flash
+messages). Pages that set cookies or use a CSRF token are never stored. All
+responses get `Vary: Cookie` and an ETag, and conditional GETs are answered
+with 304.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+
+PAGE_CACHE_TTL = 60 * 10
+
+# django.contrib.messages.storage.cookie.CookieStorage.cookie_name
+MESSAGES_COOKIE = "messages"
+
+
+def _cacheable_request(request):
+    return (
+        request.method in ("GET", "HEAD")
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and MESSAGES_COOKIE not in request.COOKIES
+        and not request.user.is_authenticated
+    )
+
+
+def _cacheable_response(request, response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not request.META.get("CSRF_COOKIE_NEEDS_UPDATE")
+    )
+
+
+def _key(request, versions):
+    tokens = "|".join(str(version()) for version in versions)
+    digest = hashlib.md5(f"{request.get_full_path()}|{tokens}".encode()).hexdigest()
+    return f"page:{digest}"
+
+
+def anonymous_page_cache(*versions, timeout=PAGE_CACHE_TTL):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not _cacheable_request(request):
+                response = view(request, *args, **kwargs)
+                patch_vary_headers(response, ("Cookie",))
+                return response
+
+            key = _key(request, versions)
+            page = cache.get(key)
+            if page is None:
+                response = view(request, *args, **kwargs)
+                patch_vary_headers(response, ("Cookie",))
+                if not _cacheable_response(request, response):
+                    return response
+                page = {
+                    "content": response.content,
+                    "content_type": response["Content-Type"],
+                    "etag": f'"{hashlib.md5(response.content).hexdigest()}"',
+                }
+                cache.set(key, page, timeout)
+
+            response = HttpResponse(page["content"], content_type=page["content_type"])
+            response["ETag"] = page["etag"]
+            patch_vary_headers(response, ("Cookie",))
+            patch_cache_control(response, max_age=0, must_revalidate=True)
+            return get_conditional_response(request, etag=page["etag"], response=response)
+
+        return wrapper
+
+    return decorator
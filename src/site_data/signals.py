@@ -1,6 +1,8 @@
-from django.db.models.signals import post_migrate
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save
 from django.dispatch import receiver
 
+from .cache import invalidate
 from .models import HomepageContent, SiteData
 
 
@@ -14,4 +16,15 @@ def create_default_site_data(sender, **kwargs):
             title="Welcome to the Python Course",
             content="<p>Edit this homepage content using the admin panel.</p>",
             is_active=True
-        )
\ No newline at end of file
+        )
+
+
+@receiver([post_save, post_delete], sender=SiteData)
+def drop_cached_site_data(sender, **kwargs):
+    # After commit, so no worker can reload the old row under the new version
+    transaction.on_commit(lambda: invalidate("site_data"))
+
+
+@receiver([post_save, post_delete], sender=HomepageContent)
+def drop_cached_homepage_content(sender, **kwargs):
+    transaction.on_commit(lambda: invalidate("homepage_content"))
@@ -0,0 +1,78 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import cache as site_cache
+from .models import HomepageContent, SiteData
+
+
+class SingletonCacheTests(TestCase):
+    def setUp(self):
+        # post_migrate created both rows; start every test from an empty cache
+        cache.clear()
+        site_cache._local.clear()
+
+    def site_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(reverse("home"))
+        self.assertEqual(resp.status_code, 200)
+        return [q["sql"] for q in ctx.captured_queries if "site_data_" in q["sql"]]
+
+    def test_pages_render_without_singleton_queries(self):
+        self.assertEqual(len(self.site_queries()), 2)
+        self.assertEqual(self.site_queries(), [])
+
+    def test_save_refreshes_every_worker(self):
+        self.assertEqual(site_cache.get_site_data().site_name, SiteData._meta.get_field("site_name").default)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SiteData.objects.update_or_create(pk=SiteData.objects.first().pk, defaults={"site_name": "New term"})
+        self.assertEqual(site_cache.get_site_data().site_name, "New term")
+
+        # This worker keeps its object in memory; another worker saves and
+        # only bumps the shared version stamp
+        site_cache.get_homepage_content()
+        version, _ = site_cache._local["homepage_content"]
+        HomepageContent.objects.update(title="Updated elsewhere")
+        cache.set(site_cache._version_key("homepage_content"), version + 1, timeout=None)
+        self.assertEqual(site_cache.get_homepage_content().title, "Updated elsewhere")
+
+
+class AnonymousPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        site_cache._local.clear()
+        self.url = reverse("home")
+
+    def test_anonymous_pages_are_served_from_cache_with_etag(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first["Vary"], "Cookie")
+
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get(self.url)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(second.content, first.content)
+
+        not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=second["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_home_content_change_purges_the_page(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            content = HomepageContent.objects.first()
+            content.content = "<p>Semester starts Monday</p>"
+            content.save()
+        self.assertContains(self.client.get(self.url), "Semester starts Monday")
+
+    def test_requests_with_a_session_bypass_the_cache(self):
+        self.client.get(self.url)
+        # Changed without signals: only freshly rendered pages show it
+        HomepageContent.objects.update(content="<p>Fresh</p>")
+        site_cache._local.clear()
+        cache.delete(f"site_data:homepage_content:{site_cache.get_version('homepage_content')}")
+
+        self.assertNotContains(self.client.get(self.url), "Fresh")
+        self.client.cookies["sessionid"] = "anything"
+        self.assertContains(self.client.get(self.url), "Fresh")